@@ -1,22 +1,75 @@
+import os
+import time
+
 import streamlit as st
 from user_query import user_query
 from location_agent import agent
+from location_agent.notification_engine import get_notification_engine, synthetic_events
 import subprocess
 
+USERNAME = "rathish"
+# How long fetched records are reused before Firestore is read again.
+RECORDS_TTL_S = int(os.getenv("APP_RECORDS_TTL_S", "300"))
+
+
+@st.cache_resource
+def get_clients():
+    # Created once per server process and shared by every session and rerun.
+    return {"model": user_query.get_model(), "agent": agent.root_agent}
+
+
+@st.cache_resource
+def get_notifications():
+    # One background engine per server process; the sidebar only reads its store.
+    return get_notification_engine()
+
+
+@st.cache_data(ttl=RECORDS_TTL_S, show_spinner=False)
+def load_user_records(username):
+    return user_query.fetch_firestore_data(username)
+
+
+def get_user_records(username):
+    # Follow-up questions in a conversation reuse the snapshot already in the
+    # session instead of fetching the records again, until it is as old as
+    # the shared cache entry would be.
+    expired = time.time() - st.session_state.get("records_fetched_at", 0) >= RECORDS_TTL_S
+    if st.session_state.get("records_user") != username or expired:
+        st.session_state.records = load_user_records(username)
+        st.session_state.records_user = username
+        st.session_state.records_fetched_at = time.time()
+    return st.session_state.records
+
+
+def refresh_user_records(username):
+    # Clearing a single entry needs a newer Streamlit than requirements.txt
+    # guarantees, so every user's cached records are dropped.
+    load_user_records.clear()
+    st.session_state.pop("records_user", None)
+
 
 def handle_voice_input():
     st.info("🎤 Handling voice input...")
     # Add voice processing logic here
-    user_query.process_query("rathish", "voice")
+    answer = user_query.process_query(
+        USERNAME,
+        "voice",
+        data=get_user_records(USERNAME),
+        on_transcript=lambda text: st.session_state.messages.append({"role": "user", "content": text}),
+    )
+    if answer:
+        st.session_state.messages.append({"role": "assistant", "content": answer})
     st.success("Voice processed successfully!")
 
 def handle_chat_input(query):
     st.info(f"🧠 Handling chat input: '{query}'")
-    # Add query handling / LLM call here
-    return user_query.process_query("rathish", "text", query)
+    # Yields the answer in chunks so it can be rendered as it is generated
+    return user_query.process_query_stream(USERNAME, query, data=get_user_records(USERNAME))
 
 # Page config
 st.set_page_config(page_title="Tachyon-5", layout="wide")
+get_clients()
+st.session_state.setdefault("messages", [])
 
 # Title
 st.title("Tachyon-5")
@@ -25,18 +78,32 @@ st.title("Tachyon-5")
 with st.sidebar:
     # result = subprocess.run(['adk', 'run', './location_agent'], capture_output=True, text=True, check=True)
     st.header("Notifications")
-    notLi = [ "Probable purchase at Starbucks, HSR", "You've recently purchased clothes from Zudio, HSR. Wanna try again?",
-      "Mani's Dum Biryani seems to be your go to restraunt. Its nearby",
-      "Seems like you've visited Koramangala, but no bills?"
-    ]
-    for i in range(4):
+    engine = get_notifications()
+    notifications = engine.store.get(USERNAME, limit=10)
+    if not notifications:
+        st.caption("No notifications yet.")
+    for notification in notifications:
         with st.container():
-            st.write(f"🔔 {notLi[i]}")
+            st.write(f"🔔 {notification['message']}")
             st.divider()
+    if st.button("📍 Simulate location pings"):
+        for event in synthetic_events([USERNAME], 5, seed=int(time.time())):
+            engine.submit(event)
+        st.toast("Location pings queued; notifications appear on the next refresh.")
 
 # Main Chat-like Interface
 st.markdown("## Chat Interface")
 chat_history = st.container()
+with chat_history:
+    for message in st.session_state.messages:
+        st.chat_message(message["role"]).write(message["content"])
+
+if st.session_state.get("records_user") == USERNAME:
+    age_s = int(time.time() - st.session_state.records_fetched_at)
+    st.caption(f"Using {len(st.session_state.records)} records fetched {age_s}s ago.")
+    if st.button("🔄 Refresh records"):
+        refresh_user_records(USERNAME)
+        st.rerun()
 
 # Upload section
 st.markdown("### Upload a Bill Receipt")
@@ -70,8 +137,9 @@ if st.button("💬 Send Query"):
     if user_input.strip():
         with chat_history:
             st.chat_message("user").write(user_input)
-            response = handle_chat_input(user_input)
+            st.session_state.messages.append({"role": "user", "content": user_input})
+            response = st.chat_message("assistant").write_stream(handle_chat_input(user_input))
+            st.session_state.messages.append({"role": "assistant", "content": response})
             print("TRACE: ", response)
-            st.chat_message("assistant").write(response)
     else:
         st.warning("Please type something before sending.")
@@ -1,7 +1,29 @@
-from google.adk.agents import Agent, ParallelAgent, SequentialAgent
+import os
+from typing import AsyncGenerator
+
+from google.adk.agents import Agent, BaseAgent, ParallelAgent, SequentialAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from google.genai import types
 
 # from toolbox_core import ToolboxClient
-from .mongo_personal_probability_tool import calculate_user_location_probability
+from .decision_engine import decide_purchase, format_decision, parse_probability
+from .cohort_index import calculate_cohort_location_probability
+from .firestore_tool import (
+    get_firestore_document,
+    get_firestore_documents,
+    list_firestore_documents,
+)
+from .mongo_geo_tool import find_expenses_near
+from .mongo_personal_probability_tool import (
+    calculate_location_probabilities_batch,
+    calculate_user_location_probabilities,
+    calculate_user_location_probability,
+)
+from .personal_probability_model import score_personal_location_probability
+from .result_cache import build_result_cache
+
+result_cache = build_result_cache()
 
 firebase_reader_agent = Agent(
     name="firestore_reader_agent",
@@ -11,7 +33,11 @@ firebase_reader_agent = Agent(
     You are the absolute master at reading data from a firestore database.
     You will use whatever tool is available at your disposal to query the
     necessary documents off a firestore mongodb collection.
+    Prefer get_firestore_documents to fetch several known documents at once,
+    and list_firestore_documents with a filter and only the needed fields to
+    page through a user's history.
     """,
+    tools=[get_firestore_document, get_firestore_documents, list_firestore_documents],
 )
 
 personal_probability_agent = Agent(
@@ -31,10 +57,22 @@ personal_probability_agent = Agent(
     I will accept the (user_name) and (location) as inputs and find the
     correponding probability. For now I will use "siva" for name and "dmart, hsr" for location and I will
     not prompt user for input.
+    When there are several candidate locations I will score them all in one
+    call using calculate_user_location_probabilities.
+    When the latitude, longitude and time of the potential entry are known I
+    will use score_personal_location_probability, which weighs time of day,
+    day of week and distance to past purchases.
     You will return the probability and the list of entries you
     considered to arrive at this result.
+    End the answer with a line of the form "probability: <value between 0 and 1>".
     """,
-    tools=[calculate_user_location_probability],
+    output_key="personal_probability",
+    tools=[
+        calculate_user_location_probability,
+        calculate_user_location_probabilities,
+        calculate_location_probabilities_batch,
+        score_personal_location_probability,
+    ],
 )
 
 public_probability_agent = Agent(
@@ -54,7 +92,13 @@ public_probability_agent = Agent(
     criteria like age, gender, address, etc., 
     I will finally return the probability value and the list of users
     i took into consideration.
+    I will use find_expenses_near for the radius search, and
+    calculate_cohort_location_probability to find similar users by age,
+    gender and address and score their purchases near the location.
+    End the answer with a line of the form "probability: <value between 0 and 1>".
     """,
+    output_key="public_probability",
+    tools=[find_expenses_near, calculate_cohort_location_probability],
     sub_agents=[firebase_reader_agent],
 )
 
@@ -67,7 +111,44 @@ calculator_agent = ParallelAgent(
     sub_agents=[personal_probability_agent, public_probability_agent],
 )
 
-decision_agent = Agent(
+
+class NumericDecisionAgent(BaseAgent):
+    """
+    Makes the yes/no purchase decision with decision_engine instead of an LLM.
+
+    Reads the outputs the calculator agents left in session state, plus an
+    optional 'event_hour', and stores the result under 'purchase_decision'.
+    """
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        state = ctx.session.state
+        result = decide_purchase(
+            parse_probability(state.get("personal_probability")),
+            parse_probability(state.get("public_probability")),
+            hour=state.get("event_hour"),
+        )
+        yield Event(
+            author=self.name,
+            invocation_id=ctx.invocation_id,
+            branch=ctx.branch,
+            content=types.Content(
+                role="model", parts=[types.Part(text=format_decision(result))]
+            ),
+            actions=EventActions(state_delta={"purchase_decision": result}),
+        )
+
+
+numeric_decision_agent = NumericDecisionAgent(
+    name="numeric_decision_agent",
+    description="""
+    Weights the personal and public probabilities, applies a time-of-day
+    factor and compares the score against a threshold to say yes or no.
+    """,
+)
+
+llm_decision_agent = Agent(
     name="decsion_agent",
     description="""
     Accepts the respective probabilities from the previous agents
@@ -95,10 +176,24 @@ decision_agent = Agent(
     determine a threshold above which this qualifies as a potential purchase
     by the target user, decide if the result crosses the threshold and then
     say yes or no.
+
+    4. The numeric decision engine has already answered in the previous
+    message. I will explain that answer using the points above and only
+    disagree with it when the data clearly contradicts it.
     """,
     model="gemini-2.5-pro",
 )
 
+# DECISION_AGENT_MODE=llm opts into an LLM explanation after the numeric decision.
+if os.environ.get("DECISION_AGENT_MODE", "numeric") == "llm":
+    decision_agent = SequentialAgent(
+        name="explained_decision_agent",
+        description="Numeric purchase decision followed by an LLM explanation.",
+        sub_agents=[numeric_decision_agent, llm_decision_agent],
+    )
+else:
+    decision_agent = numeric_decision_agent
+
 aggregator_agent = SequentialAgent(
     name="purchase_probability_aggregator_agent",
     description="""
@@ -108,4 +203,62 @@ aggregator_agent = SequentialAgent(
     sub_agents=[calculator_agent, decision_agent],
 )
 
-root_agent = aggregator_agent
+
+class CachedAggregatorAgent(BaseAgent):
+    """
+    Memoizes the aggregator pipeline per (uid, location, time bucket).
+
+    The key is read from the 'uid', 'location' and optional 'event_time'
+    (epoch seconds) session state entries. Without them every run goes
+    through to the wrapped agent.
+    """
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        state = ctx.session.state
+        uid, location = state.get("uid"), state.get("location")
+        timestamp = state.get("event_time")
+        cacheable = bool(uid and location)
+
+        if cacheable:
+            cached = result_cache.get(uid, location, timestamp)
+            if cached is not None:
+                yield Event(
+                    author=self.name,
+                    invocation_id=ctx.invocation_id,
+                    branch=ctx.branch,
+                    content=types.Content(
+                        role="model", parts=[types.Part(text=cached["text"])]
+                    ),
+                    actions=EventActions(
+                        state_delta={"purchase_decision": cached["decision"]}
+                    ),
+                )
+                return
+
+        final_text = None
+        async for event in self.sub_agents[0].run_async(ctx):
+            if event.is_final_response() and event.content and event.content.parts:
+                final_text = "".join(part.text or "" for part in event.content.parts)
+            yield event
+
+        if cacheable and final_text:
+            result_cache.set(
+                uid,
+                location,
+                {"text": final_text, "decision": state.get("purchase_decision")},
+                timestamp,
+            )
+
+
+cached_aggregator_agent = CachedAggregatorAgent(
+    name="cached_purchase_probability_aggregator_agent",
+    description="""
+    Returns the purchase decision for a repeated (user, location) ping from
+    cache, and runs the aggregator agent otherwise.
+    """,
+    sub_agents=[aggregator_agent],
+)
+
+root_agent = cached_aggregator_agent
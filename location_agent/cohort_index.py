@@ -0,0 +1,487 @@
+import argparse
+import datetime
+import os
+import threading
+import time
+
+import numpy as np
+from pymongo.errors import ConnectionFailure, OperationFailure
+
+from .geo_migration import normalize_geo_info
+from .geohash import EARTH_RADIUS_M, cells_covering, encode_cells
+from .mongo_geo_tool import fetch_buyers_near
+from .mongo_pool import get_mongo_client
+
+# --- Configuration ---
+DATABASE_NAME = "bill-mgmt"
+USERS_COLLECTION_NAME = "users"
+INDEX_PATH = os.environ.get("COHORT_INDEX_PATH", "cohort_index.npz")
+# Users are partitioned by the geohash cell of their home location. 20 bits is
+# geohash precision 4, roughly 39km x 20km.
+PARTITION_BITS = 20
+# Feature scales: one unit of distance in feature space is this many years of
+# age difference, or this many metres between home locations.
+AGE_SCALE_YEARS = 10.0
+HOME_SCALE_M = 5000.0
+GENDER_WEIGHT = 1.0
+GENDERS = ("male", "female", "other")
+DEFAULT_COHORT_RADIUS_M = 25000.0
+# The process-wide index applies changed users at most this often.
+SYNC_INTERVAL_S = float(os.environ.get("COHORT_SYNC_INTERVAL_S", "300"))
+# -------------------
+
+# age, one-hot gender, home location as a scaled unit vector (x, y, z)
+FEATURE_DIM = 1 + len(GENDERS) + 3
+
+
+def _home_point(doc: dict):
+    point = doc.get("geoPoint") or normalize_geo_info(
+        doc.get("address") or doc.get("geoInfo")
+    ).get("geoPoint")
+    if not point:
+        return None
+    longitude, latitude = point["coordinates"]
+    return latitude, longitude
+
+
+def encode_user(doc: dict) -> np.ndarray:
+    """
+    Encodes a user document into a dense feature vector.
+
+    Squared Euclidean distance between two vectors approximates how
+    different two users are in age, gender and home location. Missing
+    attributes are encoded as zeros.
+    """
+    vector = np.zeros(FEATURE_DIM, dtype=np.float32)
+    if doc.get("age") is not None:
+        vector[0] = float(doc["age"]) / AGE_SCALE_YEARS
+    gender = str(doc.get("gender") or "").lower()
+    if gender in GENDERS:
+        vector[1 + GENDERS.index(gender)] = GENDER_WEIGHT
+    home = _home_point(doc)
+    if home:
+        lat, lon = np.radians(home)
+        xyz = np.array(
+            [np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)]
+        )
+        vector[1 + len(GENDERS) :] = xyz * (EARTH_RADIUS_M / HOME_SCALE_M)
+    return vector
+
+
+class CohortIndex:
+    """
+    A dense user-feature matrix with geohash partitions for cohort lookups.
+
+    Rows can be added or replaced incrementally; storage grows by doubling
+    so upserts are amortized O(1).
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.matrix = np.zeros((capacity, FEATURE_DIM), dtype=np.float32)
+        self.cells = np.full(capacity, -1, dtype=np.int64)
+        self.uids = []
+        self.rows = {}
+        self.partitions = {}
+        self.built_at = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.uids)
+
+    def _grow(self):
+        capacity = max(1, 2 * len(self.matrix))
+        for name in ("matrix", "cells"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            if name == "cells":
+                new.fill(-1)
+            new[: len(old)] = old
+            setattr(self, name, new)
+
+    def upsert(self, doc: dict):
+        """Adds a user document to the index, replacing any previous row for its uid."""
+        self.bulk_load([doc])
+
+    def bulk_load(self, docs):
+        """
+        Adds many user documents at once, encoding their partitions in one pass.
+
+        Users already in the index have their row replaced.
+        """
+        docs = list(docs)
+        if not docs:
+            return
+        vectors = np.stack([encode_user(doc) for doc in docs])
+        homes = [_home_point(doc) for doc in docs]
+        has_home = np.array([home is not None for home in homes])
+        lats = np.array([home[0] if home else 0.0 for home in homes])
+        lons = np.array([home[1] if home else 0.0 for home in homes])
+        cells = np.where(has_home, encode_cells(lats, lons, PARTITION_BITS), -1)
+
+        with self._lock:
+            for doc, vector, cell in zip(docs, vectors, cells):
+                uid = doc["uid"]
+                row = self.rows.get(uid)
+                if row is None:
+                    if len(self.uids) == len(self.matrix):
+                        self._grow()
+                    row = len(self.uids)
+                    self.uids.append(uid)
+                    self.rows[uid] = row
+                else:
+                    self.partitions.get(int(self.cells[row]), set()).discard(row)
+                self.matrix[row] = vector
+                self.cells[row] = cell
+                self.partitions.setdefault(int(cell), set()).add(row)
+
+    def remove(self, uids):
+        """
+        Drops users from the index.
+
+        The last row is moved into each freed row, so the matrix stays dense.
+        Unknown uids are ignored.
+
+        Returns:
+            The number of users removed.
+        """
+        removed = 0
+        with self._lock:
+            for uid in uids:
+                row = self.rows.pop(uid, None)
+                if row is None:
+                    continue
+                self.partitions.get(int(self.cells[row]), set()).discard(row)
+                last = len(self.uids) - 1
+                if row != last:
+                    moved = self.uids[last]
+                    cell = int(self.cells[last])
+                    self.partitions[cell].discard(last)
+                    self.partitions[cell].add(row)
+                    self.matrix[row] = self.matrix[last]
+                    self.cells[row] = cell
+                    self.uids[row] = moved
+                    self.rows[moved] = row
+                self.uids.pop()
+                self.cells[last] = -1
+                removed += 1
+        return removed
+
+    def _candidate_rows(self, latitude: float, longitude: float, radius_m: float):
+        if latitude is None or longitude is None:
+            return np.arange(len(self.uids))
+        rows = [
+            row
+            for cell in cells_covering(latitude, longitude, radius_m, PARTITION_BITS)
+            for row in self.partitions.get(int(cell), ())
+        ]
+        return np.fromiter(rows, dtype=np.int64, count=len(rows))
+
+    def query(
+        self,
+        uid: str,
+        k: int = 20,
+        latitude: float = None,
+        longitude: float = None,
+        radius_m: float = DEFAULT_COHORT_RADIUS_M,
+    ) -> list:
+        """
+        Returns the k users most similar to uid.
+
+        When a location is given, only users whose home partition lies
+        within radius_m of it are considered.
+
+        Returns:
+            A list of (uid, similarity) tuples, most similar first. The
+            similarity is between 0 and 1.
+        """
+        with self._lock:
+            row = self.rows.get(uid)
+            if row is None:
+                return []
+            target = self.matrix[row]
+            candidates = self._candidate_rows(latitude, longitude, radius_m)
+            candidates = candidates[candidates != row]
+            if len(candidates) == 0:
+                return []
+
+            # Differences are taken directly: expanding |a|^2 - 2a.b + |b|^2
+            # loses the small home-location distances to float32 cancellation.
+            diff = self.matrix[candidates] - target
+            distance2 = np.einsum("ij,ij->i", diff, diff)
+            k = min(k, len(candidates))
+            top = np.argpartition(distance2, k - 1)[:k]
+            top = top[np.argsort(distance2[top])]
+            return [
+                (self.uids[candidates[i]], float(np.exp(-0.5 * max(distance2[i], 0.0))))
+                for i in top
+            ]
+
+    def memory_report(self) -> dict:
+        """Returns the approximate memory footprint of the index in bytes."""
+        used = len(self.uids)
+        uid_bytes = sum(len(uid) + 49 for uid in self.uids)
+        partition_bytes = sum(64 + 32 * len(rows) for rows in self.partitions.values())
+        return {
+            "users": used,
+            "capacity": len(self.matrix),
+            "matrix_bytes": self.matrix.nbytes + self.cells.nbytes,
+            "matrix_bytes_used": used
+            * (self.matrix.itemsize * FEATURE_DIM + self.cells.itemsize),
+            "uid_bytes": uid_bytes,
+            "partition_bytes": partition_bytes,
+            "partitions": len(self.partitions),
+        }
+
+    def save(self, path: str = INDEX_PATH):
+        used = len(self.uids)
+        np.savez_compressed(
+            path,
+            matrix=self.matrix[:used],
+            cells=self.cells[:used],
+            # A fixed-width string array, so loading needs no pickle.
+            uids=np.array(self.uids, dtype=str),
+            built_at=np.array(self.built_at or time.time()),
+        )
+
+    @classmethod
+    def load(cls, path: str = INDEX_PATH) -> "CohortIndex":
+        data = np.load(path)
+        index = cls(capacity=max(1, len(data["uids"])))
+        used = len(data["uids"])
+        index.matrix[:used] = data["matrix"]
+        index.cells[:used] = data["cells"]
+        index.uids = [str(uid) for uid in data["uids"]]
+        index.rows = {uid: row for row, uid in enumerate(index.uids)}
+        for row, cell in enumerate(index.cells[:used]):
+            index.partitions.setdefault(int(cell), set()).add(row)
+        index.built_at = float(data["built_at"])
+        return index
+
+
+def _users_collection():
+    return get_mongo_client()[DATABASE_NAME][USERS_COLLECTION_NAME]
+
+
+_USER_PROJECTION = {"_id": 0, "uid": 1, "age": 1, "gender": 1, "address": 1, "geoPoint": 1}
+
+
+def build_index() -> CohortIndex:
+    """Builds a fresh index from every document in the users collection."""
+    started = time.time()
+    index = CohortIndex()
+    batch = []
+    for doc in _users_collection().find({"uid": {"$ne": None}}, _USER_PROJECTION):
+        batch.append(doc)
+        if len(batch) >= 10000:
+            index.bulk_load(batch)
+            batch = []
+    index.bulk_load(batch)
+    index.built_at = started
+    return index
+
+
+def sync_index(index: CohortIndex) -> int:
+    """
+    Applies users created, changed or deleted since the index was built.
+
+    Changed users are found by their 'updatedAt' timestamp. Deleted users
+    leave no trace to query by, so they are found by comparing the indexed
+    uids against the uids still in the users collection.
+
+    Returns:
+        The number of users upserted or removed.
+    """
+    started = time.time()
+    since = datetime.datetime.fromtimestamp(index.built_at or 0, datetime.timezone.utc)
+    users = _users_collection()
+    changed = list(users.find({"updatedAt": {"$gt": since}}, _USER_PROJECTION))
+    live = {doc["uid"] for doc in users.find({"uid": {"$ne": None}}, {"_id": 0, "uid": 1})}
+    index.bulk_load(changed)
+    removed = index.remove([uid for uid in list(index.uids) if uid not in live])
+    index.built_at = started
+    return len(changed) + removed
+
+
+_index = None
+_index_synced_at = 0.0
+_index_lock = threading.Lock()
+
+
+def get_cohort_index() -> CohortIndex:
+    """
+    Returns the process-wide index, loading it from INDEX_PATH or building
+    it, and applying changed users every SYNC_INTERVAL_S.
+
+    Periodic syncs run outside _index_lock: one caller claims the sync and
+    applies it through the index's own lock, while the others keep
+    querying the current index.
+    """
+    global _index, _index_synced_at
+    with _index_lock:
+        if _index is None:
+            try:
+                _index = CohortIndex.load(INDEX_PATH)
+            except FileNotFoundError:
+                _index = build_index()
+            except ValueError as e:
+                # Index files from before the uids were saved as strings need pickle.
+                print(f"Rebuilding the cohort index, {INDEX_PATH} cannot be loaded: {e}")
+                _index = build_index()
+            else:
+                sync_index(_index)
+            _index_synced_at = time.monotonic()
+            return _index
+        if time.monotonic() - _index_synced_at < SYNC_INTERVAL_S:
+            return _index
+        _index_synced_at = time.monotonic()
+        index = _index
+
+    try:
+        sync_index(index)
+    except (ConnectionFailure, OperationFailure) as e:
+        print(f"Cohort index sync failed, serving the previous index: {e}")
+    return index
+
+
+def cohort_location_probability(
+    uid: str, latitude: float, longitude: float, radius_m: float = 100.0, k: int = 50
+):
+    """
+    Returns (probability, cohort, nearby): the similarity-weighted share of
+    the k users most alike uid who bought within radius_m of the location,
+    the [(uid, similarity)] cohort and the set of nearby buyers. probability
+    is None when no similar users live in the area.
+    """
+    cohort = get_cohort_index().query(uid, k, latitude, longitude)
+    if not cohort:
+        return None, cohort, set()
+    # Only the cohort's own expenses are looked up, so a busy location cannot
+    # push cohort members past a result cap.
+    nearby = fetch_buyers_near(latitude, longitude, radius_m, [other for other, _ in cohort])
+    return _weighted_share(cohort, nearby), cohort, nearby
+
+
+def cohort_location_probabilities(points, radius_m: float = 100.0, k: int = 50) -> dict:
+    """
+    Batch form of cohort_location_probability for (uid, latitude, longitude)
+    points.
+
+    Points are grouped by location, and the nearby buyers among all the
+    cohorts at one location are fetched with a single query.
+
+    Returns:
+        A dict mapping each point to its probability, or None when no
+        similar users live in the area.
+    """
+    index = get_cohort_index()
+    by_location = {}
+    for uid, latitude, longitude in points:
+        by_location.setdefault((latitude, longitude), set()).add(uid)
+
+    probabilities = {}
+    for (latitude, longitude), uids in by_location.items():
+        cohorts = {uid: index.query(uid, k, latitude, longitude) for uid in uids}
+        members = sorted({other for cohort in cohorts.values() for other, _ in cohort})
+        nearby = fetch_buyers_near(latitude, longitude, radius_m, members) if members else set()
+        for uid, cohort in cohorts.items():
+            probabilities[(uid, latitude, longitude)] = (
+                _weighted_share(cohort, nearby) if cohort else None
+            )
+    return probabilities
+
+
+def _weighted_share(cohort, nearby) -> float:
+    total = sum(similarity for _, similarity in cohort)
+    matched = sum(similarity for other, similarity in cohort if other in nearby)
+    return matched / total if total else 0.0
+
+
+def calculate_cohort_location_probability(
+    uid: str, latitude: float, longitude: float, radius_m: float = 100.0, k: int = 50
+) -> str:
+    """
+    Calculates how likely users similar to this user are to buy near a location.
+
+    Finds the k users most alike in age, gender and home location among
+    those living in the area, then reports the similarity-weighted share
+    of them who have expense records within radius_m of the location.
+
+    Args:
+        uid: The unique identifier for the target user.
+        latitude: Latitude of the location in degrees.
+        longitude: Longitude of the location in degrees.
+        radius_m: Purchase search radius in metres. Defaults to 100.
+        k: Number of similar users to consider. Defaults to 50.
+
+    Returns:
+        A string with the probability and the users considered, or an error message.
+    """
+    try:
+        probability, cohort, nearby = cohort_location_probability(
+            uid, latitude, longitude, radius_m, k
+        )
+        if probability is None:
+            return f"No users similar to '{uid}' were found near ({latitude}, {longitude})."
+
+        considered = ", ".join(f"{other} ({similarity:.2f})" for other, similarity in cohort)
+        return (
+            f"{sum(1 for other, _ in cohort if other in nearby)} of {len(cohort)} users "
+            f"similar to '{uid}' bought within {radius_m}m of ({latitude}, {longitude}); "
+            f"the similarity-weighted probability is {probability * 100:.2f}%. "
+            f"Users considered: {considered}."
+        )
+
+    except (ConnectionFailure, OperationFailure, Exception) as e:
+        return f"An error occurred: {e}"
+
+
+def _synthetic_index(n: int) -> CohortIndex:
+    rng = np.random.default_rng(0)
+    index = CohortIndex(capacity=n)
+    lats = 12.97 + rng.normal(0, 0.5, n)
+    lons = 77.59 + rng.normal(0, 0.5, n)
+    ages = rng.integers(18, 70, n)
+    index.bulk_load(
+        {
+            "uid": f"user-{i}",
+            "age": int(ages[i]),
+            "gender": GENDERS[i % 3],
+            "geoPoint": {"type": "Point", "coordinates": [lons[i], lats[i]]},
+        }
+        for i in range(n)
+    )
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and inspect the user cohort index.")
+    parser.add_argument("command", choices=["rebuild", "sync", "report", "benchmark"])
+    parser.add_argument("--path", default=INDEX_PATH)
+    parser.add_argument("--users", type=int, default=100000, help="benchmark only")
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        index = build_index()
+        index.save(args.path)
+        print(f"Indexed {len(index)} users into {args.path}.")
+    elif args.command == "sync":
+        index = CohortIndex.load(args.path)
+        changed = sync_index(index)
+        index.save(args.path)
+        print(f"Applied {changed} changed users to {args.path}.")
+    elif args.command == "report":
+        print(CohortIndex.load(args.path).memory_report())
+    else:
+        index = _synthetic_index(args.users)
+        start = time.perf_counter()
+        for i in range(100):
+            index.query(f"user-{i}", 50, 12.97, 77.59)
+        elapsed = (time.perf_counter() - start) / 100
+        print(f"Average cohort lookup over {args.users} users: {elapsed * 1000:.3f} ms")
+        print(index.memory_report())
+
+
+# Run with:
+#   python -m location_agent.cohort_index rebuild|sync|report|benchmark
+if __name__ == "__main__":
+    main()
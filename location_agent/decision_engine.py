@@ -0,0 +1,145 @@
+import datetime
+import os
+import re
+from dataclasses import dataclass, field
+
+from .personal_probability_model import TIMEZONE
+
+# --- Configuration ---
+# Each hour band is (start_hour, end_hour, factor). The weighted probability is
+# multiplied by the factor of the band the event falls in, so purchases at odd
+# hours need stronger evidence to cross the threshold.
+DEFAULT_HOUR_FACTORS = (
+    (0, 6, 0.6),
+    (6, 10, 0.9),
+    (10, 22, 1.0),
+    (22, 24, 0.8),
+)
+# -------------------
+
+_LABELLED_RE = re.compile(r"probability\s*[:=]\s*([0-9]*\.?[0-9]+)\s*(%?)", re.I)
+_PERCENT_RE = re.compile(r"([0-9]*\.?[0-9]+)\s*%")
+
+
+@dataclass
+class DecisionConfig:
+    personal_weight: float = 0.7
+    public_weight: float = 0.3
+    threshold: float = 0.5
+    hour_factors: tuple = field(default=DEFAULT_HOUR_FACTORS)
+
+
+def load_decision_config() -> DecisionConfig:
+    """Builds a DecisionConfig from DECISION_* environment variables."""
+    return DecisionConfig(
+        personal_weight=float(os.environ.get("DECISION_PERSONAL_WEIGHT", "0.7")),
+        public_weight=float(os.environ.get("DECISION_PUBLIC_WEIGHT", "0.3")),
+        threshold=float(os.environ.get("DECISION_THRESHOLD", "0.5")),
+    )
+
+
+def parse_probability(value):
+    """
+    Extracts a probability between 0 and 1 from an agent's output.
+
+    Accepts numbers, a 'probability: <value>' line or the first percentage
+    in free text, e.g. '... is 66.67%.'
+
+    Returns:
+        The probability, or None if none could be found.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        probability = float(value)
+    else:
+        text = str(value)
+        match = _LABELLED_RE.search(text)
+        if match:
+            probability = float(match.group(1))
+            if match.group(2) or probability > 1:
+                probability /= 100
+        else:
+            match = _PERCENT_RE.search(text)
+            if not match:
+                return None
+            probability = float(match.group(1)) / 100
+    return min(max(probability, 0.0), 1.0)
+
+
+def time_of_day_factor(hour: int, config: DecisionConfig) -> float:
+    for start, end, factor in config.hour_factors:
+        if start <= hour < end:
+            return factor
+    return 1.0
+
+
+def decide_purchase(
+    personal_probability,
+    public_probability,
+    hour: int = None,
+    config: DecisionConfig = None,
+    event_time: float = None,
+) -> dict:
+    """
+    Decides whether a location ping indicates a purchase.
+
+    The personal and public probabilities are combined with the configured
+    weights (renormalized over whichever are available), scaled by the
+    time-of-day factor and compared against the threshold.
+
+    Args:
+        personal_probability: The user's own probability (0-1), or None.
+        public_probability: The similar-users probability (0-1), or None.
+        hour: Hour of day of the event. Defaults to the hour of event_time,
+            or of the current time, in personal_probability_model.TIMEZONE.
+        config: The weights and threshold. Defaults to load_decision_config().
+        event_time: Unix timestamp of the event, used when hour is None.
+
+    Returns:
+        A dict with the 'score', the boolean 'purchase', the 'decision'
+        ('yes' or 'no') and the inputs that produced them.
+    """
+    config = config or load_decision_config()
+    if hour is None:
+        if event_time is None:
+            hour = datetime.datetime.now(TIMEZONE).hour
+        else:
+            hour = datetime.datetime.fromtimestamp(event_time, TIMEZONE).hour
+
+    weighted, total_weight = 0.0, 0.0
+    for probability, weight in (
+        (personal_probability, config.personal_weight),
+        (public_probability, config.public_weight),
+    ):
+        if probability is not None:
+            weighted += probability * weight
+            total_weight += weight
+
+    factor = time_of_day_factor(hour, config)
+    score = (weighted / total_weight) * factor if total_weight else 0.0
+    purchase = total_weight > 0 and score >= config.threshold
+    return {
+        "score": score,
+        "purchase": purchase,
+        "decision": "yes" if purchase else "no",
+        "threshold": config.threshold,
+        "hour": hour,
+        "time_factor": factor,
+        "personal_probability": personal_probability,
+        "public_probability": public_probability,
+    }
+
+
+def format_decision(result: dict) -> str:
+    """Renders a decide_purchase result as a short human-readable answer."""
+    def _fmt(probability):
+        return "n/a" if probability is None else f"{probability * 100:.2f}%"
+
+    return (
+        f"{result['decision'].capitalize()}. Weighted score {result['score'] * 100:.2f}% "
+        f"against a threshold of {result['threshold'] * 100:.2f}% "
+        f"(personal {_fmt(result['personal_probability'])}, "
+        f"public {_fmt(result['public_probability'])}, "
+        f"time-of-day factor {result['time_factor']} at {result['hour']:02d}:00)."
+    )
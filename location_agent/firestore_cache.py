@@ -0,0 +1,181 @@
+import copy
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# --- Configuration ---
+DEFAULT_TTL_S = float(os.environ.get("FIRESTORE_CACHE_TTL_S", "300"))
+# Per-collection overrides of DEFAULT_TTL_S, in seconds.
+COLLECTION_TTLS = {
+    "item_metadata": 600.0,
+    "users": 3600.0,
+}
+MAX_ENTRIES = int(os.environ.get("FIRESTORE_CACHE_MAX_ENTRIES", "10000"))
+MAX_BYTES = int(os.environ.get("FIRESTORE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# -------------------
+
+
+def _estimate_size(value) -> int:
+    return len(json.dumps(value, default=str))
+
+
+class DocumentCache:
+    """
+    A bounded, thread-safe read-through cache of Firestore documents.
+
+    Documents are copied on the way in and out, so a caller that changes
+    the dict it got never changes what the next reader sees.
+
+    Entries expire after a per-collection TTL and the least recently used
+    entries are evicted once either the entry count or the estimated byte
+    size exceeds its limit. Listener callbacks may refresh or invalidate
+    entries from another thread.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = MAX_ENTRIES,
+        max_bytes: int = MAX_BYTES,
+        default_ttl: float = DEFAULT_TTL_S,
+        collection_ttls: dict = None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.collection_ttls = dict(
+            COLLECTION_TTLS if collection_ttls is None else collection_ttls
+        )
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+
+    def _ttl(self, collection: str) -> float:
+        return self.collection_ttls.get(collection, self.default_ttl)
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, collection: str, document_id: str):
+        """Returns a copy of the cached document dict, or None on a miss."""
+        key = (collection, document_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            value, _, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+        return copy.deepcopy(value)
+
+    def contains(self, collection: str, document_id: str) -> bool:
+        """Tells whether a document is cached, without touching the counters."""
+        with self._lock:
+            return (collection, document_id) in self._entries
+
+    def put(self, collection: str, document_id: str, value: dict):
+        """Caches a document dict, evicting least recently used entries if needed."""
+        key = (collection, document_id)
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        value = copy.deepcopy(value)
+        expires_at = time.monotonic() + self._ttl(collection)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires_at)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, collection: str, document_id: str = None):
+        """Drops one document, or every document of a collection when no ID is given."""
+        with self._lock:
+            if document_id is not None:
+                keys = [(collection, document_id)]
+            else:
+                keys = [key for key in self._entries if key[0] == collection]
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+                    self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """Returns the hit/miss/eviction counters and the current size."""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+
+# The process-wide cache used by firestore_tool.
+document_cache = DocumentCache()
+
+
+def watch_collection(
+    db, collection: str, cache: DocumentCache = None, filter_field: str = None, filter_value=None
+):
+    """
+    Keeps cached documents of a collection fresh with a snapshot listener.
+
+    Documents that are already cached are refreshed in place when they
+    change and dropped when they are removed, so readers never have to
+    re-read them. Documents that are not cached are left alone so the
+    listener does not flood the cache.
+
+    Args:
+        db: A firestore.Client.
+        collection: The collection to watch.
+        cache: The cache to maintain. Defaults to the shared document_cache.
+        filter_field: Optional field to narrow the watch with equality, e.g. 'uid'.
+        filter_value: The value filter_field must equal.
+
+    Returns:
+        The Watch handle; call its unsubscribe() method to stop listening.
+    """
+    # Imported here so the cache itself has no Firestore dependency.
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
+    from .firestore_tool import _snapshot_to_dict
+
+    cache = cache or document_cache
+    query = db.collection(collection)
+    if filter_field:
+        query = query.where(filter=FieldFilter(filter_field, "==", filter_value))
+
+    def on_snapshot(_, changes, __):
+        for change in changes:
+            doc = change.document
+            if change.type.name == "REMOVED":
+                cache.invalidate(collection, doc.id)
+            elif cache.contains(collection, doc.id):
+                cache.put(collection, doc.id, _snapshot_to_dict(doc))
+
+    return query.on_snapshot(on_snapshot)
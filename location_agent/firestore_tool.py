@@ -1,8 +1,105 @@
+import datetime
 import os
+import threading
 from google.cloud import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
 
+from .firestore_cache import document_cache
 
-def get_firestore_document(collection: str, document_id: str) -> str:
+# --- Configuration ---
+# Maximum number of document references sent in a single batched read.
+GET_ALL_BATCH_SIZE = 300
+MAX_PAGE_SIZE = 500
+# -------------------
+
+_lock = threading.Lock()
+_clients = {}
+
+
+def _reset_after_fork():
+    # gRPC channels cannot be shared with a forked child.
+    global _lock
+    _lock = threading.Lock()
+    _clients.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_firestore_client(project_id: str = None) -> firestore.Client:
+    """
+    Returns the process-wide Firestore client for a project.
+
+    The client is created on first use and reused by every tool call, so
+    credentials are loaded and the gRPC channel is opened only once.
+
+    Args:
+        project_id: The GCP project. Defaults to the GCP_PROJECT_ID
+            environment variable.
+
+    Returns:
+        The shared firestore.Client instance.
+    """
+    project_id = project_id or os.environ.get("GCP_PROJECT_ID")
+    if not project_id:
+        raise ValueError("The GCP_PROJECT_ID environment variable is not set.")
+
+    client = _clients.get(project_id)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(project_id)
+        if client is None:
+            print(f"Connecting to Firestore project '{project_id}'...")
+            client = firestore.Client(project=project_id)
+            _clients[project_id] = client
+    return client
+
+
+def _to_json_safe(value):
+    """Converts Firestore value types into plain JSON-serializable values."""
+    if isinstance(value, dict):
+        return {key: _to_json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json_safe(item) for item in value]
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, firestore.GeoPoint):
+        return {"latitude": value.latitude, "longitude": value.longitude}
+    if isinstance(value, firestore.DocumentReference):
+        return value.path
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    return value
+
+
+def _snapshot_to_dict(doc) -> dict:
+    return {"id": doc.id, "data": _to_json_safe(doc.to_dict() or {})}
+
+
+def _project(document: dict, fields: list[str]) -> dict:
+    """Applies a field projection to a cached full document."""
+    if not fields:
+        return document
+    data = {}
+    for field in fields:
+        source, target = document["data"], data
+        parts = field.split(".")
+        for part in parts[:-1]:
+            source = source.get(part) if isinstance(source, dict) else None
+            target = target.setdefault(part, {})
+        if isinstance(source, dict) and parts[-1] in source:
+            target[parts[-1]] = source[parts[-1]]
+    return {"id": document["id"], "data": data}
+
+
+def _error(message: str) -> dict:
+    return {"status": "error", "error_message": message}
+
+
+def get_firestore_document(collection: str, document_id: str) -> dict:
     """
     Fetches a single document from a specified Firestore collection.
 
@@ -11,29 +108,139 @@ def get_firestore_document(collection: str, document_id: str) -> str:
         document_id: The ID of the document to retrieve.
 
     Returns:
-        A string containing the document data as a dictionary, or an
-        error message if the document is not found or an error occurs.
+        A dict with status 'success' and the 'document' ({'id', 'data'}), or
+        status 'error' and an 'error_message' if the document is not found
+        or an error occurs.
     """
-    project_id = os.environ.get("GCP_PROJECT_ID")
-    if not project_id:
-        return "Error: The GCP_PROJECT_ID environment variable is not set."
+    cached = document_cache.get(collection, document_id)
+    if cached is not None:
+        return {"status": "success", "document": cached}
 
     try:
-        print(f"Connecting to Firestore project '{project_id}'...")
-        db = firestore.Client(project=project_id)
-        doc_ref = db.collection(collection).document(document_id)
-        doc = doc_ref.get()
+        db = get_firestore_client()
+        doc = db.collection(collection).document(document_id).get()
 
         if doc.exists:
-            return f"Success: Found document. Data: {doc.to_dict()}"
+            document = _snapshot_to_dict(doc)
+            document_cache.put(collection, document_id, document)
+            return {"status": "success", "document": document}
         else:
-            return f"Error: No document found with ID '{document_id}' in collection '{collection}'."
+            return _error(
+                f"No document found with ID '{document_id}' in collection '{collection}'."
+            )
+
+    except Exception as e:
+        return _error(f"An unexpected error occurred: {e}")
+
+
+def get_firestore_documents(
+    collection: str, document_ids: list[str], fields: list[str] = None
+) -> dict:
+    """
+    Fetches many documents from a Firestore collection in batched reads.
+
+    Args:
+        collection: The name of the Firestore collection.
+        document_ids: The IDs of the documents to retrieve.
+        fields: Optional list of field paths to return. Returns every field
+            when omitted.
+
+    Returns:
+        A dict with status 'success', the found 'documents' (each
+        {'id', 'data'}) in the requested order and the 'missing' IDs, or
+        status 'error' and an 'error_message'.
+    """
+    try:
+        found = {}
+        to_fetch = []
+        for document_id in dict.fromkeys(document_ids):
+            cached = document_cache.get(collection, document_id)
+            if cached is not None:
+                found[document_id] = _project(cached, fields)
+            else:
+                to_fetch.append(document_id)
+
+        if to_fetch:
+            db = get_firestore_client()
+            coll = db.collection(collection)
+            for start in range(0, len(to_fetch), GET_ALL_BATCH_SIZE):
+                refs = [
+                    coll.document(document_id)
+                    for document_id in to_fetch[start : start + GET_ALL_BATCH_SIZE]
+                ]
+                for doc in db.get_all(refs, field_paths=fields or None):
+                    if doc.exists:
+                        found[doc.id] = _snapshot_to_dict(doc)
+                        # Only full documents are cached; projections would be incomplete.
+                        if not fields:
+                            document_cache.put(collection, doc.id, found[doc.id])
+
+        return {
+            "status": "success",
+            "documents": [found[i] for i in document_ids if i in found],
+            "missing": [i for i in document_ids if i not in found],
+        }
 
     except Exception as e:
-        return f"An unexpected error occurred: {e}"
+        return _error(f"An unexpected error occurred: {e}")
+
 
+def list_firestore_documents(
+    collection: str,
+    fields: list[str] = None,
+    filter_field: str = None,
+    filter_value: str = None,
+    page_size: int = 100,
+    page_token: str = None,
+) -> dict:
+    """
+    Scans a Firestore collection one page at a time.
 
-# This allows you to run the file directly to test the tool
+    Args:
+        collection: The name of the Firestore collection.
+        fields: Optional list of field paths to return. Returns every field
+            when omitted.
+        filter_field: Optional field to filter on with equality, e.g. 'uid'.
+        filter_value: The value filter_field must equal.
+        page_size: Number of documents per page (at most 500).
+        page_token: The 'next_page_token' returned by the previous page.
+
+    Returns:
+        A dict with status 'success', the page of 'documents' (each
+        {'id', 'data'}) and a 'next_page_token' that is None on the last
+        page, or status 'error' and an 'error_message'.
+    """
+    try:
+        db = get_firestore_client()
+        coll = db.collection(collection)
+        page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+
+        query = coll
+        if filter_field:
+            query = query.where(filter=FieldFilter(filter_field, "==", filter_value))
+        if fields:
+            query = query.select(fields)
+        query = query.order_by("__name__").limit(page_size)
+        if page_token:
+            query = query.start_after({"__name__": coll.document(page_token)})
+
+        documents = [_snapshot_to_dict(doc) for doc in query.stream()]
+        if not fields:
+            for document in documents:
+                document_cache.put(collection, document["id"], document)
+        next_page_token = documents[-1]["id"] if len(documents) == page_size else None
+        return {
+            "status": "success",
+            "documents": documents,
+            "next_page_token": next_page_token,
+        }
+
+    except Exception as e:
+        return _error(f"An unexpected error occurred: {e}")
+
+
+# This allows you to run the file directly to test the tool:
+#   python -m location_agent.firestore_tool
 if __name__ == "__main__":
     # To test, set your project ID and run this script.
     # You will need to have a collection and document that matches.
@@ -51,4 +258,10 @@ if __name__ == "__main__":
         print(
             "Firestore tool script is ready. Please test with a real collection and document ID."
         )
-        get_firestore_document("item_metadata", "03415462-aef0-4758-90ea-48cc35d002bc")
+        print(
+            get_firestore_document(
+                "item_metadata", "03415462-aef0-4758-90ea-48cc35d002bc"
+            )
+        )
+        print(list_firestore_documents("item_metadata", fields=["uid"], page_size=5))
+        print(f"Cache stats: {document_cache.stats()}")
@@ -0,0 +1,220 @@
+import argparse
+import json
+import re
+from pymongo import ASCENDING, GEOSPHERE, UpdateOne
+
+from .mongo_pool import get_mongo_client
+
+# --- Configuration ---
+DATABASE_NAME = "bill-mgmt"
+COLLECTION_NAME = "item_metadata"
+# Bump this when the extraction rules change so the backfill re-processes documents.
+GEO_VERSION = 2
+# Longest place name, in words, that is looked up in 'geoKeys'.
+KEY_MAX_WORDS = 4
+OBSOLETE_INDEXES = ("uid_1_locality_1", "uid_1_city_1", "uid_1_pincode_1")
+BATCH_SIZE = 1000
+# -------------------
+
+_PINCODE_RE = re.compile(r"\b(\d{6})\b")
+_NON_WORD_RE = re.compile(r"[^\w\s]+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_location_text(text: str) -> str:
+    """Lower-cases a place name and strips punctuation and extra whitespace."""
+    text = _NON_WORD_RE.sub(" ", text or "").lower()
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def is_structured_location(location: str) -> bool:
+    """
+    Tells whether a query can be answered from the 'geoKeys' field.
+
+    Single place names of up to KEY_MAX_WORDS words ('Nellore', 'HSR
+    Layout') and pincodes ('128613') are looked up there. Free-form strings
+    such as 'dmart, hsr' are not, and must keep using the substring search
+    over 'geoInfo'.
+    """
+    if not location or "," in location:
+        return False
+    words = normalize_location_text(location).split()
+    return 0 < len(words) <= KEY_MAX_WORDS
+
+
+def location_keys(segments) -> list:
+    """
+    Returns every run of up to KEY_MAX_WORDS consecutive words of each
+    normalized address segment.
+
+    A place name is then found in the keys whenever its words appear
+    together in one segment of the address, wherever that segment sits:
+    'Indiranagar', 'Bengaluru', 'MG Road' and '560038' are all keys of
+    '12, MG Road, Indiranagar, Bengaluru, Karnataka 560038'.
+    """
+    keys = set()
+    for segment in segments:
+        words = normalize_location_text(segment).split()
+        for start in range(len(words)):
+            for end in range(start + 1, min(start + KEY_MAX_WORDS, len(words)) + 1):
+                keys.add(" ".join(words[start:end]))
+    return sorted(keys)
+
+
+def _first_number(data: dict, *keys):
+    for key in keys:
+        value = data.get(key)
+        if value is not None:
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+def normalize_geo_info(geo_info) -> dict:
+    """
+    Extracts structured location fields from a 'geoInfo' value.
+
+    Args:
+        geo_info: The JSON-encoded string (or already decoded dict) stored
+            in the 'geoInfo' field, e.g. '{"location": "20, Kala Circle,
+            Nellore-128613", "latitude": 14.44, "longitude": 79.98}'.
+
+    Returns:
+        A dict with the normalized 'locality', 'city' and 'pincode', the
+        'geoKeys' of the whole address (see location_keys) and a GeoJSON
+        'geoPoint' for whichever of them could be extracted. 'locality' and
+        'city' are guessed from the segments next to the pincode; queries
+        match against 'geoKeys' instead, which does not depend on the guess.
+    """
+    if isinstance(geo_info, str):
+        try:
+            geo_info = json.loads(geo_info)
+        except json.JSONDecodeError:
+            geo_info = {"location": geo_info}
+    if not isinstance(geo_info, dict):
+        return {}
+
+    fields = {}
+    address = geo_info.get("location") or geo_info.get("address") or ""
+    segments = [segment.strip() for segment in address.split(",") if segment.strip()]
+
+    keys = location_keys(segments)
+    if keys:
+        fields["geoKeys"] = keys
+
+    pincodes = _PINCODE_RE.findall(address)
+    if pincodes:
+        fields["pincode"] = pincodes[-1]
+
+    city_index = None
+    for i in range(len(segments) - 1, -1, -1):
+        if _PINCODE_RE.search(segments[i]):
+            city_index = i
+            break
+    if city_index is None and segments:
+        city_index = len(segments) - 1
+    if city_index is not None:
+        city = normalize_location_text(_PINCODE_RE.sub("", segments[city_index]))
+        if city:
+            fields["city"] = city
+        if city_index > 0:
+            locality = normalize_location_text(segments[city_index - 1])
+            if locality:
+                fields["locality"] = locality
+
+    coordinates = geo_info.get("geo_coordinates")
+    if not isinstance(coordinates, dict):
+        coordinates = geo_info
+    latitude = _first_number(coordinates, "latitude", "lat")
+    longitude = _first_number(coordinates, "longitude", "lng", "lon")
+    if latitude is not None and longitude is not None:
+        fields["geoPoint"] = {"type": "Point", "coordinates": [longitude, latitude]}
+
+    return fields
+
+
+def structured_geo_fields(geo_info) -> dict:
+    """Returns the fields to $set on a document, including the geoVersion marker."""
+    fields = normalize_geo_info(geo_info)
+    fields["geoVersion"] = GEO_VERSION
+    return fields
+
+
+def ensure_geo_indexes(collection=None):
+    """
+    Creates the lookup indexes and the 2dsphere index, and drops the
+    (uid, locality/city/pincode) indexes of GEO_VERSION 1, which no query
+    reads any more.
+    """
+    if collection is None:
+        collection = get_mongo_client()[DATABASE_NAME][COLLECTION_NAME]
+    existing = set(collection.index_information())
+    for name in OBSOLETE_INDEXES:
+        if name in existing:
+            collection.drop_index(name)
+    return [
+        # Per-user totals; a multikey index cannot cover them.
+        collection.create_index([("uid", ASCENDING)]),
+        collection.create_index([("uid", ASCENDING), ("geoKeys", ASCENDING)]),
+        collection.create_index([("geoPoint", GEOSPHERE)]),
+    ]
+
+
+def backfill_geo_fields(collection=None, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Writes structured geo fields onto documents that do not have them yet.
+
+    Documents already processed with the current GEO_VERSION are skipped,
+    so the backfill can be interrupted and re-run safely.
+
+    Returns:
+        The number of documents updated.
+    """
+    if collection is None:
+        collection = get_mongo_client()[DATABASE_NAME][COLLECTION_NAME]
+
+    cursor = collection.find(
+        {"geoVersion": {"$ne": GEO_VERSION}},
+        projection={"geoInfo": 1},
+        batch_size=batch_size,
+    )
+    updated = 0
+    operations = []
+    for doc in cursor:
+        operations.append(
+            UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": structured_geo_fields(doc.get("geoInfo"))},
+            )
+        )
+        if len(operations) >= batch_size:
+            updated += collection.bulk_write(operations, ordered=False).modified_count
+            operations = []
+            print(f"Backfilled {updated} documents...")
+    if operations:
+        updated += collection.bulk_write(operations, ordered=False).modified_count
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=f"Backfill structured geo fields on {DATABASE_NAME}.{COLLECTION_NAME}."
+    )
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument(
+        "--skip-indexes", action="store_true", help="Do not create the indexes."
+    )
+    args = parser.parse_args()
+
+    if not args.skip_indexes:
+        print(f"Created indexes: {ensure_geo_indexes()}")
+    updated = backfill_geo_fields(batch_size=args.batch_size)
+    print(f"Backfill complete. {updated} documents updated.")
+
+
+# Run the migration with:
+#   python -m location_agent.geo_migration
+if __name__ == "__main__":
+    main()
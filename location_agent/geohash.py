@@ -0,0 +1,83 @@
+import math
+
+import numpy as np
+
+# Geohash cells are addressed here by their integer bit pattern rather than the
+# base32 string, so whole arrays of points can be bucketed with NumPy. A cell id
+# with `bits` bits equals the geohash of precision bits / 5 read as an integer.
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+EARTH_RADIUS_M = 6371000.0
+
+
+def _split_bits(bits: int):
+    # Geohash interleaves starting with longitude, so longitude gets the extra bit.
+    return (bits + 1) // 2, bits // 2
+
+
+def _axis_indices(lats, lons, bits: int):
+    lon_bits, lat_bits = _split_bits(bits)
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    lat_idx = np.floor((lats + 90.0) / 180.0 * (1 << lat_bits)).astype(np.int64)
+    lon_idx = np.floor((lons + 180.0) / 360.0 * (1 << lon_bits)).astype(np.int64)
+    lat_idx = np.clip(lat_idx, 0, (1 << lat_bits) - 1)
+    lon_idx = np.mod(lon_idx, 1 << lon_bits)
+    return lat_idx, lon_idx
+
+
+def _interleave(lat_idx, lon_idx, bits: int):
+    lon_bits, lat_bits = _split_bits(bits)
+    cells = np.zeros(np.shape(lat_idx), dtype=np.int64)
+    for i in range(bits):
+        # Bit i counted from the most significant end of the cell id.
+        if i % 2 == 0:
+            bit = (lon_idx >> (lon_bits - 1 - i // 2)) & 1
+        else:
+            bit = (lat_idx >> (lat_bits - 1 - i // 2)) & 1
+        cells = (cells << 1) | bit
+    return cells
+
+
+def encode_cells(lats, lons, bits: int) -> np.ndarray:
+    """Returns the integer geohash cell id of every (lat, lon) pair."""
+    lat_idx, lon_idx = _axis_indices(lats, lons, bits)
+    return _interleave(lat_idx, lon_idx, bits)
+
+
+def encode(lat: float, lon: float, precision: int = 7) -> str:
+    """Returns the base32 geohash string of a point."""
+    cell = int(encode_cells([lat], [lon], precision * 5)[0])
+    return "".join(
+        _BASE32[(cell >> (5 * (precision - 1 - i))) & 31] for i in range(precision)
+    )
+
+
+def cell_size_m(bits: int, lat: float = 0.0):
+    """Returns the approximate (width, height) of a cell in metres at a latitude."""
+    lon_bits, lat_bits = _split_bits(bits)
+    height = math.pi * EARTH_RADIUS_M / (1 << lat_bits)
+    width = 2 * math.pi * EARTH_RADIUS_M * math.cos(math.radians(lat)) / (1 << lon_bits)
+    return width, height
+
+
+def cells_covering(lat: float, lon: float, radius_m: float, bits: int) -> np.ndarray:
+    """Returns the ids of every cell that intersects the bounding box of a circle."""
+    lon_bits, lat_bits = _split_bits(bits)
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    dlon = math.degrees(radius_m / (EARTH_RADIUS_M * max(math.cos(math.radians(lat)), 1e-6)))
+    (lat_lo, lat_hi), (lon_lo, lon_hi) = _axis_indices(
+        [lat - dlat, min(lat + dlat, 90.0)], [lon - dlon, lon + dlon], bits
+    )
+    lat_range = np.arange(lat_lo, lat_hi + 1)
+    if dlon >= 180.0:
+        lon_range = np.arange(1 << lon_bits)
+    elif lon_hi >= lon_lo:
+        lon_range = np.arange(lon_lo, lon_hi + 1)
+    else:
+        # The box crosses the antimeridian.
+        lon_range = np.concatenate(
+            [np.arange(lon_lo, 1 << lon_bits), np.arange(0, lon_hi + 1)]
+        )
+    lat_grid, lon_grid = np.meshgrid(lat_range, lon_range, indexing="ij")
+    return _interleave(lat_grid.ravel(), lon_grid.ravel(), bits)
@@ -0,0 +1,233 @@
+import argparse
+import datetime
+from collections import Counter
+from pymongo import ReplaceOne
+
+from .geo_migration import (
+    is_structured_location,
+    normalize_location_text,
+    structured_geo_fields,
+)
+from .mongo_geo_tool import record_local_expense
+from .mongo_pool import get_mongo_client
+
+# --- Configuration ---
+DATABASE_NAME = "bill-mgmt"
+COLLECTION_NAME = "item_metadata"
+HISTOGRAM_COLLECTION_NAME = "user_location_histogram"
+BATCH_SIZE = 1000
+# -------------------
+
+
+def _collections():
+    db = get_mongo_client()[DATABASE_NAME]
+    return db[COLLECTION_NAME], db[HISTOGRAM_COLLECTION_NAME]
+
+
+def histogram_keys(doc: dict) -> set:
+    """
+    Returns the normalized location keys an expense document counts towards.
+
+    These are the 'geoKeys' written by geo_migration when present,
+    otherwise they are extracted from the 'geoInfo' string on the fly.
+    """
+    keys = doc.get("geoKeys")
+    if not isinstance(keys, list):
+        keys = structured_geo_fields(doc.get("geoInfo")).get("geoKeys", [])
+    return set(keys)
+
+
+def record_expense(doc: dict):
+    """
+    Adds one expense document to its user's location histogram.
+
+    Args:
+        doc: The expense document. It must have a 'uid' and either the
+            structured geo fields or a 'geoInfo' string.
+    """
+    _, histograms = _collections()
+    increments = {"total": 1}
+    for key in histogram_keys(doc):
+        increments[f"counts.{key}"] = 1
+    histograms.update_one(
+        {"_id": doc["uid"]},
+        {
+            "$inc": increments,
+            "$set": {"updatedAt": datetime.datetime.now(datetime.timezone.utc)},
+        },
+        upsert=True,
+    )
+
+
+def ingest_expense(doc: dict):
+    """
+    Writes a new expense document and updates the histogram in the same call.
+
+    Ingestion paths should use this instead of inserting into
+    item_metadata directly so the histogram and the local spatial index
+    never fall behind.
+    """
+    expenses, _ = _collections()
+    doc = dict(doc)
+    doc.update(structured_geo_fields(doc.get("geoInfo")))
+    expenses.insert_one(doc)
+    record_expense(doc)
+    record_local_expense(doc)
+    return doc
+
+
+def lookup_probabilities(pairs) -> dict:
+    """
+    Answers (uid, location) pairs from the materialized histograms.
+
+    Pairs whose location is a structured key are answered for users whose
+    histogram is current, i.e. whose histogram total matches the number of
+    documents they have in item_metadata. Expenses written to item_metadata
+    by other paths leave the histogram stale; those users, users without a
+    histogram and free-form locations must fall back to counting item_metadata.
+
+    Args:
+        pairs: An iterable of (uid, location) tuples.
+
+    Returns:
+        A dict mapping the answered (uid, location) tuples to a probability
+        between 0 and 1.
+    """
+    wanted = {}
+    for uid, location in pairs:
+        if is_structured_location(location):
+            wanted[(uid, location)] = normalize_location_text(location)
+    if not wanted:
+        return {}
+
+    expenses, histograms = _collections()
+    uids = sorted({uid for uid, _ in wanted})
+    projection = {"total": 1}
+    projection.update({f"counts.{key}": 1 for key in set(wanted.values())})
+    docs = {doc["_id"]: doc for doc in histograms.find({"_id": {"$in": uids}}, projection)}
+    if not docs:
+        return {}
+
+    live_totals = {
+        row["_id"]: row["total"]
+        for row in expenses.aggregate(
+            [
+                {"$match": {"uid": {"$in": list(docs)}}},
+                {"$group": {"_id": "$uid", "total": {"$sum": 1}}},
+            ]
+        )
+    }
+
+    probabilities = {}
+    for (uid, location), key in wanted.items():
+        doc = docs.get(uid)
+        if doc and doc.get("total") and doc["total"] == live_totals.get(uid):
+            probabilities[(uid, location)] = doc.get("counts", {}).get(key, 0) / doc["total"]
+    return probabilities
+
+
+def _compute_histograms(uids=None):
+    expenses, _ = _collections()
+    query = {"uid": {"$in": list(uids)}} if uids else {"uid": {"$ne": None}}
+    projection = {"uid": 1, "geoInfo": 1, "geoKeys": 1}
+    cursor = expenses.find(query, projection, batch_size=BATCH_SIZE).sort("uid", 1)
+
+    current_uid, total, counts = None, 0, Counter()
+    for doc in cursor:
+        if doc.get("uid") != current_uid:
+            if current_uid is not None:
+                yield current_uid, total, counts
+            current_uid, total, counts = doc.get("uid"), 0, Counter()
+        total += 1
+        counts.update(histogram_keys(doc))
+    if current_uid is not None:
+        yield current_uid, total, counts
+
+
+def rebuild_histograms(uids=None) -> int:
+    """
+    Recomputes histograms from item_metadata, e.g. after a backfill.
+
+    Args:
+        uids: Restrict the rebuild to these users. Rebuilds every user when omitted.
+
+    Returns:
+        The number of histograms written.
+    """
+    _, histograms = _collections()
+    now = datetime.datetime.now(datetime.timezone.utc)
+    written = 0
+    operations = []
+    for uid, total, counts in _compute_histograms(uids):
+        operations.append(
+            ReplaceOne(
+                {"_id": uid},
+                {"total": total, "counts": dict(counts), "updatedAt": now},
+                upsert=True,
+            )
+        )
+        if len(operations) >= BATCH_SIZE:
+            histograms.bulk_write(operations, ordered=False)
+            written += len(operations)
+            operations = []
+            print(f"Rebuilt {written} histograms...")
+    if operations:
+        histograms.bulk_write(operations, ordered=False)
+        written += len(operations)
+    return written
+
+
+def check_histograms(uids=None) -> list:
+    """
+    Compares stored histograms against a fresh count of item_metadata.
+
+    Args:
+        uids: Restrict the check to these users. Checks every user when omitted.
+
+    Returns:
+        A list of dicts describing each user whose histogram is missing or
+        differs from the recomputed one.
+    """
+    _, histograms = _collections()
+    mismatches = []
+    for uid, total, counts in _compute_histograms(uids):
+        stored = histograms.find_one({"_id": uid}) or {}
+        if stored.get("total") != total or stored.get("counts", {}) != dict(counts):
+            mismatches.append(
+                {
+                    "uid": uid,
+                    "expected_total": total,
+                    "stored_total": stored.get("total"),
+                    "expected_counts": dict(counts),
+                    "stored_counts": stored.get("counts"),
+                }
+            )
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=f"Maintain {DATABASE_NAME}.{HISTOGRAM_COLLECTION_NAME}."
+    )
+    parser.add_argument("command", choices=["rebuild", "check"])
+    parser.add_argument(
+        "--uid", action="append", help="Limit to this user. May be repeated."
+    )
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        written = rebuild_histograms(args.uid)
+        print(f"Rebuild complete. {written} histograms written.")
+    else:
+        mismatches = check_histograms(args.uid)
+        for mismatch in mismatches:
+            print(f"Mismatch: {mismatch}")
+        print(f"Check complete. {len(mismatches)} inconsistent histograms.")
+        raise SystemExit(1 if mismatches else 0)
+
+
+# Run with:
+#   python -m location_agent.location_histogram rebuild
+#   python -m location_agent.location_histogram check --uid <uid>
+if __name__ == "__main__":
+    main()
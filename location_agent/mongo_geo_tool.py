@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+from pymongo.errors import ConnectionFailure, OperationFailure
+
+from .mongo_pool import get_mongo_client
+
+# --- Configuration ---
+DATABASE_NAME = "bill-mgmt"
+COLLECTION_NAME = "item_metadata"
+EARTH_RADIUS_M = 6378100.0
+# 'local' answers radius queries from an in-process spatial index loaded from
+# item_metadata, instead of a 2dsphere query per call.
+SPATIAL_INDEX_MODE = os.environ.get("SPATIAL_INDEX_MODE", "mongo")
+# Expenses ingested in this process are inserted into the local index right
+# away; the index is reloaded this often to pick up writes from other processes.
+LOCAL_INDEX_TTL_S = float(os.environ.get("SPATIAL_INDEX_TTL_S", "600"))
+# -------------------
+
+_local_index = None
+_local_index_loaded_at = 0.0
+_local_index_lock = threading.Lock()
+# Held by the one thread scanning item_metadata for a new index. Expenses
+# recorded during the scan are kept in _local_index_pending and replayed into
+# the new index when it is swapped in.
+_local_index_reload_lock = threading.Lock()
+_local_index_pending = None
+
+
+def get_local_spatial_index():
+    """
+    Returns the process-wide spatial index of expense records keyed by uid.
+
+    A stale index is rebuilt outside _local_index_lock; other callers keep
+    the current index until the new one is swapped in.
+    """
+    global _local_index, _local_index_loaded_at, _local_index_pending
+    with _local_index_lock:
+        index = _local_index
+        if index is not None and time.monotonic() - _local_index_loaded_at < LOCAL_INDEX_TTL_S:
+            return index
+
+    # Only the first load waits for a reload already in progress.
+    if not _local_index_reload_lock.acquire(blocking=index is None):
+        return index
+    try:
+        with _local_index_lock:
+            if _local_index is not index:
+                return _local_index
+            _local_index_pending = []
+
+        from .spatial_index import GeohashGridIndex
+
+        try:
+            fresh = GeohashGridIndex.from_mongo(id_field="uid")
+        except BaseException:
+            with _local_index_lock:
+                _local_index_pending = None
+            raise
+        with _local_index_lock:
+            for uid, latitude, longitude in _local_index_pending:
+                fresh.insert(uid, latitude, longitude)
+            _local_index_pending = None
+            _local_index = fresh
+            _local_index_loaded_at = time.monotonic()
+        return fresh
+    finally:
+        _local_index_reload_lock.release()
+
+
+def record_local_expense(doc: dict):
+    """
+    Adds a newly written expense to the local spatial index, if it is loaded.
+
+    Called by the ingestion path so radius queries see the expense without
+    waiting for the next reload.
+    """
+    point = doc.get("geoPoint")
+    if not point or not doc.get("uid"):
+        return
+    longitude, latitude = point["coordinates"]
+    with _local_index_lock:
+        index = _local_index
+        if _local_index_pending is not None:
+            _local_index_pending.append((str(doc["uid"]), latitude, longitude))
+    if index is not None:
+        index.insert(str(doc["uid"]), latitude, longitude)
+
+
+def fetch_expenses_near(
+    latitude: float, longitude: float, radius_m: float = 100.0, limit: int = 500
+) -> list:
+    """
+    Returns expense documents whose 'geoPoint' lies within radius_m metres.
+
+    The query is served by the 2dsphere index created by geo_migration,
+    or by the in-process spatial index when SPATIAL_INDEX_MODE is 'local'.
+    """
+    if SPATIAL_INDEX_MODE == "local":
+        matches = get_local_spatial_index().query_radius(latitude, longitude, radius_m)
+        return [{"uid": uid, "distanceM": distance} for uid, distance in matches[:limit]]
+
+    collection = get_mongo_client()[DATABASE_NAME][COLLECTION_NAME]
+    query = {
+        "geoPoint": {
+            "$geoWithin": {
+                "$centerSphere": [[longitude, latitude], radius_m / EARTH_RADIUS_M]
+            }
+        }
+    }
+    projection = {"_id": 0, "uid": 1, "locality": 1, "city": 1, "geoPoint": 1}
+    return list(collection.find(query, projection).limit(limit))
+
+
+def fetch_buyers_near(latitude: float, longitude: float, radius_m: float, uids) -> set:
+    """
+    Returns the subset of uids with at least one expense within radius_m
+    metres. Unlike fetch_expenses_near there is no result cap: the query is
+    restricted to uids, so its size is bounded by the caller.
+    """
+    uids = set(uids)
+    if not uids:
+        return set()
+    if SPATIAL_INDEX_MODE == "local":
+        matches = get_local_spatial_index().query_radius(latitude, longitude, radius_m)
+        return {uid for uid, _ in matches if uid in uids}
+
+    collection = get_mongo_client()[DATABASE_NAME][COLLECTION_NAME]
+    query = {
+        "uid": {"$in": sorted(uids)},
+        "geoPoint": {
+            "$geoWithin": {
+                "$centerSphere": [[longitude, latitude], radius_m / EARTH_RADIUS_M]
+            }
+        },
+    }
+    return set(collection.distinct("uid", query))
+
+
+def find_expenses_near(latitude: float, longitude: float, radius_m: float = 100.0) -> str:
+    """
+    Finds the users who made purchases within a radius of a location.
+
+    Args:
+        latitude: Latitude of the location in degrees.
+        longitude: Longitude of the location in degrees.
+        radius_m: Search radius in metres. Defaults to 100.
+
+    Returns:
+        A string listing the number of nearby expense records and the users
+        who made them, or an error message.
+    """
+    try:
+        print(f"Querying expenses within {radius_m}m of ({latitude}, {longitude})...")
+        docs = fetch_expenses_near(latitude, longitude, radius_m)
+        if not docs:
+            return f"No expense records found within {radius_m}m of ({latitude}, {longitude})."
+
+        uids = sorted({doc["uid"] for doc in docs if doc.get("uid")})
+        return (
+            f"Found {len(docs)} expense records within {radius_m}m of "
+            f"({latitude}, {longitude}) from {len(uids)} users: {', '.join(uids)}."
+        )
+
+    except (ConnectionFailure, OperationFailure, Exception) as e:
+        return f"An error occurred: {e}"
+
+
+# This allows you to run the file directly to test the tool:
+#   python -m location_agent.mongo_geo_tool
+if __name__ == "__main__":
+    if not os.environ.get("MONGO_URI"):
+        print("Please set the MONGO_URI environment variable to test this script.")
+    else:
+        print(find_expenses_near(latitude=14.4426, longitude=79.9865, radius_m=100))
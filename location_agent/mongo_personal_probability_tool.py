@@ -1,8 +1,16 @@
 import os
 import json
-from pymongo import MongoClient
+import re
 from pymongo.errors import ConnectionFailure, OperationFailure
 
+from .geo_migration import (
+    is_structured_location,
+    normalize_location_text,
+    structured_geo_fields,
+)
+from .location_histogram import lookup_probabilities, rebuild_histograms
+from .mongo_pool import get_mongo_client
+
 # --- Configuration ---
 # IMPORTANT: Change these values to match your database and collection names.
 DATABASE_NAME = "bill-mgmt"
@@ -10,20 +18,138 @@ COLLECTION_NAME = "item_metadata"
 # -------------------
 
 
-def get_mongo_client():
+def _regex_match_expr(location: str) -> dict:
+    # The 'geoInfo' field is a JSON string, so we do a case-insensitive substring search.
+    # The location is escaped: one name such as 'C++' must not fail the whole batch.
+    return {
+        "$regexMatch": {
+            "input": {"$ifNull": ["$geoInfo", ""]},
+            "regex": re.escape(location),
+            "options": "i",
+        }
+    }
+
+
+def _count_structured(collection, uids: list, keys: list) -> dict:
+    """
+    Counts migrated documents per (uid, key) for structured location keys.
+
+    Documents migrated by geo_migration carry 'geoKeys': every run of words
+    of every address segment, normalized. A place name matches when it is
+    one of them. Matching on uid and geoKeys lets the (uid, geoKeys) index
+    serve the lookup, so only matching documents are read.
+    """
+    pipeline = [
+        {"$match": {"uid": {"$in": uids}, "geoKeys": {"$in": keys}}},
+        {"$project": {"uid": 1, "geoKeys": 1}},
+        {"$unwind": "$geoKeys"},
+        {"$match": {"geoKeys": {"$in": keys}}},
+        {"$group": {"_id": {"uid": "$uid", "key": "$geoKeys"}, "count": {"$sum": 1}}},
+    ]
+    return {
+        (row["_id"]["uid"], row["_id"]["key"]): row["count"]
+        for row in collection.aggregate(pipeline)
+    }
+
+
+def fetch_location_counts(pairs) -> dict:
+    """
+    Counts documents per user and per candidate location in a few
+    aggregations, instead of a total and a regex count_documents call for
+    every (uid, location).
+
+    Totals come from the uid index. Structured locations are counted on
+    migrated documents through the (uid, geoKeys) index. The substring
+    search over 'geoInfo' is only run for free-form locations, and for
+    structured ones on documents that have not been backfilled yet.
+
+    Args:
+        pairs: An iterable of (uid, location) tuples.
+
+    Returns:
+        A dict mapping each uid to {"total": int, "counts": {location: int}}.
+        Users without documents are reported with a total of 0.
+    """
+    pairs = [(uid, location) for uid, location in pairs]
+    uids = sorted({uid for uid, _ in pairs})
+    locations = list(dict.fromkeys(location for _, location in pairs))
+    structured = {
+        location: normalize_location_text(location)
+        for location in locations
+        if is_structured_location(location)
+    }
+    free_form = [location for location in locations if location not in structured]
+
+    collection = get_mongo_client()[DATABASE_NAME][COLLECTION_NAME]
+    result = {
+        uid: {"total": 0, "counts": {location: 0 for location in locations}}
+        for uid in uids
+    }
+    totals = collection.aggregate(
+        [{"$match": {"uid": {"$in": uids}}}, {"$group": {"_id": "$uid", "total": {"$sum": 1}}}]
+    )
+    for row in totals:
+        result[row["_id"]]["total"] = row["total"]
+
+    if structured:
+        counts = _count_structured(collection, uids, sorted(set(structured.values())))
+        for uid in uids:
+            for location, key in structured.items():
+                result[uid]["counts"][location] += counts.get((uid, key), 0)
+
+    # Free-form locations need every document; structured ones only the
+    # documents without geoKeys, which the same index finds.
+    match = {"uid": {"$in": uids}}
+    if not free_form:
+        match["geoKeys"] = {"$exists": False}
+    group = {"_id": "$uid"}
+    for i, location in enumerate(locations):
+        expr = _regex_match_expr(location)
+        if location in structured:
+            expr = {"$cond": [{"$isArray": "$geoKeys"}, False, expr]}
+        group[f"loc_{i}"] = {"$sum": {"$cond": [expr, 1, 0]}}
+    for row in collection.aggregate([{"$match": match}, {"$group": group}]):
+        for i, location in enumerate(locations):
+            result[row["_id"]]["counts"][location] += row.get(f"loc_{i}", 0)
+    return result
+
+
+def fetch_location_probabilities(pairs) -> dict:
     """
-    Establishes a connection to the MongoDB database using a connection
-    string from the MONGO_URI environment variable.
+    Scores many (uid, location) pairs with a single aggregation query.
+
+    Pairs that the per-user location histograms can answer are read from
+    there; only the remaining pairs are counted over item_metadata.
+
+    Args:
+        pairs: An iterable of (uid, location) tuples.
+
+    Returns:
+        A dict mapping each (uid, location) tuple to a probability between
+        0 and 1, or None when the user has no documents.
     """
-    mongo_uri = os.environ.get("MONGO_URI")
-    if not mongo_uri:
-        raise ConnectionFailure("The MONGO_URI environment variable is not set.")
+    pairs = [(uid, location) for uid, location in pairs]
+    probabilities = lookup_probabilities(pairs)
+    remaining = [pair for pair in pairs if pair not in probabilities]
+    if not remaining:
+        return probabilities
+
+    counts = fetch_location_counts(remaining)
+    for uid, location in remaining:
+        total = counts[uid]["total"]
+        probabilities[(uid, location)] = (
+            counts[uid]["counts"][location] / total if total else None
+        )
+    return probabilities
 
-    client = MongoClient(mongo_uri)
-    # The ismaster command is cheap and does not require auth, allowing a quick
-    # check to see if the server is available.
-    client.admin.command("ismaster")
-    return client
+
+def _describe_probability(uid: str, location: str, probability) -> str:
+    if probability is None:
+        return f"No documents found for user '{uid}'. Cannot calculate probability."
+    return (
+        f"Based on their history, the probability of a document from user "
+        f"'{uid}' being from '{location}' is {probability * 100:.2f}%."
+    )
 
 
 def calculate_user_location_probability(uid: str, location: str) -> str:
@@ -41,48 +167,70 @@ def calculate_user_location_probability(uid: str, location: str) -> str:
     Returns:
         A string describing the calculated probability or an error message.
     """
-    client = None
     try:
-        client = get_mongo_client()
-        db = client[DATABASE_NAME]
-        collection = db[COLLECTION_NAME]
-
         print(f"Querying database for user '{uid}' and location '{location}'...")
+        probabilities = fetch_location_probabilities([(uid, location)])
+        return _describe_probability(uid, location, probabilities[(uid, location)])
 
-        # Query for the total number of documents for the user
-        total_docs_query = {"uid": uid}
-        total_docs_count = collection.count_documents(total_docs_query)
+    except (ConnectionFailure, OperationFailure, Exception) as e:
+        return f"An error occurred: {e}"
 
-        if total_docs_count == 0:
-            return f"No documents found for user '{uid}'. Cannot calculate probability."
 
-        # Query for the number of documents for the user that contain the location.
-        # The 'geoInfo' field is a JSON string, so we do a case-insensitive substring search.
-        location_docs_query = {
-            "uid": uid,
-            "geoInfo": {"$regex": location, "$options": "i"},
-        }
-        location_docs_count = collection.count_documents(location_docs_query)
+def calculate_user_location_probabilities(uid: str, locations: list[str]) -> str:
+    """
+    Calculates the probability of a user's documents being from each candidate location.
+
+    All candidate locations are scored with a single database query.
 
-        # Calculate the probability
-        probability = (location_docs_count / total_docs_count) * 100
+    Args:
+        uid: The unique identifier for the user.
+        locations: The location strings to score (e.g., ['Nellore', 'Bangalore']).
 
-        return (
-            f"Based on their history, the probability of a document from user "
-            f"'{uid}' being from '{location}' is {probability:.2f}%."
+    Returns:
+        A string with one probability line per location or an error message.
+    """
+    try:
+        print(f"Querying database for user '{uid}' and {len(locations)} locations...")
+        probabilities = fetch_location_probabilities(
+            (uid, location) for location in locations
+        )
+        return "\n".join(
+            _describe_probability(uid, location, probabilities[(uid, location)])
+            for location in locations
+        )
+
+    except (ConnectionFailure, OperationFailure, Exception) as e:
+        return f"An error occurred: {e}"
+
+
+def calculate_location_probabilities_batch(pairs: list[list[str]]) -> str:
+    """
+    Calculates location probabilities for many (uid, location) pairs at once.
+
+    All pairs are scored with a single database query.
+
+    Args:
+        pairs: A list of [uid, location] pairs.
+
+    Returns:
+        A string with one probability line per pair or an error message.
+    """
+    try:
+        pairs = [(uid, location) for uid, location in pairs]
+        print(f"Querying database for {len(pairs)} (user, location) pairs...")
+        probabilities = fetch_location_probabilities(pairs)
+        return "\n".join(
+            _describe_probability(uid, location, probabilities[(uid, location)])
+            for uid, location in pairs
         )
 
     except (ConnectionFailure, OperationFailure, Exception) as e:
         return f"An error occurred: {e}"
-    finally:
-        if client:
-            client.close()
 
 
 def _setup_mock_data():
     """A helper function to insert sample data for testing."""
     print("Setting up mock data...")
-    client = None
     try:
         client = get_mongo_client()
         db = client[DATABASE_NAME]
@@ -93,42 +241,71 @@ def _setup_mock_data():
             {
                 "Document Name": "/item_metadata/doc1",
                 "uid": "a36fcca2-70e1-4eeb-9f25-565de0ecfc32",
-                "geoInfo": json.dumps({"location": "20, Kala Circle, Nellore-128613"}),
+                "geoInfo": json.dumps(
+                    {
+                        "location": "20, Kala Circle, Nellore-128613",
+                        "latitude": 14.4426,
+                        "longitude": 79.9865,
+                    }
+                ),
                 "other_field": "value1",
+                "timestamp": "2025-07-01T19:15:00",
+                "amount": 450.0,
             },
             {
                 "Document Name": "/item_metadata/doc2",
                 "uid": "a36fcca2-70e1-4eeb-9f25-565de0ecfc32",
                 "geoInfo": json.dumps(
-                    {"location": "15, Main Street, Bangalore-560001"}
+                    {
+                        "location": "15, Main Street, Bangalore-560001",
+                        "latitude": 12.9716,
+                        "longitude": 77.5946,
+                    }
                 ),
                 "other_field": "value2",
+                "timestamp": "2025-07-06T11:40:00",
+                "amount": 1299.0,
             },
             {
                 "Document Name": "/item_metadata/doc3",
                 "uid": "a36fcca2-70e1-4eeb-9f25-565de0ecfc32",
                 "geoInfo": json.dumps(
-                    {"location": "Shop 5, Market Square, Nellore-128613"}
+                    {
+                        "location": "Shop 5, Market Square, Nellore-128613",
+                        "latitude": 14.4431,
+                        "longitude": 79.9870,
+                    }
                 ),
                 "other_field": "value3",
+                "timestamp": "2025-07-12T20:05:00",
+                "amount": 220.5,
             },
             {
                 "Document Name": "/item_metadata/doc4",
                 "uid": "a36fcca2-70e1-4eeb-9f25-565de0ecfc32",
-                "geoInfo": json.dumps({"location": "7, Tech Park, Hyderabad-500081"}),
+                "geoInfo": json.dumps(
+                    {
+                        "location": "7, Tech Park, Hyderabad-500081",
+                        "latitude": 17.4486,
+                        "longitude": 78.3908,
+                    }
+                ),
                 "other_field": "value4",
+                "timestamp": "2025-07-18T13:30:00",
+                "amount": 780.0,
             },
         ]
+        for doc in mock_data:
+            doc.update(structured_geo_fields(doc["geoInfo"]))
         collection.insert_many(mock_data)
+        rebuild_histograms(["a36fcca2-70e1-4eeb-9f25-565de0ecfc32"])
         print("Mock data has been set up successfully.")
     except (ConnectionFailure, OperationFailure, Exception) as e:
         print(f"Could not set up mock data: {e}")
-    finally:
-        if client:
-            client.close()
 
 
-# This allows you to run the file directly to test the tool
+# This allows you to run the file directly to test the tool:
+#   python -m location_agent.mongo_personal_probability_tool
 if __name__ == "__main__":
     if not os.environ.get("MONGO_URI"):
         print("Please set the MONGO_URI environment variable to test this script.")
@@ -139,4 +316,10 @@ if __name__ == "__main__":
             uid="a36fcca2-70e1-4eeb-9f25-565de0ecfc32", location="Nellore"
         )
         print(probability)
+        print(
+            calculate_user_location_probabilities(
+                uid="a36fcca2-70e1-4eeb-9f25-565de0ecfc32",
+                locations=["Nellore", "Bangalore", "Hyderabad", "Chennai"],
+            )
+        )
 
@@ -0,0 +1,150 @@
+import atexit
+import os
+import threading
+import time
+from pymongo import MongoClient
+from pymongo.errors import ConnectionFailure, PyMongoError
+
+# --- Configuration ---
+# Pool sizing can be tuned per deployment through environment variables.
+MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "50"))
+MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", "0"))
+MAX_IDLE_TIME_MS = int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", "300000"))
+SERVER_SELECTION_TIMEOUT_MS = int(
+    os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")
+)
+HEALTH_CHECK_INTERVAL_S = float(os.environ.get("MONGO_HEALTH_CHECK_INTERVAL_S", "30"))
+# -------------------
+
+_lock = threading.Lock()
+_clients = {}
+_health = {}
+_stop_event = threading.Event()
+_health_thread = None
+
+
+def _reset_after_fork():
+    """
+    Drops every client inherited from the parent process.
+
+    MongoClient is not fork-safe: sockets and monitor threads belong to the
+    parent, so the child must build its own clients on first use.
+    """
+    global _lock, _stop_event, _health_thread
+    _lock = threading.Lock()
+    _clients.clear()
+    _health.clear()
+    _stop_event = threading.Event()
+    _health_thread = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _build_client(mongo_uri: str) -> MongoClient:
+    return MongoClient(
+        mongo_uri,
+        maxPoolSize=MAX_POOL_SIZE,
+        minPoolSize=MIN_POOL_SIZE,
+        maxIdleTimeMS=MAX_IDLE_TIME_MS,
+        serverSelectionTimeoutMS=SERVER_SELECTION_TIMEOUT_MS,
+        connect=False,
+    )
+
+
+def _health_check_loop():
+    while not _stop_event.wait(HEALTH_CHECK_INTERVAL_S):
+        with _lock:
+            clients = list(_clients.items())
+        for mongo_uri, client in clients:
+            try:
+                # The ping command is cheap and does not require auth.
+                client.admin.command("ping")
+                _health[mongo_uri] = {"ok": True, "checked_at": time.time()}
+            except PyMongoError as e:
+                _health[mongo_uri] = {
+                    "ok": False,
+                    "checked_at": time.time(),
+                    "error": str(e),
+                }
+
+
+def _ensure_health_thread():
+    global _health_thread
+    if HEALTH_CHECK_INTERVAL_S <= 0:
+        return
+    if _health_thread is None or not _health_thread.is_alive():
+        # A previous close_mongo_clients() left the event set.
+        _stop_event.clear()
+        _health_thread = threading.Thread(
+            target=_health_check_loop, name="mongo-health-check", daemon=True
+        )
+        _health_thread.start()
+
+
+def get_mongo_client(mongo_uri: str = None) -> MongoClient:
+    """
+    Returns the process-wide pooled MongoClient for the given connection string.
+
+    The client is created lazily on first use and shared by every caller in
+    the process, so tool calls reuse pooled connections instead of paying for
+    TCP/TLS setup and server selection each time. Callers must not close it.
+
+    Args:
+        mongo_uri: The connection string. Defaults to the MONGO_URI
+            environment variable.
+
+    Returns:
+        The shared MongoClient instance.
+    """
+    mongo_uri = mongo_uri or os.environ.get("MONGO_URI")
+    if not mongo_uri:
+        raise ConnectionFailure("The MONGO_URI environment variable is not set.")
+
+    client = _clients.get(mongo_uri)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(mongo_uri)
+        if client is None:
+            client = _build_client(mongo_uri)
+            _clients[mongo_uri] = client
+            _ensure_health_thread()
+    return client
+
+
+def get_pool_health(mongo_uri: str = None) -> dict:
+    """
+    Returns the result of the last background health check for a client.
+
+    Args:
+        mongo_uri: The connection string. Defaults to the MONGO_URI
+            environment variable.
+
+    Returns:
+        A dict with 'ok' and 'checked_at' keys (plus 'error' on failure), or
+        an empty dict if no check has run yet.
+    """
+    mongo_uri = mongo_uri or os.environ.get("MONGO_URI")
+    return dict(_health.get(mongo_uri, {}))
+
+
+def close_mongo_clients():
+    """Stops the health check thread and closes every pooled client."""
+    global _health_thread
+    _stop_event.set()
+    thread = _health_thread
+    if thread is not None and thread is not threading.current_thread():
+        # Wait for the thread to exit so a client created afterwards starts a fresh one.
+        thread.join(timeout=5)
+    with _lock:
+        _health_thread = None
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+        _health.clear()
+
+
+atexit.register(close_mongo_clients)
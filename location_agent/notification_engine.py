@@ -0,0 +1,374 @@
+import argparse
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from .decision_engine import decide_purchase, load_decision_config
+from .geo_migration import normalize_location_text
+
+# --- Configuration ---
+BATCH_SIZE = int(os.environ.get("NOTIFY_BATCH_SIZE", "200"))
+# How long the worker waits to fill a micro-batch before scoring what it has.
+BATCH_WAIT_S = float(os.environ.get("NOTIFY_BATCH_WAIT_S", "0.5"))
+# A (uid, location) pair is scored at most once per window.
+DEDUPE_WINDOW_S = float(os.environ.get("NOTIFY_DEDUPE_WINDOW_S", "900"))
+QUEUE_SIZE = int(os.environ.get("NOTIFY_QUEUE_SIZE", "10000"))
+# Notifications kept per user.
+MAX_PER_USER = int(os.environ.get("NOTIFY_MAX_PER_USER", "20"))
+# -------------------
+
+
+@dataclass
+class LocationEvent:
+    """A location ping: the user was at location at timestamp (epoch seconds)."""
+
+    uid: str
+    location: str
+    timestamp: float
+    latitude: float = None
+    longitude: float = None
+
+
+class NotificationStore:
+    """
+    The latest notifications per user. Writers are the engine's worker
+    thread; readers (the Streamlit sidebar) only copy a short list under
+    the lock, so they never wait on scoring.
+    """
+
+    def __init__(self, max_per_user: int = MAX_PER_USER):
+        self.max_per_user = max_per_user
+        self._lock = threading.Lock()
+        self._by_user = {}
+
+    def publish(self, uid: str, notification: dict):
+        with self._lock:
+            notifications = self._by_user.get(uid)
+            if notifications is None:
+                notifications = self._by_user[uid] = deque(maxlen=self.max_per_user)
+            notifications.appendleft(notification)
+
+    def get(self, uid: str, limit: int = None) -> list:
+        """Returns the user's notifications, newest first."""
+        with self._lock:
+            notifications = list(self._by_user.get(uid, ()))
+        return notifications[:limit] if limit else notifications
+
+    def clear(self, uid: str = None):
+        with self._lock:
+            if uid is None:
+                self._by_user.clear()
+            else:
+                self._by_user.pop(uid, None)
+
+
+def score_events(events: list) -> list:
+    """
+    Scores a micro-batch of events with the location-probability pipeline.
+
+    Personal probabilities for the whole batch come from one
+    fetch_location_probabilities call. Events with coordinates also get a
+    public probability from the cohort index, looked up once per batch with
+    one buyers query per location. Each pair is then decided with
+    decide_purchase at the hour of the event in the shared TIMEZONE.
+
+    Returns:
+        A decide_purchase result per event, in order.
+    """
+    from .cohort_index import cohort_location_probabilities
+    from .mongo_personal_probability_tool import fetch_location_probabilities
+
+    personal = fetch_location_probabilities([(e.uid, e.location) for e in events])
+    points = [
+        (e.uid, e.latitude, e.longitude)
+        for e in events
+        if e.latitude is not None and e.longitude is not None
+    ]
+    public = {}
+    if points:
+        try:
+            public = cohort_location_probabilities(points)
+        except Exception as e:
+            print(f"Cohort probabilities failed for {len(points)} events: {e}")
+    config = load_decision_config()
+    return [
+        decide_purchase(
+            personal.get((event.uid, event.location)),
+            public.get((event.uid, event.latitude, event.longitude)),
+            config=config,
+            event_time=event.timestamp,
+        )
+        for event in events
+    ]
+
+
+class NotificationEngine:
+    """
+    Consumes LocationEvents from a bounded queue on a background thread.
+
+    Events are pulled in micro-batches of up to batch_size (or whatever
+    arrived within batch_wait_s). Within a batch, repeated pings from one
+    user at one location are coalesced into the latest. Pairs already
+    scored within dedupe_window_s are skipped. The rest go through scorer
+    in a single call, and purchases are published to the store.
+
+    Args:
+        scorer: Called with a list of events; returns a decide_purchase
+            result per event. Defaults to score_events.
+        store: The NotificationStore to publish to.
+    """
+
+    def __init__(
+        self,
+        scorer=None,
+        store: NotificationStore = None,
+        batch_size: int = BATCH_SIZE,
+        batch_wait_s: float = BATCH_WAIT_S,
+        dedupe_window_s: float = DEDUPE_WINDOW_S,
+        queue_size: int = QUEUE_SIZE,
+    ):
+        self.scorer = scorer or score_events
+        self.store = store if store is not None else NotificationStore()
+        self.batch_size = batch_size
+        self.batch_wait_s = batch_wait_s
+        self.dedupe_window_s = dedupe_window_s
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._recent = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self._metrics_lock = threading.Lock()
+        self.metrics = {
+            "received": 0,
+            "dropped": 0,
+            "coalesced": 0,
+            "deduplicated": 0,
+            "scored": 0,
+            "notifications": 0,
+            "batches": 0,
+            "errors": 0,
+            "scoring_s": 0.0,
+        }
+        self._started_at = None
+
+    def _count(self, name: str, amount=1):
+        with self._metrics_lock:
+            self.metrics[name] += amount
+
+    def submit(self, event: LocationEvent) -> bool:
+        """Queues an event without blocking; returns False if the queue is full."""
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._count("dropped")
+            return False
+        self._count("received")
+        return True
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="notification-engine", daemon=True)
+        self._thread.start()
+
+    def stop(self, drain: bool = True, timeout: float = 10.0):
+        """Stops the worker, scoring queued events first when drain is True."""
+        if drain:
+            deadline = time.time() + timeout
+            while not self._queue.empty() and time.time() < deadline:
+                time.sleep(0.01)
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _next_batch(self) -> list:
+        try:
+            batch = [self._queue.get(timeout=self.batch_wait_s)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_wait_s
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    event = self._queue.get(timeout=remaining)
+                else:
+                    event = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(event)
+        return batch
+
+    def _coalesce(self, batch: list) -> list:
+        latest = {}
+        for event in batch:
+            key = (event.uid, normalize_location_text(event.location))
+            current = latest.get(key)
+            if current is None or event.timestamp >= current.timestamp:
+                latest[key] = event
+        self._count("coalesced", len(batch) - len(latest))
+
+        now = time.time()
+        fresh = []
+        for key, event in latest.items():
+            seen_at = self._recent.get(key)
+            if seen_at is not None and event.timestamp - seen_at < self.dedupe_window_s:
+                self._count("deduplicated")
+                continue
+            self._recent[key] = event.timestamp
+            fresh.append(event)
+        if len(self._recent) > 10 * QUEUE_SIZE:
+            cutoff = now - self.dedupe_window_s
+            self._recent = {k: t for k, t in self._recent.items() if t >= cutoff}
+        return fresh
+
+    def process_batch(self, batch: list) -> int:
+        """Coalesces, scores and publishes one batch; returns notifications published."""
+        events = self._coalesce(batch)
+        if not events:
+            return 0
+        start = time.perf_counter()
+        try:
+            results = self.scorer(events)
+        except Exception as e:
+            print(f"Scoring a batch of {len(events)} events failed: {e}")
+            self._count("errors")
+            for event in events:
+                self._recent.pop((event.uid, normalize_location_text(event.location)), None)
+            return 0
+        self._count("scoring_s", time.perf_counter() - start)
+        self._count("scored", len(events))
+        self._count("batches")
+
+        published = 0
+        for event, result in zip(events, results):
+            if not result.get("purchase"):
+                continue
+            self.store.publish(
+                event.uid,
+                {
+                    "message": f"Probable purchase at {event.location}",
+                    "location": event.location,
+                    "score": result["score"],
+                    "timestamp": event.timestamp,
+                },
+            )
+            published += 1
+        self._count("notifications", published)
+        return published
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if batch:
+                self.process_batch(batch)
+
+    def stats(self) -> dict:
+        """Returns the counters plus throughput and queue depth."""
+        with self._metrics_lock:
+            stats = dict(self.metrics)
+        elapsed = time.perf_counter() - self._started_at if self._started_at else 0.0
+        stats["queue_depth"] = self._queue.qsize()
+        stats["events_per_s"] = stats["received"] / elapsed if elapsed else 0.0
+        stats["scored_per_s"] = stats["scored"] / stats["scoring_s"] if stats["scoring_s"] else 0.0
+        stats["avg_batch_size"] = stats["scored"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_notification_engine() -> NotificationEngine:
+    """Returns the process-wide engine, started on first use."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = NotificationEngine()
+            _engine.start()
+        return _engine
+
+
+SYNTHETIC_LOCATIONS = (
+    ("HSR Layout, Bangalore, 560102", 12.9116, 77.6474),
+    ("Koramangala, Bangalore, 560034", 12.9352, 77.6245),
+    ("Indiranagar, Bangalore, 560038", 12.9784, 77.6408),
+    ("Whitefield, Bangalore, 560066", 12.9698, 77.7500),
+    ("Jayanagar, Bangalore, 560041", 12.9308, 77.5838),
+)
+
+
+def synthetic_events(uids, count: int, repeat_rate: float = 0.3, seed: int = 0):
+    """
+    Yields count synthetic location pings for uids. A share of repeat_rate
+    of them repeats the user's previous location, like a phone reporting
+    the same place several times.
+    """
+    rng = random.Random(seed)
+    last = {}
+    now = time.time()
+    for i in range(count):
+        uid = rng.choice(uids)
+        if uid in last and rng.random() < repeat_rate:
+            location, latitude, longitude = last[uid]
+        else:
+            location, latitude, longitude = rng.choice(SYNTHETIC_LOCATIONS)
+            last[uid] = (location, latitude, longitude)
+        yield LocationEvent(uid, location, now + i * 0.01, latitude, longitude)
+
+
+def _synthetic_scorer(delay_s: float):
+    # Stands in for score_events without a database: a fixed round trip per
+    # batch and a probability derived from the pair.
+    def scorer(events):
+        time.sleep(delay_s)
+        config = load_decision_config()
+        return [
+            decide_purchase(
+                (hash((e.uid, e.location)) % 100) / 100, None,
+                config=config, event_time=e.timestamp,
+            )
+            for e in events
+        ]
+
+    return scorer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the notification engine on synthetic events.")
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument(
+        "--live", action="store_true",
+        help="Score with MongoDB (MONGO_URI) instead of a simulated 20 ms scorer.",
+    )
+    args = parser.parse_args()
+
+    scorer = score_events if args.live else _synthetic_scorer(0.02)
+    engine = NotificationEngine(scorer=scorer, batch_size=args.batch_size, batch_wait_s=0.05)
+    uids = [f"user-{i}" for i in range(args.users)]
+    engine.start()
+    start = time.perf_counter()
+    for event in synthetic_events(uids, args.events):
+        while not engine.submit(event):
+            time.sleep(0.001)
+    engine.stop(drain=True, timeout=60)
+    elapsed = time.perf_counter() - start
+
+    stats = engine.stats()
+    print(f"Processed {args.events} events in {elapsed:.2f} s ({args.events / elapsed:.0f} events/s)")
+    for name, value in stats.items():
+        print(f"  {name}: {value:.2f}" if isinstance(value, float) else f"  {name}: {value}")
+    print(f"Sample notifications for {uids[0]}: {engine.store.get(uids[0], limit=3)}")
+
+
+# Run the synthetic load test with:
+#   python -m location_agent.notification_engine --events 20000
+if __name__ == "__main__":
+    main()
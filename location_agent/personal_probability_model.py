@@ -0,0 +1,278 @@
+import datetime
+import os
+import threading
+import time
+from dataclasses import dataclass
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from pymongo.errors import ConnectionFailure, OperationFailure
+
+from .geo_migration import normalize_geo_info
+from .mongo_pool import get_mongo_client
+
+# --- Configuration ---
+DATABASE_NAME = "bill-mgmt"
+COLLECTION_NAME = "item_metadata"
+SPATIAL_BANDWIDTH_M = 150.0
+HOUR_BANDWIDTH_H = 1.5
+# Weight of a history entry by how its day of week relates to the candidate's.
+SAME_DAY_WEIGHT = 1.0
+SAME_DAY_TYPE_WEIGHT = 0.6
+OTHER_DAY_WEIGHT = 0.3
+# Older purchases count less; the weight halves every RECENCY_HALF_LIFE_DAYS.
+RECENCY_HALF_LIFE_DAYS = 90.0
+HISTORY_CACHE_TTL_S = 300.0
+HISTORY_CACHE_MAX_USERS = 1000
+# Upper bound on the candidates x history matrix evaluated at once.
+MAX_MATRIX_CELLS = 4_000_000
+# Hours and days of week of both history and candidates are read in this zone.
+# Timestamps stored without an offset are taken to be in it too.
+TIMEZONE = ZoneInfo(os.environ.get("PERSONAL_MODEL_TZ", "Asia/Kolkata"))
+# -------------------
+
+EARTH_RADIUS_M = 6371000.0
+
+
+def _parse_timestamp(value):
+    """Returns value as an aware datetime in TIMEZONE, or None."""
+    if isinstance(value, str):
+        try:
+            value = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value, TIMEZONE)
+    if not isinstance(value, datetime.datetime):
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=TIMEZONE)
+    return value.astimezone(TIMEZONE)
+
+
+@dataclass
+class UserHistory:
+    """A user's expense history as column arrays, one entry per expense."""
+
+    timestamps: np.ndarray
+    hours: np.ndarray
+    days_of_week: np.ndarray
+    latitudes: np.ndarray
+    longitudes: np.ndarray
+    amounts: np.ndarray
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @classmethod
+    def from_documents(cls, docs) -> "UserHistory":
+        """
+        Builds the arrays from expense documents.
+
+        Documents without a parseable 'timestamp' are skipped. Coordinates
+        come from 'geoPoint' or, for documents that have not been migrated,
+        from 'geoInfo'; missing coordinates are stored as NaN.
+        """
+        rows = []
+        for doc in docs:
+            when = _parse_timestamp(doc.get("timestamp"))
+            if when is None:
+                continue
+            point = doc.get("geoPoint") or normalize_geo_info(doc.get("geoInfo")).get(
+                "geoPoint"
+            )
+            longitude, latitude = point["coordinates"] if point else (np.nan, np.nan)
+            rows.append(
+                (
+                    when.timestamp(),
+                    when.hour + when.minute / 60,
+                    when.weekday(),
+                    latitude,
+                    longitude,
+                    float(doc.get("amount") or 0.0),
+                )
+            )
+
+        columns = np.array(rows, dtype=np.float64).reshape(-1, 6)
+        return cls(
+            timestamps=columns[:, 0],
+            hours=columns[:, 1],
+            days_of_week=columns[:, 2].astype(np.int8),
+            latitudes=columns[:, 3],
+            longitudes=columns[:, 4],
+            amounts=columns[:, 5],
+        )
+
+
+def _squared_distance_m2(lat1, lon1, lat2, lon2):
+    # Equirectangular approximation: accurate to well under 1% at the few-km
+    # scale the kernel cares about, and much cheaper than haversine.
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    x = (lon2 - lon1) * np.cos((lat1 + lat2) / 2)
+    y = lat2 - lat1
+    return (x * x + y * y) * EARTH_RADIUS_M**2
+
+
+def score_candidates(history: UserHistory, latitudes, longitudes, timestamps=None) -> np.ndarray:
+    """
+    Scores candidate (location, time) pairs against a user's history.
+
+    Each history entry contributes a Gaussian kernel on distance times a
+    circular Gaussian kernel on hour of day. Entries are weighted by how
+    their day of week relates to the candidate's and discounted by age, and
+    the result is the weighted average of the kernels. It lies between 0
+    and 1, and reaches 1 for a candidate that repeats every past purchase:
+    a daily habit scores close to 1 at its usual place and hour.
+
+    Args:
+        history: The user's history.
+        latitudes: Candidate latitudes in degrees, shape (M,).
+        longitudes: Candidate longitudes in degrees, shape (M,).
+        timestamps: Candidate times as epoch seconds, shape (M,). Defaults to now.
+
+    Returns:
+        An array of M probabilities.
+    """
+    latitudes = np.atleast_1d(np.asarray(latitudes, dtype=np.float64))
+    longitudes = np.atleast_1d(np.asarray(longitudes, dtype=np.float64))
+    if timestamps is None:
+        timestamps = np.full(latitudes.shape, time.time())
+    timestamps = np.atleast_1d(np.asarray(timestamps, dtype=np.float64))
+    if len(history) == 0:
+        return np.zeros(latitudes.shape)
+
+    candidate_times = [datetime.datetime.fromtimestamp(ts, TIMEZONE) for ts in timestamps]
+    hours = np.array([t.hour + t.minute / 60 for t in candidate_times])
+    days = np.array([t.weekday() for t in candidate_times], dtype=np.int8)
+
+    result = np.empty(latitudes.shape)
+    chunk = max(1, MAX_MATRIX_CELLS // len(history))
+    for start in range(0, len(latitudes), chunk):
+        end = start + chunk
+        distance2 = _squared_distance_m2(
+            latitudes[start:end, None],
+            longitudes[start:end, None],
+            history.latitudes[None, :],
+            history.longitudes[None, :],
+        )
+        hour_gap = np.abs(hours[start:end, None] - history.hours[None, :])
+        hour_gap = np.minimum(hour_gap, 24 - hour_gap)
+        age_days = np.maximum(timestamps[start:end, None] - history.timestamps[None, :], 0) / 86400
+
+        # The spatial and hour kernels are multiplied in log space so the
+        # product costs a single exp per cell.
+        log_kernel = (
+            -0.5 * distance2 / SPATIAL_BANDWIDTH_M**2
+            - 0.5 * (hour_gap / HOUR_BANDWIDTH_H) ** 2
+        )
+        # Entries without coordinates never match a location.
+        log_kernel = np.nan_to_num(log_kernel, nan=-np.inf)
+        recency = np.exp(age_days * (np.log(0.5) / RECENCY_HALF_LIFE_DAYS))
+
+        same_day = days[start:end, None] == history.days_of_week[None, :]
+        same_type = (days[start:end, None] >= 5) == (history.days_of_week[None, :] >= 5)
+        day_weight = np.where(
+            same_day,
+            SAME_DAY_WEIGHT,
+            np.where(same_type, SAME_DAY_TYPE_WEIGHT, OTHER_DAY_WEIGHT),
+        )
+
+        # Normalizing by the weights themselves keeps the day-of-week weights
+        # from capping the score below 1.
+        weight = recency * day_weight
+        result[start:end] = (np.exp(log_kernel) * weight).sum(axis=1) / weight.sum(axis=1)
+    return result
+
+
+_history_lock = threading.Lock()
+_history_cache = {}
+
+
+def load_user_history(uid: str, use_cache: bool = True) -> UserHistory:
+    """Loads a user's expense history from MongoDB, caching it for a few minutes."""
+    if use_cache:
+        with _history_lock:
+            cached = _history_cache.get(uid)
+        if cached and time.monotonic() - cached[0] < HISTORY_CACHE_TTL_S:
+            return cached[1]
+
+    collection = get_mongo_client()[DATABASE_NAME][COLLECTION_NAME]
+    projection = {"_id": 0, "timestamp": 1, "geoPoint": 1, "geoInfo": 1, "amount": 1}
+    history = UserHistory.from_documents(collection.find({"uid": uid}, projection))
+
+    with _history_lock:
+        if len(_history_cache) >= HISTORY_CACHE_MAX_USERS:
+            _history_cache.pop(next(iter(_history_cache)))
+        _history_cache[uid] = (time.monotonic(), history)
+    return history
+
+
+def score_personal_location_probability(
+    uid: str, latitude: float, longitude: float, timestamp: str = None
+) -> str:
+    """
+    Calculates how typical a purchase at a place and time is for a user.
+
+    The user's expense history is compared with the candidate by distance,
+    hour of day and day of week, weighting recent purchases more.
+
+    Args:
+        uid: The unique identifier for the user.
+        latitude: Latitude of the candidate location in degrees.
+        longitude: Longitude of the candidate location in degrees.
+        timestamp: ISO 8601 time of the candidate purchase, in TIMEZONE unless
+            it carries an offset. Defaults to now.
+
+    Returns:
+        A string describing the calculated probability or an error message.
+    """
+    try:
+        when = _parse_timestamp(timestamp) if timestamp else datetime.datetime.now(TIMEZONE)
+        if when is None:
+            return f"Could not parse timestamp '{timestamp}'."
+
+        history = load_user_history(uid)
+        if len(history) == 0:
+            return f"No timestamped documents found for user '{uid}'. Cannot calculate probability."
+
+        probability = score_candidates(history, [latitude], [longitude], [when.timestamp()])[0]
+        return (
+            f"Based on {len(history)} past purchases, the probability of user '{uid}' "
+            f"buying at ({latitude}, {longitude}) at {when:%A %H:%M} is "
+            f"{probability * 100:.2f}%."
+        )
+
+    except (ConnectionFailure, OperationFailure, Exception) as e:
+        return f"An error occurred: {e}"
+
+
+# This allows you to run the file directly to test the model:
+#   python -m location_agent.personal_probability_model
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    n = 5000
+    now = time.time()
+    history = UserHistory(
+        timestamps=now - rng.uniform(0, 180 * 86400, n),
+        hours=rng.normal(19, 2, n) % 24,
+        days_of_week=rng.integers(0, 7, n).astype(np.int8),
+        latitudes=12.9116 + rng.normal(0, 0.002, n),
+        longitudes=77.6389 + rng.normal(0, 0.002, n),
+        amounts=rng.uniform(50, 2000, n),
+    )
+    candidates = 200
+    lats = 12.9116 + rng.normal(0, 0.02, candidates)
+    lons = 77.6389 + rng.normal(0, 0.02, candidates)
+    start = time.perf_counter()
+    scores = score_candidates(history, lats, lons)
+    elapsed = time.perf_counter() - start
+    print(
+        f"Scored {candidates} candidates against {n} purchases in {elapsed * 1000:.2f} ms "
+        f"(max probability {scores.max():.4f})."
+    )
+    if os.environ.get("MONGO_URI"):
+        print(
+            score_personal_location_probability(
+                "a36fcca2-70e1-4eeb-9f25-565de0ecfc32", 14.4426, 79.9865
+            )
+        )
@@ -0,0 +1,168 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from .geo_migration import normalize_location_text
+
+# --- Configuration ---
+# Width of a time bucket. Pings from the same user at the same place within one
+# bucket share a cached result.
+BUCKET_SECONDS = int(os.environ.get("RESULT_CACHE_BUCKET_S", "900"))
+TTL_S = float(os.environ.get("RESULT_CACHE_TTL_S", "1800"))
+MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "10000"))
+# 'memory' for an in-process LRU, 'sqlite' for a local on-disk store.
+BACKEND = os.environ.get("RESULT_CACHE_BACKEND", "memory")
+SQLITE_PATH = os.environ.get("RESULT_CACHE_PATH", "aggregator_cache.sqlite3")
+# -------------------
+
+
+class MemoryBackend:
+    """An in-process LRU store with per-entry expiry."""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: float):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteBackend:
+    """A local on-disk store, shared by every process on the host."""
+
+    def __init__(self, path: str = SQLITE_PATH, max_entries: int = MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS results_expires_at ON results (expires_at)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        row = (
+            self._connect()
+            .execute(
+                "SELECT value FROM results WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            )
+            .fetchone()
+        )
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value, ttl: float):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, default=str), now + ttl),
+            )
+            conn.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+            overflow = conn.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results "
+                "ORDER BY expires_at LIMIT max(0, (SELECT count(*) FROM results) - ?))",
+                (self.max_entries,),
+            ).rowcount
+            self.evictions += max(overflow, 0)
+
+    def __len__(self):
+        return self._connect().execute("SELECT count(*) FROM results").fetchone()[0]
+
+
+class ResultCache:
+    """
+    Memoizes aggregator results by (uid, normalized location, time bucket).
+
+    Args:
+        backend: A MemoryBackend or SqliteBackend.
+        bucket_seconds: Width of the time bucket in seconds.
+        ttl: How long an entry stays valid, in seconds.
+    """
+
+    def __init__(self, backend=None, bucket_seconds: int = BUCKET_SECONDS, ttl: float = TTL_S):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.bucket_seconds = bucket_seconds
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, uid: str, location: str, timestamp: float = None) -> str:
+        if timestamp is None:
+            timestamp = time.time()
+        bucket = int(float(timestamp) // self.bucket_seconds)
+        return f"{uid}|{normalize_location_text(location)}|{bucket}"
+
+    def get(self, uid: str, location: str, timestamp: float = None):
+        value = self.backend.get(self.key(uid, location, timestamp))
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, uid: str, location: str, value, timestamp: float = None):
+        self.backend.set(self.key(uid, location, timestamp), value, self.ttl)
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters to help tune the bucket width."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.backend.evictions,
+            "entries": len(self.backend),
+            "bucket_seconds": self.bucket_seconds,
+            "ttl": self.ttl,
+            "backend": type(self.backend).__name__,
+        }
+
+
+def build_result_cache() -> ResultCache:
+    """Builds the ResultCache configured by the RESULT_CACHE_* environment variables."""
+    if BACKEND == "sqlite":
+        backend = SqliteBackend(SQLITE_PATH)
+    else:
+        backend = MemoryBackend()
+    return ResultCache(backend)
@@ -0,0 +1,273 @@
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from .geo_migration import normalize_geo_info
+from .geohash import EARTH_RADIUS_M, cell_size_m, cells_covering, encode_cells
+
+# --- Configuration ---
+# 35 bits is geohash precision 7, cells of roughly 150m x 150m.
+CELL_BITS = 35
+# Radius queries covering more cells than this scan every record instead.
+MAX_QUERY_CELLS = 4096
+DATABASE_NAME = "bill-mgmt"
+COLLECTION_NAME = "item_metadata"
+# -------------------
+
+
+def haversine_m(lat, lon, lats, lons) -> np.ndarray:
+    """Great-circle distance in metres from one point to arrays of points."""
+    lat, lon = np.radians(lat), np.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = (
+        np.sin((lats - lat) / 2) ** 2
+        + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class GeohashGridIndex:
+    """
+    An in-memory geohash grid over point records for radius and k-NN queries.
+
+    Unlike shapely's STRtree, which must be rebuilt on every change, the
+    grid supports cheap incremental inserts: bulk loads are grouped into
+    per-cell index arrays, and later inserts go to small per-cell lists
+    that are folded in lazily.
+    """
+
+    def __init__(self, bits: int = CELL_BITS, capacity: int = 1024):
+        self.bits = bits
+        self.lats = np.zeros(capacity)
+        self.lons = np.zeros(capacity)
+        self.ids = np.empty(capacity, dtype=object)
+        self.size = 0
+        self._cells = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.size
+
+    def _reserve(self, extra: int):
+        needed = self.size + extra
+        if needed <= len(self.lats):
+            return
+        capacity = max(needed, 2 * len(self.lats))
+        for name in ("lats", "lons", "ids"):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[: self.size] = old[: self.size]
+            setattr(self, name, new)
+
+    def bulk_load(self, ids, lats, lons):
+        """Adds many records at once, grouping them by cell with a single sort."""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        with self._lock:
+            self._reserve(len(lats))
+            start = self.size
+            self.lats[start : start + len(lats)] = lats
+            self.lons[start : start + len(lats)] = lons
+            self.ids[start : start + len(lats)] = list(ids)
+            self.size += len(lats)
+
+            cells = encode_cells(lats, lons, self.bits)
+            order = np.argsort(cells, kind="stable")
+            unique, first = np.unique(cells[order], return_index=True)
+            for cell, rows in zip(unique.tolist(), np.split(order + start, first[1:])):
+                existing = self._cells.get(cell)
+                self._cells[cell] = rows if existing is None else np.concatenate([existing, rows])
+
+    def insert(self, record_id, lat: float, lon: float):
+        """Adds a single record."""
+        cell = int(encode_cells([lat], [lon], self.bits)[0])
+        with self._lock:
+            self._reserve(1)
+            row = self.size
+            self.lats[row], self.lons[row], self.ids[row] = lat, lon, record_id
+            self.size += 1
+            self._pending.setdefault(cell, []).append(row)
+
+    def _rows_in(self, cells) -> np.ndarray:
+        parts = []
+        for cell in cells.tolist():
+            pending = self._pending.pop(cell, None)
+            if pending:
+                existing = self._cells.get(cell)
+                rows = np.asarray(pending, dtype=np.int64)
+                self._cells[cell] = rows if existing is None else np.concatenate([existing, rows])
+            rows = self._cells.get(cell)
+            if rows is not None:
+                parts.append(rows)
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def _candidates(self, lat: float, lon: float, radius_m: float) -> np.ndarray:
+        cells = cells_covering(lat, lon, radius_m, self.bits)
+        if len(cells) > MAX_QUERY_CELLS:
+            return np.arange(self.size)
+        return self._rows_in(cells)
+
+    def query_radius(self, lat: float, lon: float, radius_m: float) -> list:
+        """
+        Returns every record within radius_m metres of a point.
+
+        Returns:
+            A list of (id, distance_m) tuples sorted by distance.
+        """
+        with self._lock:
+            rows = self._candidates(lat, lon, radius_m)
+            distances = haversine_m(lat, lon, self.lats[rows], self.lons[rows])
+            inside = distances <= radius_m
+            rows, distances = rows[inside], distances[inside]
+            order = np.argsort(distances)
+            return list(zip(self.ids[rows[order]].tolist(), distances[order].tolist()))
+
+    def query_knn(self, lat: float, lon: float, k: int) -> list:
+        """
+        Returns the k records nearest to a point.
+
+        The search radius starts at one cell and doubles until it holds at
+        least k records, which guarantees the k nearest are among them.
+
+        Returns:
+            A list of (id, distance_m) tuples sorted by distance.
+        """
+        with self._lock:
+            k = min(k, self.size)
+            if k == 0:
+                return []
+            radius = max(cell_size_m(self.bits, lat))
+            while True:
+                rows = self._candidates(lat, lon, radius)
+                distances = haversine_m(lat, lon, self.lats[rows], self.lons[rows])
+                inside = distances <= radius
+                if inside.sum() >= k or len(rows) == self.size:
+                    break
+                radius *= 2
+            if len(rows) == self.size:
+                inside = np.ones(len(rows), dtype=bool)
+            rows, distances = rows[inside], distances[inside]
+            top = np.argpartition(distances, k - 1)[:k]
+            top = top[np.argsort(distances[top])]
+            return list(zip(self.ids[rows[top]].tolist(), distances[top].tolist()))
+
+    @classmethod
+    def from_mongo(
+        cls, query: dict = None, id_field: str = "_id", bits: int = CELL_BITS
+    ) -> "GeohashGridIndex":
+        """
+        Bulk-loads expense records with a 'geoPoint' from item_metadata.
+
+        Args:
+            query: Optional filter on item_metadata.
+            id_field: The document field used as the record id, e.g. 'uid'.
+            bits: Cell size of the grid.
+        """
+        from .mongo_pool import get_mongo_client
+
+        collection = get_mongo_client()[DATABASE_NAME][COLLECTION_NAME]
+        query = dict(query or {})
+        query.setdefault("geoPoint", {"$exists": True})
+        ids, lats, lons = [], [], []
+        for doc in collection.find(query, {id_field: 1, "geoPoint": 1}, batch_size=10000):
+            longitude, latitude = doc["geoPoint"]["coordinates"]
+            ids.append(str(doc.get(id_field)))
+            lats.append(latitude)
+            lons.append(longitude)
+        index = cls(bits=bits, capacity=max(1, len(ids)))
+        index.bulk_load(ids, lats, lons)
+        return index
+
+    @classmethod
+    def from_firestore(cls, collection: str = COLLECTION_NAME, bits: int = CELL_BITS) -> "GeohashGridIndex":
+        """Bulk-loads expense records from a Firestore collection."""
+        from google.cloud import firestore
+
+        from .firestore_tool import get_firestore_client
+
+        query = get_firestore_client().collection(collection).select(
+            ["geoPoint", "geoInfo", "geo_coordinates"]
+        )
+        ids, lats, lons = [], [], []
+        for doc in query.stream():
+            data = doc.to_dict() or {}
+            point = data.get("geoPoint")
+            if isinstance(point, firestore.GeoPoint):
+                latitude, longitude = point.latitude, point.longitude
+            else:
+                point = normalize_geo_info(data.get("geoInfo") or data).get("geoPoint")
+                if not point:
+                    continue
+                longitude, latitude = point["coordinates"]
+            ids.append(doc.id)
+            lats.append(latitude)
+            lons.append(longitude)
+        index = cls(bits=bits, capacity=max(1, len(ids)))
+        index.bulk_load(ids, lats, lons)
+        return index
+
+
+def _brute_force_radius(lats, lons, lat, lon, radius_m):
+    distances = haversine_m(lat, lon, lats, lons)
+    return np.flatnonzero(distances <= radius_m)
+
+
+def benchmark(records: int = 1_000_000, queries: int = 1000, radius_m: float = 100.0, k: int = 10):
+    """Compares grid radius and k-NN queries against a brute-force scan."""
+    rng = np.random.default_rng(0)
+    lats = 12.97 + rng.uniform(-0.3, 0.3, records)
+    lons = 77.59 + rng.uniform(-0.3, 0.3, records)
+
+    start = time.perf_counter()
+    index = GeohashGridIndex(capacity=records)
+    index.bulk_load(np.arange(records), lats, lons)
+    print(f"Bulk loaded {records} records in {time.perf_counter() - start:.2f} s")
+
+    query_lats = 12.97 + rng.uniform(-0.3, 0.3, queries)
+    query_lons = 77.59 + rng.uniform(-0.3, 0.3, queries)
+
+    start = time.perf_counter()
+    grid_results = [
+        sorted(i for i, _ in index.query_radius(la, lo, radius_m))
+        for la, lo in zip(query_lats, query_lons)
+    ]
+    grid_time = (time.perf_counter() - start) / queries
+
+    brute_queries = min(queries, 50)
+    start = time.perf_counter()
+    brute_results = [
+        sorted(_brute_force_radius(lats, lons, la, lo, radius_m).tolist())
+        for la, lo in zip(query_lats[:brute_queries], query_lons[:brute_queries])
+    ]
+    brute_time = (time.perf_counter() - start) / brute_queries
+
+    assert grid_results[:brute_queries] == brute_results, "grid and brute force disagree"
+    print(
+        f"Radius {radius_m}m: grid {grid_time * 1000:.3f} ms/query, "
+        f"brute force {brute_time * 1000:.3f} ms/query ({brute_time / grid_time:.0f}x)"
+    )
+
+    start = time.perf_counter()
+    for la, lo in zip(query_lats, query_lons):
+        index.query_knn(la, lo, k)
+    knn_time = (time.perf_counter() - start) / queries
+    print(f"{k}-NN: grid {knn_time * 1000:.3f} ms/query")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the geohash grid spatial index.")
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--radius", type=float, default=100.0)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+    benchmark(args.records, args.queries, args.radius, args.k)
+
+
+# Run the benchmark with:
+#   python -m location_agent.spatial_index --records 1000000
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,20 @@ import json
 import uuid
 from datetime import datetime
 import os
+import sys
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialized within a process.
+    fcntl = None
+
+# `python app.py` runs from src/invoice_gen; the repository root has to be
+# importable for src.pass_generator_1 and location_agent.
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
 
 app = Flask(__name__)
 
@@ -11,15 +25,71 @@ SETTINGS_FILE = 'settings.json'
 
 dotenv.load_dotenv()
 
+
+class SettingsStore:
+    """
+    Caches the parsed settings file and re-reads it only when its mtime,
+    inode or size changes, e.g. after another worker process saved it.
+
+    Saves write a temporary file in the same directory and os.replace it
+    over the settings file, so readers see either the old or the new file,
+    never a partial one. Writers are serialized by a thread lock and, across
+    processes, by an exclusive lock on a sidecar .lock file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._settings = None
+        self._signature = None
+
+    def _stat_signature(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+    def load(self):
+        signature = self._stat_signature()
+        if signature is None:
+            return {}
+        with self._lock:
+            if signature != self._signature:
+                with open(self.path, 'r') as f:
+                    self._settings = json.load(f)
+                self._signature = signature
+            # Callers get their own copy so they cannot change the cache.
+            return dict(self._settings)
+
+    def save(self, settings):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with self._lock, open(self.path + '.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.settings-', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(settings, f, indent=4)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            self._settings = dict(settings)
+            self._signature = self._stat_signature()
+
+
+settings_store = SettingsStore(SETTINGS_FILE)
+
+
 def load_settings():
-    if os.path.exists(SETTINGS_FILE):
-        with open(SETTINGS_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+    return settings_store.load()
 
 def save_settings(settings):
-    with open(SETTINGS_FILE, 'w') as f:
-        json.dump(settings, f, indent=4)
+    settings_store.save(settings)
 
 @app.route('/')
 def index():
@@ -80,6 +150,24 @@ def generate_invoice():
     with open(invoice_filepath, 'w') as f:
         json.dump(invoice, f, indent=4)
 
+    # Record the expense against the buyer so their location histogram stays current
+    uid = request.form.get('uid', '').strip()
+    if uid and os.environ.get('MONGO_URI'):
+        from location_agent.location_histogram import ingest_expense
+        try:
+            ingest_expense({
+                'uid': uid,
+                'invoiceId': invoice['id'],
+                'timestamp': invoice['timestamp'],
+                'amount': invoice['gross_amount'],
+                'geoInfo': json.dumps({
+                    'location': invoice['store_address'],
+                    **invoice['geo_coordinates']
+                })
+            })
+        except Exception as e:
+            print(f"Could not record expense for user '{uid}': {e}")
+
     # Call the function to create a wallet pass
     # from src.pass_generator.wallet_pass import create_wallet_pass_from_invoice
     # wallet_pass_response = create_wallet_pass_from_invoice(invoice)
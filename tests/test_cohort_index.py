@@ -0,0 +1,49 @@
+from location_agent.cohort_index import GENDERS, CohortIndex
+
+
+def user(uid, age, latitude, longitude, gender="female"):
+    return {
+        "uid": uid,
+        "age": age,
+        "gender": gender,
+        "geoPoint": {"type": "Point", "coordinates": [longitude, latitude]},
+    }
+
+
+def make_index():
+    index = CohortIndex(capacity=2)
+    index.bulk_load(
+        user(f"user-{i}", 20 + i, 12.97 + 0.001 * i, 77.59, GENDERS[i % 2])
+        for i in range(6)
+    )
+    return index
+
+
+def test_removed_users_leave_the_cohort():
+    index = make_index()
+    assert index.remove(["user-2", "user-0", "missing"]) == 2
+
+    assert len(index) == 4
+    assert sorted(index.rows) == ["user-1", "user-3", "user-4", "user-5"]
+    assert all(index.uids[row] == uid for uid, row in index.rows.items())
+    cohort = [uid for uid, _ in index.query("user-1", k=10, latitude=12.97, longitude=77.59)]
+    assert sorted(cohort) == ["user-3", "user-4", "user-5"]
+    assert sum(len(rows) for rows in index.partitions.values()) == 4
+
+
+def test_rows_moved_by_remove_keep_their_features():
+    index = make_index()
+    before = [match for match in index.query("user-5", k=10) if match[0] != "user-1"]
+    index.remove(["user-1"])
+    # user-5 was the last row and now fills user-1's row.
+    assert index.rows["user-5"] == 1
+    assert index.query("user-5", k=10) == before
+
+
+def test_removed_user_can_be_added_again():
+    index = make_index()
+    index.remove(["user-3"])
+    index.upsert(user("user-3", 23, 12.973, 77.59, GENDERS[1]))
+    assert len(index) == 6
+    assert index.uids[index.rows["user-3"]] == "user-3"
+    assert index.query("user-3", k=1)
@@ -0,0 +1,88 @@
+import pytest
+
+from location_agent import firestore_cache
+from location_agent.firestore_cache import DocumentCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(firestore_cache, "time", clock)
+    return clock
+
+
+def make_document(document_id, **data):
+    return {"id": document_id, "data": data}
+
+
+def test_miss_then_hit(clock):
+    cache = DocumentCache()
+    assert cache.get("users", "u1") is None
+
+    cache.put("users", "u1", make_document("u1", name="Asha"))
+    assert cache.get("users", "u1") == make_document("u1", name="Asha")
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_get_returns_a_copy(clock):
+    cache = DocumentCache()
+    document = make_document("u1", tags=["a"])
+    cache.put("users", "u1", document)
+    document["data"]["tags"].append("changed by the writer")
+
+    first = cache.get("users", "u1")
+    first["data"]["tags"].append("changed by a reader")
+
+    assert cache.get("users", "u1") == make_document("u1", tags=["a"])
+
+
+def test_entries_expire_after_the_collection_ttl(clock):
+    cache = DocumentCache(default_ttl=10, collection_ttls={"users": 60})
+    cache.put("users", "u1", make_document("u1"))
+    cache.put("bills", "b1", make_document("b1"))
+
+    clock.now += 30
+    assert cache.get("bills", "b1") is None
+    assert cache.get("users", "u1") is not None
+
+    clock.now += 30
+    assert cache.get("users", "u1") is None
+    assert cache.stats()["expirations"] == 2
+
+
+def test_invalidate_one_document_or_a_collection(clock):
+    cache = DocumentCache()
+    for document_id in ("b1", "b2"):
+        cache.put("bills", document_id, make_document(document_id))
+    cache.put("users", "u1", make_document("u1"))
+
+    cache.invalidate("bills", "b1")
+    assert cache.get("bills", "b1") is None
+    assert cache.get("bills", "b2") is not None
+
+    cache.invalidate("bills")
+    assert cache.get("bills", "b2") is None
+    assert cache.get("users", "u1") is not None
+    assert cache.stats()["invalidations"] == 2
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = DocumentCache(max_entries=2)
+    cache.put("bills", "b1", make_document("b1"))
+    cache.put("bills", "b2", make_document("b2"))
+    cache.get("bills", "b1")
+    cache.put("bills", "b3", make_document("b3"))
+
+    assert not cache.contains("bills", "b2")
+    assert cache.contains("bills", "b1") and cache.contains("bills", "b3")
+    assert cache.stats()["evictions"] == 1
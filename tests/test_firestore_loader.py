@@ -0,0 +1,144 @@
+import datetime
+
+from user_query import firestore_loader
+from user_query.firestore_loader import FirestoreRecordLoader
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeMetadataCollection:
+    """In-memory item_metadata for one user, queried like _metadata_pages."""
+
+    def __init__(self):
+        self.docs = {}
+        self.queries = []
+
+    def write(self, doc_id, timestamp):
+        self.docs[doc_id] = {
+            "username": "asha",
+            "timestamp": timestamp,
+            "updated_at": datetime.datetime.utcnow(),
+        }
+
+    def pages(self, _username, field, since):
+        self.queries.append(field)
+        page = [
+            FakeSnapshot(doc_id, data)
+            for doc_id, data in sorted(self.docs.items())
+            if data[field] >= since
+        ]
+        return [page] if page else []
+
+
+class FakeQuery:
+    """
+    An ordered Firestore query over snapshots. Like Firestore, start_after
+    needs the order-by field in the cursor snapshot.
+    """
+
+    def __init__(self, snapshots, field, fields=None, after=None, limit=None):
+        self.snapshots = snapshots
+        self.field = field
+        self.fields = fields
+        self.after = after
+        self._limit = limit
+
+    def _copy(self, **changes):
+        state = dict(fields=self.fields, after=self.after, limit=self._limit)
+        state.update(changes)
+        return FakeQuery(self.snapshots, self.field, **state)
+
+    def select(self, fields):
+        return self._copy(fields=list(fields))
+
+    def start_after(self, snapshot):
+        values = snapshot.to_dict()
+        if self.field not in values:
+            raise ValueError(f"Cursor snapshot is missing the order-by field '{self.field}'")
+        return self._copy(after=(values[self.field], snapshot.id))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def stream(self):
+        ordered = sorted(self.snapshots, key=lambda s: (s.to_dict()[self.field], s.id))
+        if self.after is not None:
+            ordered = [s for s in ordered if (s.to_dict()[self.field], s.id) > self.after]
+        for snapshot in ordered[: self._limit]:
+            data = snapshot.to_dict()
+            yield FakeSnapshot(snapshot.id, {name: data[name] for name in self.fields if name in data})
+
+
+def make_loader(metadata):
+    loader = FirestoreRecordLoader("test-project", sync_interval_s=0, full_sync_interval_s=3600)
+    loader._metadata_pages = metadata.pages
+    loader._items = lambda ids: {doc_id: {"item_name": f"item {doc_id}"} for doc_id in ids}
+    return loader
+
+
+def days_ago(days):
+    return datetime.datetime.utcnow() - datetime.timedelta(days=days)
+
+
+def test_incremental_sync_catches_back_dated_receipts():
+    metadata = FakeMetadataCollection()
+    metadata.write("recent", days_ago(1))
+    loader = make_loader(metadata)
+    assert [r["documentId"] for r in loader.load("asha")] == ["recent"]
+
+    # Uploaded now, but dated before the newest record already held.
+    metadata.write("backdated", days_ago(10))
+    records = loader.load("asha")
+    assert [r["documentId"] for r in records] == ["recent", "backdated"]
+    assert metadata.queries == ["timestamp", firestore_loader.UPDATED_FIELD]
+
+
+def test_full_sync_drops_deleted_documents():
+    metadata = FakeMetadataCollection()
+    metadata.write("kept", days_ago(1))
+    metadata.write("deleted", days_ago(2))
+    loader = make_loader(metadata)
+    assert len(loader.load("asha")) == 2
+
+    del metadata.docs["deleted"]
+    assert len(loader.load("asha")) == 2
+    assert [r["documentId"] for r in loader.load("asha", force=True)] == ["kept"]
+
+
+def test_records_outside_the_window_are_dropped():
+    metadata = FakeMetadataCollection()
+    metadata.write("old", days_ago(200))
+    metadata.write("recent", days_ago(1))
+    loader = make_loader(metadata)
+    loader.load("asha")
+
+    metadata.write("old", days_ago(200))
+    assert [r["documentId"] for r in loader.load("asha")] == ["recent"]
+
+
+def test_incremental_sync_pages_past_the_first_page():
+    metadata = FakeMetadataCollection()
+    for i in range(7):
+        metadata.write(f"doc-{i}", days_ago(1 + i))
+    loader = make_loader(metadata)
+    loader.load("asha")
+
+    for i in range(7, 12):
+        metadata.write(f"doc-{i}", days_ago(1 + i))
+    snapshots = [FakeSnapshot(doc_id, data) for doc_id, data in metadata.docs.items()]
+    loader.page_size = 2
+    loader._metadata_pages = FirestoreRecordLoader._metadata_pages.__get__(loader)
+    loader._metadata_query = lambda _username, field, since: FakeQuery(
+        [s for s in snapshots if s.to_dict()[field] >= since], field
+    )
+
+    records = loader.load("asha")
+    assert sorted(r["documentId"] for r in records) == sorted(f"doc-{i}" for i in range(12))
+    assert firestore_loader.UPDATED_FIELD not in records[0]["metadata"]
@@ -0,0 +1,48 @@
+import threading
+
+from location_agent import mongo_geo_tool
+from location_agent.spatial_index import GeohashGridIndex
+
+HOME = (12.9116, 77.6389)
+
+
+def expense(uid, location=HOME):
+    return {"uid": uid, "geoPoint": {"type": "Point", "coordinates": [location[1], location[0]]}}
+
+
+def test_stale_index_is_rebuilt_without_blocking_readers(monkeypatch):
+    scanning, release = threading.Event(), threading.Event()
+
+    def from_mongo(id_field):
+        scanning.set()
+        assert release.wait(5)
+        index = GeohashGridIndex()
+        index.insert("scanned", *HOME)
+        return index
+
+    old = GeohashGridIndex()
+    old.insert("old", *HOME)
+    monkeypatch.setattr(GeohashGridIndex, "from_mongo", staticmethod(from_mongo))
+    monkeypatch.setattr(mongo_geo_tool, "_local_index", old)
+    monkeypatch.setattr(mongo_geo_tool, "_local_index_loaded_at", 0.0)
+    monkeypatch.setattr(mongo_geo_tool, "LOCAL_INDEX_TTL_S", 60.0)
+
+    reloaded = []
+    reloader = threading.Thread(
+        target=lambda: reloaded.append(mongo_geo_tool.get_local_spatial_index())
+    )
+    reloader.start()
+    assert scanning.wait(5)
+
+    # While the scan runs, other callers get the current index at once and
+    # new expenses still reach it.
+    assert mongo_geo_tool.get_local_spatial_index() is old
+    mongo_geo_tool.record_local_expense(expense("during"))
+    release.set()
+    reloader.join(5)
+
+    fresh = reloaded[0]
+    assert fresh is not old
+    assert mongo_geo_tool.get_local_spatial_index() is fresh
+    assert {uid for uid, _ in fresh.query_radius(*HOME, 50)} == {"scanned", "during"}
+    assert {uid for uid, _ in old.query_radius(*HOME, 50)} == {"old", "during"}
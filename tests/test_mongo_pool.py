@@ -0,0 +1,18 @@
+from location_agent import mongo_pool
+
+URI = "mongodb://localhost:1"
+
+
+def test_health_thread_restarts_after_close(monkeypatch):
+    monkeypatch.setattr(mongo_pool, "HEALTH_CHECK_INTERVAL_S", 60.0)
+    first = mongo_pool.get_mongo_client(URI)
+    mongo_pool.close_mongo_clients()
+    assert not mongo_pool._clients
+
+    second = mongo_pool.get_mongo_client(URI)
+    try:
+        assert second is not first
+        assert mongo_pool._health_thread.is_alive()
+        assert not mongo_pool._stop_event.is_set()
+    finally:
+        mongo_pool.close_mongo_clients()
@@ -0,0 +1,43 @@
+import datetime
+
+from location_agent import cohort_index, mongo_personal_probability_tool
+from location_agent.notification_engine import LocationEvent, score_events
+from location_agent.personal_probability_model import TIMEZONE
+
+HOME = (12.9116, 77.6389)
+OFFICE = (12.9352, 77.6245)
+
+
+class FakeIndex:
+    def query(self, uid, k, latitude, longitude):
+        return [(f"{uid}-peer", 1.0), ("shared-peer", 1.0)]
+
+
+def test_cohorts_are_looked_up_once_per_location(monkeypatch):
+    buyer_queries = []
+
+    def fetch_buyers_near(latitude, longitude, radius_m, uids):
+        buyer_queries.append(((latitude, longitude), sorted(uids)))
+        return {"shared-peer"}
+
+    monkeypatch.setattr(cohort_index, "get_cohort_index", FakeIndex)
+    monkeypatch.setattr(cohort_index, "fetch_buyers_near", fetch_buyers_near)
+    monkeypatch.setattr(
+        mongo_personal_probability_tool, "fetch_location_probabilities", lambda pairs: {}
+    )
+
+    evening = datetime.datetime(2025, 7, 20, 19, 0, tzinfo=TIMEZONE).timestamp()
+    events = [
+        LocationEvent("asha", "Indiranagar", evening, *HOME),
+        LocationEvent("ravi", "Indiranagar", evening, *HOME),
+        LocationEvent("asha", "Koramangala", evening, *OFFICE),
+        LocationEvent("meera", "Jayanagar", evening),
+    ]
+    results = score_events(events)
+
+    assert buyer_queries == [
+        (HOME, ["asha-peer", "ravi-peer", "shared-peer"]),
+        (OFFICE, ["asha-peer", "shared-peer"]),
+    ]
+    assert [r["public_probability"] for r in results] == [0.5, 0.5, 0.5, None]
+    assert {r["hour"] for r in results} == {19}
@@ -0,0 +1,55 @@
+import datetime
+
+import pytest
+
+from location_agent.personal_probability_model import (
+    TIMEZONE,
+    UserHistory,
+    score_candidates,
+)
+
+HOME = (12.9116, 77.6389)
+
+
+def daily_habit(days=50, hour=19, location=HOME):
+    today = datetime.datetime.now(TIMEZONE).replace(hour=hour, minute=0, second=0, microsecond=0)
+    docs = [
+        {
+            "timestamp": (today - datetime.timedelta(days=day)).isoformat(),
+            "geoPoint": {"type": "Point", "coordinates": [location[1], location[0]]},
+            "amount": 120.0,
+        }
+        for day in range(1, days + 1)
+    ]
+    return UserHistory.from_documents(docs), today
+
+
+def test_daily_habit_scores_above_the_decision_threshold():
+    history, today = daily_habit()
+    score = score_candidates(history, [HOME[0]], [HOME[1]], [today.timestamp()])[0]
+    assert score > 0.9
+
+
+def test_scores_fall_away_from_the_habit():
+    history, today = daily_habit()
+    far_away = score_candidates(history, [HOME[0] + 0.05], [HOME[1]], [today.timestamp()])[0]
+    wrong_hour = score_candidates(
+        history, [HOME[0]], [HOME[1]], [(today - datetime.timedelta(hours=9)).timestamp()]
+    )[0]
+    assert far_away < 0.01
+    assert wrong_hour < 0.01
+
+
+def test_history_and_candidates_use_the_same_timezone():
+    # 13:30 UTC is 19:00 in Asia/Kolkata, the default TIMEZONE.
+    history, today = daily_habit()
+    utc_time = today.astimezone(datetime.timezone.utc)
+    score = score_candidates(history, [HOME[0]], [HOME[1]], [utc_time.timestamp()])[0]
+    assert score == pytest.approx(
+        score_candidates(history, [HOME[0]], [HOME[1]], [today.timestamp()])[0]
+    )
+
+    history_in_utc = UserHistory.from_documents(
+        [{"timestamp": utc_time.isoformat(), "geoPoint": {"type": "Point", "coordinates": [HOME[1], HOME[0]]}}]
+    )
+    assert history_in_utc.hours[0] == pytest.approx(19.0)
@@ -0,0 +1,67 @@
+import datetime
+
+from user_query.retrieval import RecordIndex, parse_time_range
+
+NOW = datetime.datetime(2025, 7, 20, 12, 0)
+
+
+def record(doc_id, item_name, store_type, timestamp):
+    return {
+        "documentId": doc_id,
+        "metadata": {
+            "timestamp": timestamp,
+            "additionalInfo": {"store_type": store_type},
+            "tags": [],
+        },
+        "item": {"item_name": item_name, "item_type": store_type},
+    }
+
+
+RECORDS = [
+    record("d1", "Paracetamol", "pharmacy", "2025-07-10T10:00:00"),
+    record("d2", "Cough syrup", "pharmacy", "2025-06-02T18:30:00"),
+    record("d3", "Basmati rice", "grocery", "2025-07-15T09:00:00"),
+    record("d4", "Milk", "grocery", "2025-07-18T08:00:00"),
+]
+
+
+def ids(records):
+    return [r["documentId"] for r in records]
+
+
+def test_may_as_a_verb_is_not_a_month():
+    assert parse_time_range("May I see my pharmacy bills?", NOW) is None
+    assert parse_time_range("Can you show what I may have spent?", NOW) is None
+    results = RecordIndex(RECORDS).search("May I see my pharmacy bills?", now=NOW)
+    assert ids(results) == ["d1", "d2"]
+
+
+def test_month_names_next_to_a_day_year_or_in():
+    assert parse_time_range("bills in May", NOW) == (
+        datetime.datetime(2025, 5, 1),
+        datetime.datetime(2025, 6, 1),
+    )
+    assert parse_time_range("groceries in march 2024", NOW) == (
+        datetime.datetime(2024, 3, 1),
+        datetime.datetime(2024, 4, 1),
+    )
+    assert parse_time_range("what did I buy on 2nd june", NOW) == (
+        datetime.datetime(2025, 6, 2),
+        datetime.datetime(2025, 6, 3),
+    )
+
+
+def test_empty_time_range_falls_back_to_all_records():
+    results = RecordIndex(RECORDS).search("pharmacy bills in January", now=NOW)
+    assert ids(results) == ["d1", "d2"]
+
+
+def test_non_latin_query_is_not_capped_at_top_n():
+    query = "मेरी दवाइयों पर कितना खर्च हुआ?"
+    results = RecordIndex(RECORDS).search(query, top_n=2, now=NOW)
+    assert ids(results) == ["d4", "d3", "d1", "d2"]
+
+
+def test_token_budget_still_applies_without_a_match():
+    results = RecordIndex(RECORDS).search("என் செலவுகள்", top_n=2, token_budget=1, now=NOW)
+    assert ids(results) == ["d4"]
@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+
+from user_query.tts import AudioCache, SpeechPipeline, split_sentences
+
+TEXT = (
+    "Your pharmacy bills this month add up to 1,240 rupees. "
+    "The largest was 620 rupees at Apollo Pharmacy on the 3rd. "
+    "You also bought cough syrup twice, for 180 rupees in total."
+)
+
+
+class FakeTTSClient:
+    """Returns the text as audio bytes; later sentences are synthesized faster."""
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def synthesize(self, _client, text, lang_code, _voice_name):
+        with self._lock:
+            self.calls.append(text)
+            order = len(self.calls)
+        if self.fail_on and self.fail_on in text:
+            raise RuntimeError("synthesis failed")
+        time.sleep(0.05 / order)
+        return f"{lang_code}:{text}".encode()
+
+
+def make_pipeline(client, cache=None):
+    played = []
+    pipeline = SpeechPipeline(
+        client, player=played.append, cache=cache, synthesize_fn=client.synthesize, workers=3
+    )
+    return pipeline, played
+
+
+def test_chunks_play_in_sentence_order():
+    client = FakeTTSClient()
+    pipeline, played = make_pipeline(client)
+
+    result = pipeline.speak(TEXT, "en-US")
+
+    chunks = split_sentences(TEXT)
+    assert result["chunks"] == len(chunks) > 1
+    assert played == [f"en-US:{chunk}".encode() for chunk in chunks]
+    assert result["first_audio_s"] <= result["total_s"]
+
+
+def test_repeated_answer_is_served_from_the_cache(tmp_path):
+    client = FakeTTSClient()
+    pipeline, played = make_pipeline(client, cache=AudioCache(str(tmp_path)))
+    chunks = len(split_sentences(TEXT))
+
+    pipeline.speak(TEXT, "en-US")
+    pipeline.speak(TEXT, "en-US")
+    assert len(client.calls) == chunks
+    assert pipeline.cache.stats()["hits"] == chunks
+    assert pipeline.cache.stats()["misses"] == chunks
+    assert played[:chunks] == played[chunks:]
+
+    # Another language is a different cache entry.
+    pipeline.speak(TEXT, "hi-IN")
+    assert len(client.calls) == 2 * chunks
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    client = FakeTTSClient()
+    make_pipeline(client, cache=AudioCache(str(tmp_path)))[0].speak(TEXT, "en-US")
+
+    pipeline, played = make_pipeline(client, cache=AudioCache(str(tmp_path)))
+    pipeline.speak(TEXT, "en-US")
+    assert len(client.calls) == len(split_sentences(TEXT))
+    assert pipeline.cache.stats()["misses"] == 0
+
+
+def test_synthesis_error_stops_playback_and_is_raised():
+    chunks = split_sentences(TEXT)
+    client = FakeTTSClient(fail_on=chunks[1])
+    cache = AudioCache(None)
+    pipeline, played = make_pipeline(client, cache=cache)
+
+    with pytest.raises(RuntimeError, match="synthesis failed"):
+        pipeline.speak(TEXT, "en-US")
+
+    assert played == [f"en-US:{chunks[0]}".encode()]
+    # The failed chunk is not cached, so the next attempt synthesizes it again.
+    client.fail_on = None
+    pipeline.speak(TEXT, "en-US")
+    assert client.calls.count(chunks[1]) == 2
@@ -0,0 +1,45 @@
+import numpy as np
+
+from user_query.vad import SAMPLE_RATE, VoiceActivitySegmenter
+
+FRAME_LEN = SAMPLE_RATE * 30 // 1000
+rng = np.random.default_rng(0)
+
+
+def noise(frames, level=30.0):
+    return [rng.normal(0, level, FRAME_LEN).astype(np.int16) for _ in range(frames)]
+
+
+def speech(frames, amplitude=3000.0):
+    t = np.arange(frames * FRAME_LEN) / SAMPLE_RATE
+    samples = (amplitude * np.sin(2 * np.pi * 200 * t)).astype(np.int16)
+    return list(samples.reshape(frames, FRAME_LEN))
+
+
+def run(frames):
+    segmenter = VoiceActivitySegmenter(frame_ms=30, trailing_silence_ms=300)
+    for frame in frames:
+        if segmenter.feed(frame):
+            break
+    return segmenter
+
+
+def test_speech_after_a_quiet_lead_in():
+    segmenter = run(noise(20) + speech(20) + noise(20))
+    assert segmenter.end_reason == "silence"
+    assert segmenter.has_speech
+
+
+def test_speech_from_the_first_frame():
+    segmenter = run(speech(20) + noise(20))
+    assert segmenter.end_reason == "silence"
+    assert segmenter.speech_start == 0
+
+
+def test_only_noise_times_out():
+    segmenter = VoiceActivitySegmenter(frame_ms=30, no_speech_timeout_s=0.6)
+    for frame in noise(40, level=80.0):
+        if segmenter.feed(frame):
+            break
+    assert segmenter.end_reason == "no_speech"
+    assert len(segmenter.audio()) == 0
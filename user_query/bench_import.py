@@ -0,0 +1,71 @@
+import os
+import re
+import subprocess
+import sys
+
+# Import-time regression guard for user_query.user_query.
+#
+# Run from the repository root:
+#   python -m user_query.bench_import
+#
+# Exits non-zero if importing the module pulls in any of the lazily loaded
+# client/audio libraries, or takes longer than IMPORT_BUDGET_MS.
+
+MODULE = "user_query.user_query"
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "500"))
+LAZY_MODULES = (
+    "vertexai",
+    "google.cloud.texttospeech",
+    "google.cloud.firestore",
+    "sounddevice",
+    "simpleaudio",
+    "scipy.io.wavfile",
+    "grpc",
+    "numpy",
+)
+
+_LINE_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(module=MODULE):
+    """Returns [(module, self_us, cumulative_us)] from `python -X importtime`."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=root, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            rows.append((match.group(4), int(match.group(1)), int(match.group(2))))
+    return rows
+
+
+def main():
+    rows = measure()
+    cumulative = {name: cum for name, _, cum in rows}
+    total_ms = cumulative.get(MODULE, 0) / 1000
+    print(f"import {MODULE}: {total_ms:.1f} ms (budget {IMPORT_BUDGET_MS:.0f} ms)")
+    print("Slowest imports (cumulative):")
+    for name, _, cum in sorted(rows, key=lambda row: row[2], reverse=True)[:10]:
+        print(f"  {cum / 1000:8.1f} ms  {name}")
+
+    eager = sorted(
+        name for name in cumulative
+        if any(name == lazy or name.startswith(lazy + ".") for lazy in LAZY_MODULES)
+    )
+    failed = False
+    if eager:
+        print(f"FAIL: imported eagerly: {', '.join(eager)}")
+        failed = True
+    if total_ms > IMPORT_BUDGET_MS:
+        print(f"FAIL: import took {total_ms:.1f} ms, over the {IMPORT_BUDGET_MS:.0f} ms budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
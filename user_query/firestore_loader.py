@@ -0,0 +1,230 @@
+import datetime
+import os
+import threading
+import time
+
+# Loads a user's recent purchase records from Firestore in the
+# [{documentId, metadata, item}] shape fetch_firestore_data returns.
+# A full sync reads the whole window page by page. In between, incremental
+# syncs only read documents written since the last sync, by their write-time
+# field, and merge them into a per-user in-process cache. Deletions are only
+# seen by the next full sync.
+
+# === CONFIG ===
+METADATA_COLLECTION = os.getenv("USER_QUERY_METADATA_COLLECTION", "item_metadata")
+# Item documents share their id with the metadata document they belong to.
+ITEMS_COLLECTION = os.getenv("USER_QUERY_ITEMS_COLLECTION", "items")
+USER_FIELD = os.getenv("USER_QUERY_USER_FIELD", "username")
+# Stored as a Firestore timestamp, so the window can be a range query.
+TIMESTAMP_FIELD = "timestamp"
+# Set to SERVER_TIMESTAMP by every write, so incremental syncs also catch
+# back-dated receipts and edits. Empty disables incremental syncs.
+UPDATED_FIELD = os.getenv("USER_QUERY_UPDATED_FIELD", "updated_at")
+WINDOW_DAYS = int(os.getenv("USER_QUERY_WINDOW_DAYS", "90"))
+PAGE_SIZE = int(os.getenv("USER_QUERY_PAGE_SIZE", "300"))
+# Calls within this many seconds of the last sync are served from the cache.
+SYNC_INTERVAL_S = float(os.getenv("USER_QUERY_SYNC_INTERVAL_S", "30"))
+# The whole window is re-read this often, which drops deleted documents.
+FULL_SYNC_INTERVAL_S = float(os.getenv("USER_QUERY_FULL_SYNC_INTERVAL_S", "900"))
+# Incremental syncs re-read this much before the previous sync started, to
+# cover clock skew between this host and Firestore's server timestamps.
+CURSOR_OVERLAP_S = 60.0
+GET_ALL_BATCH_SIZE = 300
+METADATA_FIELDS = [USER_FIELD, TIMESTAMP_FIELD, "gstNumber", "additionalInfo", "tags"]
+ITEM_FIELDS = ["item_name", "item_type", "quantity", "price", "validity"]
+
+_client_lock = threading.Lock()
+_client = None
+
+
+def get_firestore_client(project_id):
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from google.cloud import firestore
+                _client = firestore.Client(project=project_id)
+    return _client
+
+
+def _reset_after_fork():
+    # gRPC channels cannot be shared with a forked child.
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _utc(value):
+    """Returns value as a naive UTC datetime, or None."""
+    if isinstance(value, str):
+        try:
+            value = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime.datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _json_safe(value):
+    if isinstance(value, dict):
+        return {key: _json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(item) for item in value]
+    if isinstance(value, datetime.datetime):
+        return _utc(value).isoformat()
+    if hasattr(value, "latitude") and hasattr(value, "longitude"):
+        return {"latitude": value.latitude, "longitude": value.longitude}
+    return value
+
+
+class UserRecordCache:
+    """Records held for one user, keyed by documentId."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records = {}
+        # Wall-clock UTC start of the last sync, minus CURSOR_OVERLAP_S.
+        self.cursor = None
+        self.synced_at = 0.0
+        self.full_synced_at = 0.0
+
+
+class FirestoreRecordLoader:
+    """
+    Windowed, paginated and incremental loader of a user's records.
+
+    Args:
+        project_id: The GCP project of the Firestore database.
+        window_days: Only records from the last window_days are returned.
+        page_size: Documents read per query page.
+        sync_interval_s: Minimum seconds between two syncs for a user.
+        full_sync_interval_s: Seconds between two full syncs for a user.
+    """
+
+    def __init__(
+        self,
+        project_id,
+        window_days=WINDOW_DAYS,
+        page_size=PAGE_SIZE,
+        sync_interval_s=SYNC_INTERVAL_S,
+        full_sync_interval_s=FULL_SYNC_INTERVAL_S,
+    ):
+        self.project_id = project_id
+        self.window_days = window_days
+        self.page_size = page_size
+        self.sync_interval_s = sync_interval_s
+        self.full_sync_interval_s = full_sync_interval_s
+        self.reads = 0
+        self._users_lock = threading.Lock()
+        self._users = {}
+
+    def _user(self, username):
+        with self._users_lock:
+            return self._users.setdefault(username, UserRecordCache())
+
+    def _metadata_query(self, username, field, since):
+        """Returns the query for username's metadata whose field is at or after since, ordered by field."""
+        from google.cloud.firestore_v1.base_query import FieldFilter
+
+        db = get_firestore_client(self.project_id)
+        return (
+            db.collection(METADATA_COLLECTION)
+            .where(filter=FieldFilter(USER_FIELD, "==", username))
+            .where(filter=FieldFilter(field, ">=", since.replace(tzinfo=datetime.timezone.utc)))
+            .order_by(field)
+        )
+
+    def _metadata_pages(self, username, field, since):
+        """Yields pages of metadata snapshots for username whose field is at or after since."""
+        # start_after reads the order-by field from the last snapshot, so the
+        # projection must include it.
+        fields = METADATA_FIELDS if field in METADATA_FIELDS else METADATA_FIELDS + [field]
+        query = self._metadata_query(username, field, since).select(fields)
+        cursor = None
+        while True:
+            page_query = query.start_after(cursor) if cursor is not None else query
+            page = list(page_query.limit(self.page_size).stream())
+            self.reads += len(page)
+            if page:
+                yield page
+            if len(page) < self.page_size:
+                return
+            cursor = page[-1]
+
+    def _items(self, document_ids):
+        db = get_firestore_client(self.project_id)
+        collection = db.collection(ITEMS_COLLECTION)
+        items = {}
+        for start in range(0, len(document_ids), GET_ALL_BATCH_SIZE):
+            refs = [collection.document(doc_id) for doc_id in document_ids[start : start + GET_ALL_BATCH_SIZE]]
+            for snapshot in db.get_all(refs, field_paths=ITEM_FIELDS):
+                self.reads += 1
+                if snapshot.exists:
+                    items[snapshot.id] = _json_safe(snapshot.to_dict() or {})
+        return items
+
+    def _sync(self, username, cache, full):
+        started = datetime.datetime.utcnow()
+        window_start = started - datetime.timedelta(days=self.window_days)
+        if full:
+            records = {}
+            pages = self._metadata_pages(username, TIMESTAMP_FIELD, window_start)
+        else:
+            # Documents written since the last sync, whatever their business
+            # timestamp; merged by id, so the overlap only costs reads.
+            records = cache.records
+            pages = self._metadata_pages(username, UPDATED_FIELD, cache.cursor)
+        for page in pages:
+            items = self._items([snapshot.id for snapshot in page])
+            for snapshot in page:
+                data = snapshot.to_dict() or {}
+                # The write-time field is only selected to page by.
+                metadata = _json_safe({name: data[name] for name in METADATA_FIELDS if name in data})
+                metadata["documentId"] = snapshot.id
+                item = dict(items.get(snapshot.id, {}), document_id=snapshot.id)
+                records[snapshot.id] = {"documentId": snapshot.id, "metadata": metadata, "item": item}
+
+        # Drop records that have aged out of the window.
+        for doc_id, record in list(records.items()):
+            ts = _utc(record["metadata"].get(TIMESTAMP_FIELD))
+            if ts is None or ts < window_start:
+                del records[doc_id]
+        cache.records = records
+        cache.cursor = started - datetime.timedelta(seconds=CURSOR_OVERLAP_S)
+        cache.synced_at = time.monotonic()
+        if full:
+            cache.full_synced_at = cache.synced_at
+
+    def load(self, username, force=False):
+        """
+        Returns the user's records in the window, newest first. force=True
+        re-reads the whole window.
+        """
+        cache = self._user(username)
+        with cache.lock:
+            now = time.monotonic()
+            full = (
+                force
+                or not UPDATED_FIELD
+                or not cache.full_synced_at
+                or now - cache.full_synced_at >= self.full_sync_interval_s
+            )
+            if full or now - cache.synced_at >= self.sync_interval_s:
+                self._sync(username, cache, full)
+            records = list(cache.records.values())
+        records.sort(key=lambda r: r["metadata"].get(TIMESTAMP_FIELD) or "", reverse=True)
+        return records
+
+    def invalidate(self, username=None):
+        with self._users_lock:
+            if username is None:
+                self._users.clear()
+            else:
+                self._users.pop(username, None)
@@ -0,0 +1,204 @@
+import argparse
+import os
+import re
+import time
+import unicodedata
+
+# Detects the language of a text query from its Unicode script, so text mode
+# only asks Gemini when the script alone is ambiguous (Hindi vs Marathi
+# without telling words, romanized Indian languages).
+
+# === CONFIG ===
+# Local answers below this confidence fall back to the model.
+CONFIDENCE_THRESHOLD = float(os.getenv("USER_QUERY_LANG_CONFIDENCE", "0.8"))
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lang_corpus.tsv")
+
+# Unicode blocks of the scripts used by lang_code_map's languages.
+SCRIPT_RANGES = (
+    ("Devanagari", 0x0900, 0x097F),
+    ("Bengali", 0x0980, 0x09FF),
+    ("Gujarati", 0x0A80, 0x0AFF),
+    ("Tamil", 0x0B80, 0x0BFF),
+    ("Telugu", 0x0C00, 0x0C7F),
+    ("Kannada", 0x0C80, 0x0CFF),
+    ("Malayalam", 0x0D00, 0x0D7F),
+)
+# Every script except Devanagari maps to a single language here.
+SCRIPT_LANGUAGE = {
+    "Bengali": "Bengali",
+    "Gujarati": "Gujarati",
+    "Tamil": "Tamil",
+    "Telugu": "Telugu",
+    "Kannada": "Kannada",
+    "Malayalam": "Malayalam",
+}
+
+# Common function words that tell Hindi and Marathi apart. "का" is left out:
+# it is a Hindi possessive but also the Marathi question particle.
+HINDI_WORDS = {
+    "है", "हैं", "था", "थी", "थे", "क्या", "मेरा", "मेरी", "मेरे", "मुझे", "कितना",
+    "कितने", "कितनी", "में", "और", "नहीं", "की", "के", "को", "से", "पर",
+    "किया", "गया", "गए", "दिखाओ", "बताओ", "आप", "यह", "वह", "कौन", "कब", "कहाँ",
+}
+MARATHI_WORDS = {
+    "आहे", "आहेत", "होता", "होती", "होते", "काय", "माझा", "माझी", "माझे", "मला",
+    "किती", "मध्ये", "आणि", "नाही", "केला", "केली", "केले", "झाला", "झाली", "झाले",
+    "दाखवा", "सांगा", "तुम्ही", "मी", "काही", "हा", "हे", "कोण", "केव्हा", "कुठे", "साठी",
+}
+# Suffixes and letters that are frequent in Marathi and rare in Hindi.
+MARATHI_SUFFIXES = ("च्या", "चा", "ची", "चे")
+MARATHI_LETTERS = "ळ"
+
+# Romanized Indian-language words that make Latin text ambiguous.
+ROMANIZED_WORDS = {
+    "hai", "hain", "kya", "mera", "meri", "mere", "mujhe", "kitna", "kitne", "kitni",
+    "mein", "aur", "nahi", "nahin", "ka", "ki", "ke", "ko", "se", "kiya", "gaya",
+    "dikhao", "batao", "kharcha", "kharch", "paisa", "paise", "aahe", "kay", "majha",
+    "mala", "kiti", "ani", "naahi", "enna", "evvalavu", "ennoda", "naa", "entha",
+    "emi", "nanna", "eshtu", "ente", "ethra", "amar", "koto", "maro", "ketlu",
+}
+ENGLISH_WORDS = {
+    "a", "an", "the", "my", "me", "i", "show", "list", "what", "how", "much", "many",
+    "did", "do", "does", "spend", "spent", "spends", "spending", "on", "in", "for",
+    "of", "last", "this", "month", "week", "year", "today", "yesterday", "all",
+    "total", "is", "are", "was", "were", "buy", "bought", "purchase", "purchases",
+    "medicine", "medicines", "grocery", "groceries", "pharmacy", "expense",
+    "expenses", "where", "when", "which", "summary", "summarize", "give", "tell",
+    "and", "or", "from", "to", "at", "any", "items", "item", "bill", "bills",
+}
+
+# \w would split words at vowel signs, which are combining marks.
+_DEVANAGARI_WORD_RE = re.compile(r"[\u0900-\u097F]+")
+_LATIN_WORD_RE = re.compile(r"[a-z]+")
+
+
+def _script(ch):
+    code = ord(ch)
+    for name, low, high in SCRIPT_RANGES:
+        if low <= code <= high:
+            return name
+    if ch.isascii() and ch.isalpha():
+        return "Latin"
+    return None
+
+
+def script_counts(text):
+    """Counts the letters of each script in text, ignoring digits and punctuation."""
+    counts = {}
+    for ch in unicodedata.normalize("NFC", str(text)):
+        script = _script(ch)
+        if script is not None:
+            counts[script] = counts.get(script, 0) + 1
+    return counts
+
+
+def _hindi_or_marathi(text):
+    hindi = marathi = 0
+    for word in _DEVANAGARI_WORD_RE.findall(text):
+        if word in HINDI_WORDS:
+            hindi += 1
+        elif word in MARATHI_WORDS:
+            marathi += 1
+        elif len(word) > 3 and word.endswith(MARATHI_SUFFIXES):
+            marathi += 0.5
+    marathi += sum(text.count(ch) for ch in MARATHI_LETTERS)
+    if hindi == marathi:
+        return "Hindi", 0.5
+    if hindi > marathi:
+        return "Hindi", hindi / (hindi + marathi)
+    return "Marathi", marathi / (hindi + marathi)
+
+
+def _latin_language(text):
+    words = _LATIN_WORD_RE.findall(text.lower())
+    english = sum(word in ENGLISH_WORDS for word in words)
+    romanized = sum(word in ROMANIZED_WORDS for word in words)
+    if english + romanized == 0:
+        return "English", 0.5
+    return "English", english / (english + romanized)
+
+
+def detect_script_language(text):
+    """
+    Returns (language, confidence) for text, using only its script and a few
+    function words. language is a key of lang_code_map or None when text has
+    no letters; confidence is in [0, 1].
+    """
+    counts = script_counts(text)
+    if not counts:
+        return None, 0.0
+    native = {script: n for script, n in counts.items() if script != "Latin"}
+    if not native:
+        return _latin_language(text)
+
+    # A query with native-script words is answered in that language even when
+    # it also contains English item names.
+    script = max(native, key=native.get)
+    confidence = native[script] / sum(native.values())
+    if script == "Devanagari":
+        language, split = _hindi_or_marathi(unicodedata.normalize("NFC", text))
+        return language, confidence * split
+    return SCRIPT_LANGUAGE[script], confidence
+
+
+def detect_language_local(text, threshold=CONFIDENCE_THRESHOLD):
+    """Returns the detected language, or None when the model should decide."""
+    language, confidence = detect_script_language(text)
+    return language if confidence >= threshold else None
+
+
+def load_corpus(path=CORPUS_PATH):
+    """Returns [(language, text)] from the tab-separated labeled corpus."""
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line or line.startswith("#"):
+                continue
+            language, text = line.split("\t", 1)
+            rows.append((language, text))
+    return rows
+
+
+def benchmark(path=CORPUS_PATH, threshold=CONFIDENCE_THRESHOLD, repeat=200):
+    """
+    Reports how often the local detector answers on its own, how accurate
+    those answers are, and how long one detection takes.
+    """
+    corpus = load_corpus(path)
+    local = correct = 0
+    mistakes = []
+    for expected, text in corpus:
+        language, confidence = detect_script_language(text)
+        if confidence < threshold:
+            continue
+        local += 1
+        if language == expected:
+            correct += 1
+        else:
+            mistakes.append((expected, language, round(confidence, 2), text))
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for _, text in corpus:
+            detect_script_language(text)
+    per_call_us = (time.perf_counter() - start) / (repeat * len(corpus)) * 1e6
+
+    print(f"Corpus: {len(corpus)} queries, threshold {threshold}")
+    print(f"Answered locally: {local}/{len(corpus)} ({local / len(corpus):.0%}), "
+          f"sent to the model: {len(corpus) - local}")
+    print(f"Local accuracy: {correct}/{local} ({correct / local if local else 0:.1%})")
+    print(f"Latency: {per_call_us:.1f} us per query")
+    for expected, language, confidence, text in mistakes:
+        print(f"  expected {expected}, got {language} ({confidence}): {text}")
+    return {"total": len(corpus), "local": local, "correct": correct, "latency_us": per_call_us}
+
+
+# Run the accuracy/latency benchmark with:
+#   python -m user_query.lang_detect
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark local language detection.")
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--threshold", type=float, default=CONFIDENCE_THRESHOLD)
+    args = parser.parse_args()
+    benchmark(args.corpus, args.threshold)
@@ -0,0 +1,333 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# --- Configuration ---
+# 'disk' keeps an in-memory LRU in front of a SQLite store, 'memory' keeps
+# only the LRU, 'off' disables caching.
+BACKEND = os.getenv("LLM_CACHE_BACKEND", "disk")
+SQLITE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+TTL_S = float(os.getenv("LLM_CACHE_TTL_S", str(7 * 24 * 3600)))
+MEMORY_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_MAX_ENTRIES", "1024"))
+DISK_MAX_ENTRIES = int(os.getenv("LLM_CACHE_DISK_MAX_ENTRIES", "100000"))
+DISK_MAX_BYTES = int(float(os.getenv("LLM_CACHE_DISK_MAX_MB", "256")) * 1024 * 1024)
+# -------------------
+
+
+def _config_dict(config):
+    if config is None:
+        return None
+    if hasattr(config, "to_dict"):
+        return config.to_dict()
+    return config
+
+
+def cache_key(model_name: str, generation_config, prompt: str) -> str:
+    """Content address of one call: model name, generation config and prompt."""
+    payload = json.dumps(
+        {
+            "model": model_name,
+            "config": _config_dict(generation_config),
+            "prompt_sha256": hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryTier:
+    """An in-process LRU of response texts with per-entry expiry."""
+
+    def __init__(self, max_entries: int = MEMORY_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            text, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return text
+
+    def set(self, key: str, text: str, expires_at: float):
+        with self._lock:
+            self._entries[key] = (text, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteTier:
+    """
+    A local on-disk store of response texts, shared by every process on the
+    host. Least recently used entries are evicted past max_entries or
+    max_bytes.
+    """
+
+    def __init__(
+        self,
+        path: str = SQLITE_PATH,
+        max_entries: int = DISK_MAX_ENTRIES,
+        max_bytes: int = DISK_MAX_BYTES,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, text TEXT NOT NULL, size INTEGER NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        """Returns (text, expires_at), or None."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT text, expires_at FROM responses WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        return row
+
+    def set(self, key: str, text: str, expires_at: float):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, text, size, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, text, len(text.encode("utf-8")), expires_at, now),
+            )
+            conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+            count, size = conn.execute(
+                "SELECT count(*), coalesce(sum(size), 0) FROM responses"
+            ).fetchone()
+            if count <= self.max_entries and size <= self.max_bytes:
+                return
+            # Walk entries from least recently used until both caps are met.
+            doomed = []
+            for old_key, old_size in conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at"
+            ):
+                if count <= self.max_entries and size <= self.max_bytes:
+                    break
+                doomed.append((old_key,))
+                count -= 1
+                size -= old_size
+            conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+            self.evictions += len(doomed)
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def usage(self) -> dict:
+        count, size = self._connect().execute(
+            "SELECT count(*), coalesce(sum(size), 0) FROM responses"
+        ).fetchone()
+        return {"entries": count, "bytes": size}
+
+
+class CachedResponse:
+    """Stands in for a GenerationResponse served from the cache."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def __repr__(self):
+        return f"CachedResponse(text={self.text!r})"
+
+
+class LLMResponseCache:
+    """
+    Two-tier cache of model responses keyed by cache_key().
+
+    Args:
+        memory: A MemoryTier, or None to skip the in-memory tier.
+        disk: A SqliteTier, or None to keep responses in memory only.
+        ttl: How long a response stays valid, in seconds.
+    """
+
+    def __init__(self, memory=None, disk=None, ttl: float = TTL_S):
+        self.memory = memory
+        self.disk = disk
+        self.ttl = ttl
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.saved_s = 0.0
+        self._latency = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        text = self.memory.get(key) if self.memory is not None else None
+        if text is not None:
+            self._count("memory_hits", key)
+            return text
+        row = self.disk.get(key) if self.disk is not None else None
+        if row is not None:
+            text, expires_at = row
+            if self.memory is not None:
+                self.memory.set(key, text, expires_at)
+            self._count("disk_hits", key)
+            return text
+        self._count("misses", key)
+        return None
+
+    def set(self, key: str, text: str, latency_s: float = 0.0):
+        expires_at = time.time() + self.ttl
+        if self.memory is not None:
+            self.memory.set(key, text, expires_at)
+        if self.disk is not None:
+            self.disk.set(key, text, expires_at)
+        with self._lock:
+            # Remembered so hits can report the model time they saved.
+            self._latency[key] = latency_s
+            if len(self._latency) > 4 * MEMORY_MAX_ENTRIES:
+                self._latency.clear()
+
+    def bypass(self):
+        """Counts a call that could not be cached."""
+        self._count("bypassed", None)
+
+    def _count(self, counter: str, key: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+            if counter != "misses":
+                self.saved_s += self._latency.get(key, 0.0)
+
+    def clear(self):
+        for tier in (self.memory, self.disk):
+            if tier is not None:
+                tier.clear()
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and tier sizes."""
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        stats = {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "saved_s": round(self.saved_s, 3),
+            "ttl": self.ttl,
+        }
+        if self.memory is not None:
+            stats["memory_entries"] = len(self.memory)
+            stats["memory_evictions"] = self.memory.evictions
+        if self.disk is not None:
+            usage = self.disk.usage()
+            stats["disk_entries"] = usage["entries"]
+            stats["disk_bytes"] = usage["bytes"]
+            stats["disk_evictions"] = self.disk.evictions
+        return stats
+
+
+class CachedModel:
+    """
+    Wraps a GenerativeModel so generate_content and generate_content_async
+    answer repeated text prompts from an LLMResponseCache.
+
+    Caching is opt-in per call with cache=True, so prompts carrying purchase
+    records are never persisted unless a call site asks for it. Streaming
+    calls and prompts with non-text parts (audio) always go straight to the
+    model. Every other attribute is delegated to the wrapped model.
+    """
+
+    def __init__(self, model, model_name: str, generation_config=None, cache: LLMResponseCache = None):
+        self.model = model
+        self.model_name = model_name
+        self.generation_config = generation_config
+        self.cache = cache if cache is not None else build_llm_cache()
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def _key(self, contents, kwargs, cache):
+        if not cache or kwargs.get("stream") or not isinstance(contents, str):
+            return None
+        if set(kwargs) - {"generation_config", "stream"}:
+            return None
+        config = kwargs.get("generation_config", self.generation_config)
+        return cache_key(self.model_name, config, contents)
+
+    def _store(self, key, resp, latency_s):
+        try:
+            text = resp.text
+        except ValueError:
+            # Blocked or empty responses have no text and are not cached.
+            return
+        self.cache.set(key, text, latency_s)
+
+    def generate_content(self, contents, cache: bool = False, **kwargs):
+        key = self._key(contents, kwargs, cache)
+        if key is None:
+            self.cache.bypass()
+            return self.model.generate_content(contents, **kwargs)
+        text = self.cache.get(key)
+        if text is not None:
+            return CachedResponse(text)
+        start = time.perf_counter()
+        resp = self.model.generate_content(contents, **kwargs)
+        self._store(key, resp, time.perf_counter() - start)
+        return resp
+
+    async def generate_content_async(self, contents, cache: bool = False, **kwargs):
+        key = self._key(contents, kwargs, cache)
+        if key is None:
+            self.cache.bypass()
+            return await self.model.generate_content_async(contents, **kwargs)
+        text = self.cache.get(key)
+        if text is not None:
+            return CachedResponse(text)
+        start = time.perf_counter()
+        resp = await self.model.generate_content_async(contents, **kwargs)
+        self._store(key, resp, time.perf_counter() - start)
+        return resp
+
+
+def build_llm_cache() -> LLMResponseCache:
+    """Builds the LLMResponseCache configured by the LLM_CACHE_* environment variables."""
+    if BACKEND == "off":
+        return LLMResponseCache(ttl=0)
+    disk = SqliteTier(SQLITE_PATH) if BACKEND == "disk" else None
+    return LLMResponseCache(memory=MemoryTier(), disk=disk)
@@ -0,0 +1,204 @@
+import datetime
+import json
+import math
+import os
+import re
+from collections import defaultdict
+
+# === CONFIG ===
+TOP_N = int(os.getenv("USER_QUERY_TOP_N", "50"))
+# Rough prompt budget for the records sent to the model, in tokens.
+TOKEN_BUDGET = int(os.getenv("USER_QUERY_TOKEN_BUDGET", "8000"))
+CHARS_PER_TOKEN = 4
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+_MONTHS = {
+    name: i
+    for i, names in enumerate(
+        [("jan", "january"), ("feb", "february"), ("mar", "march"), ("apr", "april"),
+         ("may",), ("jun", "june"), ("jul", "july"), ("aug", "august"),
+         ("sep", "sept", "september"), ("oct", "october"), ("nov", "november"),
+         ("dec", "december")],
+        start=1,
+    )
+    for name in names
+}
+# A month name only counts as a date next to a day, a year or "in"/"during":
+# "May I see my bills?" names no month, "in May" and "12 May 2025" do.
+_DATE_WORD_RE = re.compile(r"[a-z]+|\d+(?:st|nd|rd|th)?")
+_DAY_RE = re.compile(r"(\d{1,2})(?:st|nd|rd|th)?")
+_YEAR_RE = re.compile(r"(?:19|20)\d\d")
+_MONTH_PREFIXES = ("in", "during")
+_LAST_N_RE = re.compile(r"(?:last|past)\s+(\d+)\s+(day|week|month)s?")
+_UNIT_DAYS = {"day": 1, "week": 7, "month": 30}
+
+
+def _stem(token):
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    return [_stem(t) for t in _TOKEN_RE.findall(str(text).lower())]
+
+
+def _record_text(record):
+    metadata = record.get("metadata", {})
+    item = record.get("item", {})
+    fields = [
+        item.get("item_name", ""),
+        item.get("item_type", ""),
+        metadata.get("additionalInfo", {}).get("store_type", ""),
+        " ".join(metadata.get("tags", [])),
+    ]
+    return " ".join(str(f) for f in fields)
+
+
+def _record_time(record):
+    try:
+        ts = datetime.datetime.fromisoformat(record["metadata"]["timestamp"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    # Compare everything as naive UTC, like fetch_firestore_data's timestamps.
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def estimate_tokens(record):
+    return len(json.dumps(record)) // CHARS_PER_TOKEN + 1
+
+
+def _day(word):
+    match = _DAY_RE.fullmatch(word or "")
+    return int(match.group(1)) if match and 1 <= int(match.group(1)) <= 31 else None
+
+
+def _month_range(words, now):
+    for i, word in enumerate(words):
+        month = _MONTHS.get(word)
+        if not month:
+            continue
+        before = words[i - 1] if i > 0 else None
+        after = words[i + 1] if i + 1 < len(words) else None
+        # "12 may", "12th of may", "may 12"
+        day = _day(before)
+        if day is None and before == "of" and i > 1:
+            day = _day(words[i - 2])
+        if day is None:
+            day = _day(after)
+        year_word = next((w for w in words[i + 1 : i + 3] if _YEAR_RE.fullmatch(w)), None)
+        if day is None and year_word is None and before not in _MONTH_PREFIXES:
+            continue
+
+        if year_word:
+            year = int(year_word)
+        else:
+            year = now.year if month <= now.month else now.year - 1
+        if day is not None:
+            try:
+                start = datetime.datetime(year, month, day)
+            except ValueError:
+                pass
+            else:
+                return start, start + datetime.timedelta(days=1)
+        start = datetime.datetime(year, month, 1)
+        end = datetime.datetime(year + (month == 12), month % 12 + 1, 1)
+        return start, end
+    return None
+
+
+def parse_time_range(query, now=None):
+    """
+    Returns the (start, end) datetimes a query refers to, or None.
+    Understands today, yesterday, this/last week, this/last month,
+    last N days/weeks/months, and month names next to a day, a year or
+    "in"/"during" ("in May", "March 2025", "12th of May").
+    """
+    now = now or datetime.datetime.utcnow()
+    text = str(query).lower()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    match = _LAST_N_RE.search(text)
+    if match:
+        return now - datetime.timedelta(days=int(match.group(1)) * _UNIT_DAYS[match.group(2)]), now
+    if "yesterday" in text:
+        return today - datetime.timedelta(days=1), today
+    if "today" in text:
+        return today, now
+    if "last week" in text:
+        start = today - datetime.timedelta(days=today.weekday() + 7)
+        return start, start + datetime.timedelta(days=7)
+    if "this week" in text:
+        return today - datetime.timedelta(days=today.weekday()), now
+    first_of_month = today.replace(day=1)
+    if "last month" in text:
+        start = (first_of_month - datetime.timedelta(days=1)).replace(day=1)
+        return start, first_of_month
+    if "this month" in text:
+        return first_of_month, now
+    return _month_range(_DATE_WORD_RE.findall(text), now)
+
+
+class RecordIndex:
+    """
+    Inverted index over item_name, item_type, store_type and tags of the
+    records returned by fetch_firestore_data, plus their timestamps.
+    """
+
+    def __init__(self, records):
+        self.records = list(records)
+        self.times = [_record_time(r) for r in self.records]
+        self.postings = defaultdict(set)
+        for i, record in enumerate(self.records):
+            for token in set(tokenize(_record_text(record))):
+                self.postings[token].add(i)
+
+    def search(self, query, top_n=TOP_N, token_budget=TOKEN_BUDGET, now=None):
+        """
+        Returns the records most relevant to the query, best first, limited
+        to top_n records and token_budget estimated prompt tokens. Records
+        outside a time range named in the query are dropped, unless that
+        leaves none. When no term matches, e.g. for a query in a non-Latin
+        script, nothing can be ranked: records are returned newest first up
+        to the token budget alone, without the top_n cap.
+        """
+        time_range = parse_time_range(query, now)
+        allowed = [
+            i for i, ts in enumerate(self.times)
+            if time_range is None or (ts is not None and time_range[0] <= ts < time_range[1])
+        ]
+        if not allowed:
+            # A misread or empty time range must not hide every record.
+            allowed = list(range(len(self.records)))
+
+        scores = defaultdict(float)
+        n = len(self.records) or 1
+        for token in set(tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + n / len(postings))
+            for i in postings:
+                scores[i] += idf
+
+        matched = [i for i in allowed if scores.get(i)]
+        pool = matched or allowed
+        if not matched:
+            top_n = len(pool)
+        oldest = datetime.datetime.min
+        pool.sort(key=lambda i: (scores.get(i, 0.0), self.times[i] or oldest), reverse=True)
+
+        selected, used = [], 0
+        for i in pool[:top_n]:
+            cost = estimate_tokens(self.records[i])
+            if selected and used + cost > token_budget:
+                break
+            selected.append(self.records[i])
+            used += cost
+        return selected
+
+
+def select_candidates(query, records, top_n=TOP_N, token_budget=TOKEN_BUDGET):
+    return RecordIndex(records).search(query, top_n=top_n, token_budget=token_budget)
@@ -0,0 +1,320 @@
+import argparse
+import concurrent.futures
+import hashlib
+import io
+import os
+import re
+import threading
+import time
+import wave
+from collections import OrderedDict
+
+# Sentence-pipelined text-to-speech: the answer is split into sentences that
+# are synthesized concurrently, and sentence 1 plays while the rest are still
+# being synthesized. Synthesized audio is cached by (text, language, voice).
+
+# === CONFIG ===
+TTS_WORKERS = int(os.getenv("USER_QUERY_TTS_WORKERS", "3"))
+CACHE_DIR = os.getenv("USER_QUERY_TTS_CACHE_DIR", "tts_cache")
+CACHE_MEMORY_MB = float(os.getenv("USER_QUERY_TTS_CACHE_MEMORY_MB", "32"))
+CACHE_DISK_MB = float(os.getenv("USER_QUERY_TTS_CACHE_DISK_MB", "256"))
+# Sentences shorter than this are merged into the next one, so the pipeline
+# does not pay a request per fragment.
+MIN_CHUNK_CHARS = 40
+# Longer sentences are split at commas or spaces to keep the first chunk fast.
+MAX_CHUNK_CHARS = 300
+
+# Sentence ends in Latin and Indic scripts: . ! ? and the danda (।, ॥).
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?।॥])\s+|\n+")
+
+
+def split_sentences(text, min_chars=MIN_CHUNK_CHARS, max_chars=MAX_CHUNK_CHARS):
+    """Splits text into chunks of whole sentences for synthesis."""
+    chunks, pending = [], ""
+    for sentence in _SENTENCE_END_RE.split(str(text).strip()):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        pending = f"{pending} {sentence}".strip()
+        if len(pending) >= min_chars:
+            chunks.extend(_split_long(pending, max_chars))
+            pending = ""
+    if pending:
+        chunks.extend(_split_long(pending, max_chars))
+    return chunks
+
+
+def _split_long(sentence, max_chars):
+    parts = []
+    while len(sentence) > max_chars:
+        cut = sentence.rfind(",", 0, max_chars)
+        if cut <= 0:
+            cut = sentence.rfind(" ", 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        parts.append(sentence[: cut + 1].strip())
+        sentence = sentence[cut + 1 :].strip()
+    if sentence:
+        parts.append(sentence)
+    return parts
+
+
+def audio_cache_key(text, lang_code, voice):
+    return hashlib.sha256(f"{voice}|{lang_code}|{text}".encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """
+    Synthesized WAV audio in an in-memory LRU, backed by a directory of .wav
+    files. Both tiers are capped in bytes; the least recently used entries
+    are evicted first. Pass cache_dir=None for memory only.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, memory_mb=CACHE_MEMORY_MB, disk_mb=CACHE_DISK_MB):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = int(memory_mb * 1024 * 1024)
+        self.max_disk_bytes = int(disk_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._memory_bytes = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def get(self, key):
+        with self._lock:
+            audio = self._entries.get(key)
+            if audio is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return audio
+        if self.cache_dir:
+            try:
+                with open(self._path(key), "rb") as f:
+                    audio = f.read()
+                os.utime(self._path(key))
+            except FileNotFoundError:
+                audio = None
+        with self._lock:
+            if audio is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._remember(key, audio)
+        return audio
+
+    def put(self, key, audio):
+        self._remember(key, audio)
+        if not self.cache_dir:
+            return
+        # Write to a temporary name first so readers never see a partial file.
+        tmp = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(audio)
+        os.replace(tmp, self._path(key))
+        self._prune_disk()
+
+    def _remember(self, key, audio):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= len(old)
+            self._entries[key] = audio
+            self._memory_bytes += len(audio)
+            while self._memory_bytes > self.max_memory_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+                self.evictions += 1
+
+    def _prune_disk(self):
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".wav"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "memory_entries": len(self._entries),
+            "memory_bytes": self._memory_bytes,
+        }
+
+
+def synthesize(client, text, lang_code, voice_name=None):
+    """Returns LINEAR16 WAV bytes for text from a Text-to-Speech client."""
+    from google.cloud import texttospeech
+
+    voice = texttospeech.VoiceSelectionParams(
+        language_code=lang_code,
+        name=voice_name or "",
+        ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL,
+    )
+    audio_config = texttospeech.AudioConfig(audio_encoding=texttospeech.AudioEncoding.LINEAR16)
+    response = client.synthesize_speech(
+        input=texttospeech.SynthesisInput(text=text),
+        voice=voice,
+        audio_config=audio_config,
+    )
+    return response.audio_content
+
+
+def play_wav(audio):
+    """Plays WAV bytes on the default output device and waits until done."""
+    import simpleaudio as sa
+
+    # LINEAR16 responses are WAV files: play the frames after the header at
+    # the rate the header declares.
+    with wave.open(io.BytesIO(audio), "rb") as w:
+        frames = w.readframes(w.getnframes())
+        play_obj = sa.play_buffer(frames, w.getnchannels(), w.getsampwidth(), w.getframerate())
+    play_obj.wait_done()
+
+
+class SpeechPipeline:
+    """
+    Speaks text sentence by sentence: chunks are synthesized on a small
+    thread pool and played in order as soon as each is ready.
+
+    Args:
+        client: A Text-to-Speech client, or any object with the same
+            synthesize_speech method.
+        player: Called with each chunk's WAV bytes; must block until the
+            chunk has played. Defaults to play_wav.
+        cache: An AudioCache, or None to synthesize every time.
+        synthesize_fn: Called as synthesize_fn(client, text, lang_code,
+            voice_name) to produce WAV bytes. Defaults to synthesize.
+        workers: Size of the synthesis thread pool.
+    """
+
+    def __init__(self, client, player=None, cache=None, synthesize_fn=None, workers=TTS_WORKERS):
+        self.client = client
+        self.player = player or play_wav
+        self.cache = cache
+        self.synthesize_fn = synthesize_fn or synthesize
+        self.workers = workers
+
+    def _synthesize(self, text, lang_code, voice_name):
+        key = audio_cache_key(text, lang_code, voice_name or "NEUTRAL")
+        if self.cache is not None:
+            audio = self.cache.get(key)
+            if audio is not None:
+                return audio
+        audio = self.synthesize_fn(self.client, text, lang_code, voice_name)
+        if self.cache is not None:
+            self.cache.put(key, audio)
+        return audio
+
+    def speak(self, text, lang_code, voice_name=None):
+        """
+        Synthesizes and plays text. Returns timings in seconds: first_audio_s
+        (until playback started) and total_s.
+        """
+        start = time.perf_counter()
+        chunks = split_sentences(text)
+        first_audio_s = None
+        if not chunks:
+            return {"chunks": 0, "first_audio_s": None, "total_s": 0.0}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [
+                executor.submit(self._synthesize, chunk, lang_code, voice_name) for chunk in chunks
+            ]
+            try:
+                for future in futures:
+                    audio = future.result()
+                    if first_audio_s is None:
+                        first_audio_s = time.perf_counter() - start
+                    self.player(audio)
+            finally:
+                for future in futures:
+                    future.cancel()
+        return {
+            "chunks": len(chunks),
+            "first_audio_s": first_audio_s,
+            "total_s": time.perf_counter() - start,
+        }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_audio_cache():
+    """Returns the process-wide AudioCache configured by USER_QUERY_TTS_CACHE_*."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = AudioCache(CACHE_DIR or None)
+        return _default_cache
+
+
+def benchmark(sentences=6, synth_base_s=0.15, synth_per_char_s=0.004, play_per_char_s=0.02, workers=TTS_WORKERS):
+    """
+    Compares one-shot and pipelined speech with a simulated TTS client and
+    player, so no network or audio device is needed. Simulated synthesis
+    takes a fixed round trip plus time proportional to the text length.
+    """
+    text = " ".join(f"This is sentence number {i + 1} of the spoken answer." for i in range(sentences))
+
+    def fake_synthesize(_client, chunk, _lang_code, _voice_name):
+        time.sleep(synth_base_s + synth_per_char_s * len(chunk))
+        # One silent frame per character stands in for the audio.
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(16000)
+            w.writeframes(b"\0\0" * len(chunk))
+        return buf.getvalue()
+
+    def fake_player(audio):
+        with wave.open(io.BytesIO(audio), "rb") as w:
+            time.sleep(w.getnframes() * play_per_char_s)
+
+    start = time.perf_counter()
+    one_shot = fake_synthesize(None, text, "en-US", None)
+    one_shot_first = time.perf_counter() - start
+    fake_player(one_shot)
+    one_shot_total = time.perf_counter() - start
+
+    pipeline = SpeechPipeline(None, player=fake_player, synthesize_fn=fake_synthesize, workers=workers)
+    result = pipeline.speak(text, "en-US")
+    print(f"{len(text)} characters in {result['chunks']} chunks, {workers} workers")
+    print(f"One-shot:  first audio {one_shot_first:.2f} s, done {one_shot_total:.2f} s")
+    print(f"Pipelined: first audio {result['first_audio_s']:.2f} s, done {result['total_s']:.2f} s")
+
+    cached = SpeechPipeline(
+        None, player=lambda audio: None, cache=AudioCache(None), synthesize_fn=fake_synthesize
+    )
+    cached.speak(text, "en-US")
+    repeat = cached.speak(text, "en-US")
+    print(f"Cached repeat: first audio {repeat['first_audio_s'] * 1000:.2f} ms, stats {cached.cache.stats()}")
+
+
+# Run the simulated benchmark with:
+#   python -m user_query.tts
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pipelined TTS with a simulated client.")
+    parser.add_argument("--sentences", type=int, default=6)
+    parser.add_argument("--workers", type=int, default=TTS_WORKERS)
+    args = parser.parse_args()
+    benchmark(args.sentences, workers=args.workers)
@@ -1,26 +1,70 @@
 import os
 import json
 import argparse
+import asyncio
 import datetime
-import sounddevice as sd
-import scipy.io.wavfile as wav
-from google.cloud import texttospeech
-import vertexai
-from vertexai.generative_models import GenerativeModel, GenerationConfig, Part
+import io
 import random
+import threading
 import uuid
-import simpleaudio as sa
-import numpy as np
+import wave
+
+from .lang_detect import detect_language_local
+from .retrieval import select_candidates
+
+# Vertex AI, Text-to-Speech, NumPy and the audio libraries are imported lazily so
+# importing this module stays cheap; see get_model(), get_tts_client() and
+# the voice functions. bench_import.py guards against regressions.
 
 # === CONFIG ===
 SERVICE_ACCOUNT_PATH = os.getenv("GCP_T5_SVC_ACC_KEY" ,"./tachyon5-svc-key.json")
 PROJECT_ID = os.getenv("GCP_PROJECT", "genuine-space-465418-e3")
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = SERVICE_ACCOUNT_PATH
+MODEL_NAME = "gemini-2.5-flash"
+QUERY_TIMEOUT_S = float(os.getenv("USER_QUERY_TIMEOUT_S", "60"))
+# 'vad' stops recording when the speaker goes quiet; 'fixed' records 7 seconds.
+RECORD_MODE = os.getenv("USER_QUERY_RECORD_MODE", "vad")
+TTS_PIPELINED = os.getenv("USER_QUERY_TTS_MODE", "pipelined") == "pipelined"
+# 'firestore' reads the user's records; 'sample' generates 10 fake ones.
+DATA_SOURCE = os.getenv("USER_QUERY_DATA_SOURCE", "firestore")
+
+_init_lock = threading.Lock()
+_model = None
+_tts_client = None
+_record_loader = None
+
+def get_model():
+    global _model
+    if _model is None:
+        with _init_lock:
+            if _model is None:
+                import vertexai
+                from vertexai.generative_models import GenerativeModel
+                from .llm_cache import CachedModel
+                vertexai.init(project=PROJECT_ID, location="us-central1")
+                config = {"response_mime_type": "application/json"}
+                # Detection, summary and translation calls pass cache=True to be
+                # answered from the LLM_CACHE_* response cache.
+                _model = CachedModel(GenerativeModel(MODEL_NAME, generation_config=config), MODEL_NAME, config)
+    return _model
 
-vertexai.init(project=PROJECT_ID, location="us-central1")
-model = GenerativeModel("gemini-2.5-flash", generation_config=GenerationConfig(response_mime_type="application/json"))
+def get_tts_client():
+    global _tts_client
+    if _tts_client is None:
+        with _init_lock:
+            if _tts_client is None:
+                from google.cloud import texttospeech
+                _tts_client = texttospeech.TextToSpeechClient()
+    return _tts_client
 
-tts_client = texttospeech.TextToSpeechClient()
+def __getattr__(name):
+    # Keeps `user_query.model` and `user_query.tts_client` working for callers
+    # that used the old module-level clients.
+    if name == "model":
+        return get_model()
+    if name == "tts_client":
+        return get_tts_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 lang_code_map = {
     "Hindi": "hi-IN", "Tamil": "ta-IN", "Telugu": "te-IN",
@@ -29,6 +73,25 @@ lang_code_map = {
 }
 
 def fetch_firestore_data(username: str):
+    """
+    Returns the user's purchase records from the last 90 days, newest first,
+    as [{documentId, metadata, item}]. With USER_QUERY_DATA_SOURCE=sample
+    the records are generated instead.
+    """
+    if DATA_SOURCE == "sample":
+        return sample_firestore_data(username)
+    return get_record_loader().load(username)
+
+def get_record_loader():
+    global _record_loader
+    if _record_loader is None:
+        with _init_lock:
+            if _record_loader is None:
+                from .firestore_loader import FirestoreRecordLoader
+                _record_loader = FirestoreRecordLoader(PROJECT_ID)
+    return _record_loader
+
+def sample_firestore_data(username: str):
     """
     Generate a sample dataset for the given username.
     Returns exactly 10 records dated randomly within the past 3 months.
@@ -59,16 +122,63 @@ def fetch_firestore_data(username: str):
     results.sort(key=lambda x: x["metadata"]["timestamp"], reverse=True)
     return results
 
-def record_audio(filename="input.wav", duration=7, fs=16000):
-    print("Recording for 7 sec... Please talk")
-    rec = sd.rec(int(duration * fs), samplerate=fs, channels=1, dtype="int16")
-    sd.wait()
-    wav.write(filename, fs, rec)
-    print("Recording complete.")
+def record_audio(filename=None, duration=7, fs=16000, mode=RECORD_MODE):
+    """
+    Records from the default microphone and returns the samples as an int16
+    NumPy array. Nothing touches the disk unless filename is given.
+
+    In 'vad' mode recording stops once the speaker has been silent for
+    USER_QUERY_VAD_SILENCE_MS, or after USER_QUERY_VAD_MAX_S; 'fixed' mode
+    always records duration seconds.
+    """
+    if mode == "vad":
+        from .vad import record_until_silence
+        print("Listening... Please talk")
+        rec, segmenter = record_until_silence(fs=fs)
+        print(f"Recording complete ({segmenter.end_reason}, {len(rec) / fs:.1f} s).")
+    else:
+        import sounddevice as sd
+        print(f"Recording for {duration} sec... Please talk")
+        rec = sd.rec(int(duration * fs), samplerate=fs, channels=1, dtype="int16")
+        sd.wait()
+        print("Recording complete.")
+    if filename:
+        with open(filename, "wb") as f:
+            f.write(encode_wav(rec, fs))
+    return rec
+
+def encode_wav(samples, fs=16000):
+    """Encodes int16 PCM samples (a NumPy array or bytes) as WAV bytes in memory."""
+    if not isinstance(samples, (bytes, bytearray, memoryview)):
+        import numpy as np
+        samples = np.ascontiguousarray(samples, dtype="<i2")
+    channels = samples.shape[1] if getattr(samples, "ndim", 1) == 2 else 1
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(fs)
+        # The sample buffer is written as-is, without an intermediate bytes copy.
+        w.writeframes(memoryview(samples).cast("B"))
+    return buf.getvalue()
 
-def detect_lang_and_translate(audio_path, username):
-    with open(audio_path, "rb") as f:
-        audio_data = f.read()
+def load_audio(audio, fs=16000):
+    """
+    Returns WAV bytes for a voice query given as a file path, WAV bytes, raw
+    int16 PCM bytes or a NumPy array of samples recorded at fs.
+    """
+    if isinstance(audio, (str, os.PathLike)):
+        with open(audio, "rb") as f:
+            return f.read()
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        data = bytes(audio)
+        return data if data[:4] == b"RIFF" else encode_wav(data, fs)
+    return encode_wav(audio, fs)
+
+def detect_lang_and_translate(audio, username, fs=16000):
+    """audio is anything load_audio accepts: a path, WAV/PCM bytes or samples."""
+    audio_data = load_audio(audio, fs)
+    from vertexai.generative_models import Part
     part = Part.from_data(data=audio_data, mime_type="audio/wav")
     prompt = f"""
 This prompt is for: {username}
@@ -76,7 +186,7 @@ Please detect the spoken language, transcribe the speech, and translate it into
 Respond ONLY in valid JSON:
 {{"language": "...", "transcription": "...", "translation": "..."}}
 """
-    resp = model.generate_content([prompt, part])
+    resp = get_model().generate_content([prompt, part])
     text = resp.text.strip()
     try:
         return json.loads(text)
@@ -85,7 +195,13 @@ Respond ONLY in valid JSON:
         return json.loads(clean)
 
 def gemini_search(query, cache, username):
-    prompt = f"""
+    resp = get_model().generate_content(_search_prompt(query, cache, username))
+    return resp.text.strip()
+
+def _search_prompt(query, cache, username):
+    # Only the records most relevant to the query go into the prompt.
+    cache = select_candidates(query, cache)
+    return f"""
 This prompt is for: {username}
 Search the following Firestore database content and return only the relevant information as JSON.
 
@@ -94,77 +210,274 @@ Database:
 
 User Query: "{query}"
 """
-    resp = model.generate_content(prompt)
-    return resp.text.strip()
 
-def summarize_response(json_data, username):
-    prompt = f"""
+def _detect_prompt(query, username):
+    return f"""
+This prompt is for: {username}
+Detect the language of the following query and respond ONLY with the language name:
+
+{query}
+"""
+
+def normalize_language(lang):
+    """Maps a language name as the model writes it (' english', '"Hindi".') onto a lang_code_map key."""
+    name = str(lang or "").strip().strip("\"'.").strip()
+    for known in lang_code_map:
+        if known.lower() == name.lower():
+            return known
+    return name
+
+def detect_language(query, username):
+    # The script usually settles it; only ambiguous queries cost a model call.
+    lang = detect_language_local(query)
+    if lang:
+        return lang
+    return normalize_language(get_model().generate_content(_detect_prompt(query, username), cache=True).text)
+
+async def _detect_language_async(query, username):
+    lang = detect_language_local(query)
+    if lang:
+        return lang
+    return normalize_language(await _generate_async(_detect_prompt(query, username), cache=True))
+
+def _summarize_prompt(json_data, username):
+    return f"""
 This prompt is for: {username}
 Summarize the following JSON in English in a short and friendly way:
 
 {json_data}
 """
-    resp = model.generate_content(prompt)
+
+def _translate_prompt(text, lang, username):
+    return f"""
+This prompt is for: {username}
+Translate the following into {lang}. Do not add any extra info. Just raw text.
+
+{text}
+"""
+
+def summarize_response(json_data, username):
+    resp = get_model().generate_content(_summarize_prompt(json_data, username), cache=True)
     return resp.text.strip()
 
 def translate_to_local(text, lang, username):
+    resp = get_model().generate_content(_translate_prompt(text, lang, username), cache=True)
+    return resp.text.strip()
+
+def _answer_prompt(query, cache, username, lang=None):
+    # Search, summary and translation in one prompt, for streaming. Without a
+    # locally detected language the model answers in the query's language.
+    cache = select_candidates(query, cache)
+    language = lang or "the language the user query is written in"
+    return f"""
+This prompt is for: {username}
+Answer the user query from their purchase records below in a short and friendly way.
+Write the answer in {language}. Just raw text, no extra info.
+
+Database:
+{json.dumps(cache)}
+
+User Query: "{query}"
+"""
+
+# Streamed stages return plain text so partial chunks can be shown as they arrive.
+STREAM_GENERATION_CONFIG = {"response_mime_type": "text/plain"}
+
+def _stream_text(prompt):
+    for chunk in get_model().generate_content(prompt, generation_config=STREAM_GENERATION_CONFIG, stream=True):
+        try:
+            text = chunk.text
+        except ValueError:
+            # Chunks that only carry finish reasons or safety ratings have no text.
+            continue
+        if text:
+            yield text
+
+FUSED_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "language": {"type": "STRING", "enum": list(lang_code_map)},
+        "relevant_document_ids": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "summary_en": {"type": "STRING"},
+        "answer": {"type": "STRING"},
+    },
+    "required": ["language", "relevant_document_ids", "summary_en", "answer"],
+}
+
+def fused_query(query, cache, username):
+    """
+    Detects the language, searches, summarizes and translates in one call.
+    Raises ValueError when the response does not match FUSED_RESPONSE_SCHEMA.
+    """
+    cache = select_candidates(query, cache)
     prompt = f"""
 This prompt is for: {username}
-Translate the following into {lang}. Do not add any extra info. Just raw text.
+You answer questions about the user's purchase records below. In one response:
+1. "language": the language the user query is written in.
+2. "relevant_document_ids": the documentId of every record relevant to the query.
+3. "summary_en": a short and friendly English summary answering the query from those records.
+4. "answer": that summary translated into the detected language. Just raw text, no extra info.
 
-{text}
+Database:
+{json.dumps(cache)}
+
+User Query: "{query}"
 """
-    resp = model.generate_content(prompt)
+    config = {
+        "response_mime_type": "application/json",
+        "response_schema": FUSED_RESPONSE_SCHEMA,
+    }
+    resp = get_model().generate_content(prompt, generation_config=config)
+    try:
+        result = json.loads(resp.text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Fused response is not valid JSON: {e}")
+    if not isinstance(result, dict) or not all(
+        isinstance(result.get(key), str) and result[key].strip()
+        for key in ("language", "summary_en", "answer")
+    ):
+        raise ValueError("Fused response is missing required fields.")
+    by_id = {record["documentId"]: record for record in cache}
+    result["relevant_records"] = [
+        by_id[doc_id] for doc_id in result.get("relevant_document_ids") or [] if doc_id in by_id
+    ]
+    return result
+
+def speak(text, lang_code, pipelined=TTS_PIPELINED):
+    """
+    Speaks text aloud. Pipelined speech synthesizes sentence by sentence and
+    starts playing the first while the rest are synthesized, reusing cached
+    audio for sentences it has spoken before.
+    """
+    from .tts import SpeechPipeline, get_audio_cache, play_wav, synthesize
+    if pipelined:
+        return SpeechPipeline(get_tts_client(), cache=get_audio_cache()).speak(text, lang_code)
+    play_wav(synthesize(get_tts_client(), text, lang_code))
+
+async def _generate_async(prompt, cache=False):
+    resp = await get_model().generate_content_async(prompt, cache=cache)
     return resp.text.strip()
 
-def speak(text, lang_code):
-    synth_input = texttospeech.SynthesisInput(text=text)
-    voice = texttospeech.VoiceSelectionParams(
-        language_code=lang_code,
-        ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL
-    )
-    audio_config = texttospeech.AudioConfig(audio_encoding=texttospeech.AudioEncoding.LINEAR16)
-    response = tts_client.synthesize_speech(
-        input=synth_input,
-        voice=voice,
-        audio_config=audio_config
-    )
-
-    audio_bytes = response.audio_content
-    # Convert bytes to numpy array for simpleaudio
-    audio_array = np.frombuffer(audio_bytes, dtype=np.int16)
-    wave_obj = sa.WaveObject(audio_array, num_channels=1, bytes_per_sample=2, sample_rate=16000)
-    play_obj = wave_obj.play()
-    play_obj.wait_done()
-
-def process_query(name, type, query=None ):
-    data = fetch_firestore_data(name)
-    if not data:
-        print(f"No recent records found for user '{name}'.")
-        return
+async def _text_pipeline(name, query, data):
+    async def fetch_and_search():
+        records = data if data is not None else await asyncio.to_thread(fetch_firestore_data, name)
+        if not records:
+            return None
+        return await _generate_async(_search_prompt(query, records, name))
 
-    if type == "voice":
-        record_audio()
-        res = detect_lang_and_translate("input.wav", name)
-        if not res:
-            print("Could not parse audio. Exiting.")
-            return
-        lang = res["language"]
-        query_en = res["translation"]
-    else:
+    # Language detection does not depend on the records, so it runs while they
+    # are fetched and searched.
+    lang_task = asyncio.create_task(_detect_language_async(query, name))
+    search_task = asyncio.create_task(fetch_and_search())
+    summary_task = None
+    try:
+        search_json = await search_task
+        if search_json is None:
+            print(f"No recent records found for user '{name}'.")
+            return None
+        print("\nSearch Response length:\n", len(search_json))
+
+        summary_task = asyncio.create_task(_generate_async(_summarize_prompt(search_json, name), cache=True))
+        lang = await lang_task
+        print(f"\n[Detected Language: {lang}]\nQuery: {query}")
+        summary = await summary_task
+        if lang == "English":
+            return summary
+        return await _generate_async(_translate_prompt(summary, lang, name), cache=True)
+    finally:
+        for task in (lang_task, search_task, summary_task):
+            if task is not None:
+                task.cancel()
+
+async def process_query_async(name, query, data=None, timeout=QUERY_TIMEOUT_S):
+    """
+    Text-mode pipeline on the async Gemini client. Language detection runs
+    concurrently with the data fetch and search, and translation starts as
+    soon as the summary is ready. Raises asyncio.TimeoutError after timeout
+    seconds; cancelling the task cancels every in-flight stage.
+    Pass data to reuse records that were already fetched. Await it on one
+    long-lived loop, as process_query does, since the cached model's async
+    client is bound to the loop it first ran on.
+    """
+    translated = await asyncio.wait_for(_text_pipeline(name, query, data), timeout)
+    if translated is not None:
+        print("\nFinal Response:\n", translated)
+    return translated
+
+_loop = None
+
+def _get_loop():
+    # One event loop for the life of the process, on a daemon thread. The async
+    # Vertex client binds its gRPC channel to the loop it first runs on, so a
+    # fresh asyncio.run per query would break the cached model after the first.
+    global _loop
+    with _init_lock:
+        if _loop is None or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="user-query-loop", daemon=True).start()
+            _loop = loop
+    return _loop
+
+def _run_sync(coro):
+    # Works from plain code and from inside another running loop (e.g. a notebook).
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+def process_query(
+    name, type, query=None, fused=True, audio=None, play=True, data=None, on_transcript=None
+):
+    """
+    Answers a text or voice query about the user's records. Pass data to
+    reuse records that were already fetched with fetch_firestore_data.
+
+    For type="voice", audio may be a pre-recorded WAV path, WAV/PCM bytes or
+    a NumPy array of 16 kHz samples; the microphone is used when it is None.
+    on_transcript, if given, is called with what the user said before the
+    answer is generated. Pass play=False to skip speaking the answer, e.g.
+    in batch runs.
+    """
+    if type != "voice":
         if not query:
             print("Error: Provide --query when using text mode.")
             return
-        query_en = query
-        detect_prompt = f"""
-This prompt is for: {name}
-Detect the language of the following query and respond ONLY with the language name:
+        if fused:
+            if data is None:
+                data = fetch_firestore_data(name)
+            if not data:
+                print(f"No recent records found for user '{name}'.")
+                return
+            # One structured call instead of four; fall back to the staged
+            # pipeline if the model's answer cannot be parsed.
+            try:
+                result = fused_query(query, data, name)
+                result["language"] = normalize_language(result["language"])
+                print(f"\n[Detected Language: {result['language']}]\nQuery: {query}")
+                print("\nFinal Response:\n", result["answer"])
+                return result["answer"]
+            except ValueError as e:
+                print(f"Fused query failed, falling back to staged pipeline: {e}")
+        return _run_sync(process_query_async(name, query, data=data))
 
-{query_en}
-"""
-        lang = model.generate_content(detect_prompt).text.strip()
+    if data is None:
+        data = fetch_firestore_data(name)
+    if not data:
+        print(f"No recent records found for user '{name}'.")
+        return
+
+    if audio is None:
+        audio = record_audio()
+        if len(audio) == 0:
+            print("No speech detected. Exiting.")
+            return
+    res = detect_lang_and_translate(audio, name)
+    if not res:
+        print("Could not parse audio. Exiting.")
+        return
+    lang = normalize_language(res["language"])
+    query_en = res["translation"]
 
     print(f"\n[Detected Language: {lang}]\nQuery: {query_en}")
+    if on_transcript:
+        on_transcript(res.get("transcription") or query_en)
 
     search_json = gemini_search(query_en, data, name)
     print("\nSearch Response length:\n", len(search_json))
@@ -173,7 +486,24 @@ Detect the language of the following query and respond ONLY with the language na
     translated = translate_to_local(summary, lang, name)
 
     print("\nFinal Response:\n", translated)
-    if type == "voice":
+    if play:
         speak(translated, lang_code_map.get(lang, "en-US"))
-    else:
-        return translated
+    return translated
+
+def process_query_stream(name, query, data=None):
+    """
+    Text-mode process_query that yields the final answer in chunks as the
+    model produces them. Search, summary and translation are one streamed
+    call, so the first chunk arrives after a single model round trip in
+    every language. The language comes from the local detector; when it is
+    unsure, the model is told to answer in the query's language.
+    """
+    if data is None:
+        data = fetch_firestore_data(name)
+    if not data:
+        yield f"No recent records found for user '{name}'."
+        return
+
+    lang = detect_language_local(query)
+    print(f"\n[Detected Language: {lang or 'left to the model'}]\nQuery: {query}")
+    yield from _stream_text(_answer_prompt(query, data, name, lang))
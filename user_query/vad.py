@@ -0,0 +1,231 @@
+import argparse
+import os
+import queue
+import time
+import wave
+
+import numpy as np
+
+# Voice-activity-detected capture: frames are classified as speech or silence
+# by short-time energy and zero-crossing rate, and recording stops after a
+# trailing silence or a maximum duration. replay_wav runs the same segmenter
+# over .wav files so it can be checked without a microphone.
+
+# === CONFIG ===
+SAMPLE_RATE = 16000
+FRAME_MS = int(os.getenv("USER_QUERY_VAD_FRAME_MS", "30"))
+# Stop once speech has been followed by this much silence.
+TRAILING_SILENCE_MS = int(os.getenv("USER_QUERY_VAD_SILENCE_MS", "800"))
+MAX_DURATION_S = float(os.getenv("USER_QUERY_VAD_MAX_S", "15"))
+# Give up when nobody starts talking within this long.
+NO_SPEECH_TIMEOUT_S = float(os.getenv("USER_QUERY_VAD_NO_SPEECH_S", "5"))
+# Speech shorter than this (a click, a cough) does not count as an utterance.
+MIN_SPEECH_MS = int(os.getenv("USER_QUERY_VAD_MIN_SPEECH_MS", "150"))
+# Audio kept from before speech starts, so the first syllable is not clipped.
+PRE_ROLL_MS = 300
+# A frame is speech when its RMS is this many times the noise floor...
+ENERGY_FACTOR = float(os.getenv("USER_QUERY_VAD_ENERGY_FACTOR", "3.0"))
+# ...and at least this loud in int16 units, whatever the noise floor.
+MIN_RMS = 200.0
+# Frames crossing zero more often than this are hiss rather than voiced
+# speech, unless they are much louder than the threshold.
+MAX_ZCR = 0.35
+# Frames used to estimate the initial noise floor, and the percentile of
+# their RMS taken as the floor.
+CALIBRATION_FRAMES = 10
+NOISE_PERCENTILE = 20
+# Upper bound on the noise floor, so that speech from the very first frame
+# cannot calibrate the threshold above itself.
+MAX_NOISE_RMS = MIN_RMS
+# record_until_silence gives up when the input stream delivers nothing for this long.
+STREAM_TIMEOUT_S = 2.0
+
+
+def frame_features(frame):
+    """Returns (rms, zero-crossing rate) of one frame of int16 samples."""
+    samples = frame.astype(np.float32).ravel()
+    if samples.size == 0:
+        return 0.0, 0.0
+    rms = float(np.sqrt(np.mean(samples * samples)))
+    signs = np.signbit(samples)
+    zcr = float(np.count_nonzero(signs[1:] != signs[:-1])) / max(samples.size - 1, 1)
+    return rms, zcr
+
+
+class VoiceActivitySegmenter:
+    """
+    Consumes fixed-size frames and decides when an utterance is complete.
+
+    feed() returns True once recording should stop; end_reason then says
+    why ('silence', 'max_duration' or 'no_speech'; replay_wav adds
+    'end_of_file' and record_until_silence 'stream_timeout') and audio()
+    returns the utterance with its pre-roll and trailing silence.
+    """
+
+    def __init__(
+        self,
+        fs: int = SAMPLE_RATE,
+        frame_ms: int = FRAME_MS,
+        trailing_silence_ms: int = TRAILING_SILENCE_MS,
+        max_duration_s: float = MAX_DURATION_S,
+        no_speech_timeout_s: float = NO_SPEECH_TIMEOUT_S,
+        min_speech_ms: int = MIN_SPEECH_MS,
+    ):
+        self.fs = fs
+        self.frame_len = int(fs * frame_ms / 1000)
+        self.silence_frames = max(1, trailing_silence_ms // frame_ms)
+        self.max_frames = max(1, int(max_duration_s * 1000 // frame_ms))
+        self.no_speech_frames = max(1, int(no_speech_timeout_s * 1000 // frame_ms))
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.pre_roll_frames = max(1, PRE_ROLL_MS // frame_ms)
+        self.noise_rms = None
+        self.calibration_rms = []
+        self.frames = []
+        self.speech_start = None
+        self.speech_frames = 0
+        self.silent_run = 0
+        self.end_reason = None
+
+    @property
+    def threshold(self) -> float:
+        return max(MIN_RMS, ENERGY_FACTOR * (self.noise_rms or 0.0))
+
+    def is_speech(self, frame) -> bool:
+        rms, zcr = frame_features(frame)
+        calibrating = len(self.calibration_rms) < CALIBRATION_FRAMES
+        if calibrating:
+            # A low percentile of the first frames is the background noise,
+            # capped so that talking from the start still counts as speech.
+            self.calibration_rms.append(rms)
+            self.noise_rms = min(float(np.percentile(self.calibration_rms, NOISE_PERCENTILE)), MAX_NOISE_RMS)
+        speech = rms >= self.threshold and (zcr <= MAX_ZCR or rms >= 2 * self.threshold)
+        if not speech and not calibrating and self.speech_start is None:
+            # Let the noise floor follow slow changes in the background.
+            self.noise_rms = min(0.95 * self.noise_rms + 0.05 * rms, MAX_NOISE_RMS)
+        return speech
+
+    def feed(self, frame) -> bool:
+        if self.end_reason is not None:
+            return True
+        speech = self.is_speech(frame)
+        self.frames.append(np.array(frame, dtype=np.int16).ravel())
+        index = len(self.frames) - 1
+
+        if speech:
+            self.speech_frames += 1
+            self.silent_run = 0
+            if self.speech_start is None:
+                self.speech_start = index
+        elif self.speech_start is not None:
+            self.silent_run += 1
+            if self.speech_frames < self.min_speech_frames and self.silent_run >= self.pre_roll_frames:
+                # Too short to be a query: forget it and keep listening.
+                self.speech_start, self.speech_frames = None, 0
+
+        if self.speech_start is not None and self.silent_run >= self.silence_frames:
+            self.end_reason = "silence"
+        elif len(self.frames) >= self.max_frames:
+            self.end_reason = "max_duration"
+        elif self.speech_start is None and len(self.frames) >= self.no_speech_frames:
+            self.end_reason = "no_speech"
+        return self.end_reason is not None
+
+    @property
+    def has_speech(self) -> bool:
+        return self.speech_start is not None
+
+    def audio(self):
+        """Returns the captured utterance as int16 samples (empty without speech)."""
+        if self.speech_start is None:
+            return np.zeros(0, dtype=np.int16)
+        start = max(0, self.speech_start - self.pre_roll_frames)
+        return np.concatenate(self.frames[start:])
+
+    def duration_s(self) -> float:
+        return len(self.frames) * self.frame_len / self.fs
+
+
+def record_until_silence(fs: int = SAMPLE_RATE, device=None, **kwargs):
+    """
+    Records from the microphone with sounddevice.InputStream until the
+    speaker stops talking. Keyword arguments configure the
+    VoiceActivitySegmenter. Returns (samples, segmenter).
+    """
+    import sounddevice as sd
+
+    segmenter = VoiceActivitySegmenter(fs=fs, **kwargs)
+    frames = queue.Queue()
+
+    def callback(indata, _frames, _time, status):
+        if status:
+            print(f"Audio input: {status}")
+        frames.put(indata.copy())
+
+    with sd.InputStream(
+        samplerate=fs, channels=1, dtype="int16", blocksize=segmenter.frame_len,
+        device=device, callback=callback,
+    ):
+        while True:
+            try:
+                frame = frames.get(timeout=STREAM_TIMEOUT_S)
+            except queue.Empty:
+                # The device stopped delivering audio; keep what was captured.
+                segmenter.end_reason = "stream_timeout"
+                break
+            if segmenter.feed(frame):
+                break
+    return segmenter.audio(), segmenter
+
+
+def read_wav(path):
+    """Returns (int16 mono samples, sample rate) of a 16-bit PCM .wav file."""
+    with wave.open(path, "rb") as w:
+        if w.getsampwidth() != 2:
+            raise ValueError(f"{path}: expected 16-bit PCM, got {8 * w.getsampwidth()}-bit")
+        samples = np.frombuffer(w.readframes(w.getnframes()), dtype="<i2")
+        channels = w.getnchannels()
+        fs = w.getframerate()
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return samples, fs
+
+
+def replay_wav(path, **kwargs):
+    """
+    Feeds a .wav file through the VoiceActivitySegmenter frame by frame, as
+    record_until_silence would from the microphone. Returns
+    (samples, segmenter).
+    """
+    samples, fs = read_wav(path)
+    segmenter = VoiceActivitySegmenter(fs=fs, **kwargs)
+    step = segmenter.frame_len
+    for start in range(0, len(samples) - step + 1, step):
+        if segmenter.feed(samples[start : start + step]):
+            break
+    else:
+        segmenter.end_reason = segmenter.end_reason or "end_of_file"
+    return segmenter.audio(), segmenter
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay .wav files through the recording VAD.")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--silence-ms", type=int, default=TRAILING_SILENCE_MS)
+    parser.add_argument("--max-s", type=float, default=MAX_DURATION_S)
+    args = parser.parse_args()
+    for path in args.paths:
+        start = time.perf_counter()
+        audio, segmenter = replay_wav(
+            path, trailing_silence_ms=args.silence_ms, max_duration_s=args.max_s
+        )
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(
+            f"{path}: stopped by {segmenter.end_reason} after {segmenter.duration_s():.2f} s, "
+            f"kept {len(audio) / segmenter.fs:.2f} s of audio ({elapsed_ms:.1f} ms to process)"
+        )
+
+
+# Replay recordings through the VAD with:
+#   python -m user_query.vad samples/*.wav
+if __name__ == "__main__":
+    main()